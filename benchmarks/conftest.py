@@ -0,0 +1,54 @@
+# -*- encoding: utf-8
+"""
+Shared fixtures for the benchmarks.
+
+Benchmarks that take a ``corpus_size`` argument are run once for each size
+in ``--corpus-sizes``.  The default is 1k and 10k bookmarks; add 100k with
+
+    py.test benchmarks --corpus-sizes=1000,10000,100000
+
+Generating the 100k corpus takes a few seconds, and each corpus is only
+generated once per session.
+
+To catch regressions, save a baseline with ``make benchmark-baseline``,
+and compare later runs against it with ``make benchmark-compare``.
+"""
+
+import copy
+
+import pytest
+
+import corpus
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--corpus-sizes',
+        default='1000,10000',
+        help='Comma-separated numbers of bookmarks to benchmark against.'
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'corpus_size' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('--corpus-sizes').split(',')
+        metafunc.parametrize(
+            'corpus_size', [int(s) for s in sizes], scope='session'
+        )
+
+
+_CORPORA = {}
+
+
+def _s3_corpus(size):
+    if size not in _CORPORA:
+        _CORPORA[size] = corpus.s3_bookmarks(count=size, seed=size)
+    return _CORPORA[size]
+
+
+@pytest.fixture
+def s3_bookmarks(corpus_size):
+    """Bookmarks as they're stored in S3.  Each test gets its own copy,
+    so it's free to modify them.
+    """
+    return copy.deepcopy(_s3_corpus(corpus_size))
@@ -0,0 +1,176 @@
+# -*- encoding: utf-8
+"""Generate a synthetic corpus of bookmarks that look like the ones we get
+from the Pinboard API.
+
+Everything is driven by a seeded ``random.Random``, so the same seed always
+produces the same corpus.
+
+"""
+
+import datetime as dt
+import hashlib
+import random
+
+from pincushion.bookmarks import create_id
+
+
+WORDS = (
+    'the of and to in is that it for on with as was at by an be this from '
+    'or have are not but which one all were when we there can been has more '
+    'if will so what about their out up into them some would other time '
+    'python rust swift elasticsearch pinboard archive bookmark search tag '
+    'cloud markdown unicode library design fiction essay history science '
+    'politics privacy security performance database server network cache'
+).split()
+
+HOSTS = [
+    'example.org', 'www.example.net', 'blog.example.com', 'news.example.co.uk',
+    'docs.example.io', 'github.com', 'medium.com', 'en.wikipedia.org',
+]
+
+TAGS = [
+    'python', 'rust', 'swift', 'elasticsearch', 'aws', 'fic', 'gen',
+    'politics', 'brexit', 'security', 'privacy', 'design', 'type:article',
+    'type:video', 'wc:<1k', 'wc:1k-5k', 'wc:5k-10k', 'wc:10k-25k',
+] + [f'topic-{i}' for i in range(100)]
+
+# The fields in a bookmark from the Pinboard API.
+PINBOARD_FIELDS = {
+    'href', 'description', 'extended', 'meta', 'hash', 'time', 'shared',
+    'toread', 'tags',
+}
+
+
+def _sentence(rng, min_words=4, max_words=20):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + rng.choice(['.', '.', '.', '?', '!'])
+
+
+def _paragraph(rng, sentences):
+    return ' '.join(_sentence(rng) for _ in range(sentences))
+
+
+def _url(rng):
+    path = '/'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    return f'https://{rng.choice(HOSTS)}/{path}'
+
+
+def description(rng):
+    """Returns a description (the ``extended`` field) for a bookmark.
+
+    About half of my bookmarks have no description; the rest are a mix of
+    short notes, quotes with comments, and long pasted extracts.
+    """
+    kind = rng.random()
+    if kind < 0.5:
+        return ''
+    elif kind < 0.75:
+        return _sentence(rng)
+    elif kind < 0.9:
+        parts = [
+            f'<blockquote>{_paragraph(rng, rng.randint(1, 4))}</blockquote>',
+            _sentence(rng) + f' See {_url(rng)}',
+        ]
+        return '\n\n'.join(parts)
+    else:
+        return large_description(rng, paragraphs=rng.randint(5, 20))
+
+
+def large_description(rng, paragraphs):
+    """Returns a long description, like a pasted article with quotes."""
+    parts = []
+    for i in range(paragraphs):
+        para = _paragraph(rng, rng.randint(3, 8))
+        if i % 3 == 0:
+            parts.append(f'<blockquote>{para}</blockquote>')
+        elif i % 3 == 1:
+            parts.append(f'{para} Via {_url(rng)} and {_url(rng)}')
+        else:
+            parts.append(para)
+    return '\n\n'.join(parts)
+
+
+def pinboard_bookmark(rng, start=dt.datetime(2010, 1, 1)):
+    """Returns a single bookmark, in the format of the Pinboard API."""
+    href = _url(rng) + f'?id={rng.randint(0, 10 ** 9)}'
+    saved = start + dt.timedelta(seconds=rng.randint(0, 8 * 365 * 24 * 3600))
+    return {
+        'href': href,
+        'description': _sentence(rng, max_words=12).rstrip('.?!'),
+        'extended': description(rng),
+        'meta': hashlib.md5(href.encode('utf8') + b'meta').hexdigest(),
+        'hash': hashlib.md5(href.encode('utf8')).hexdigest(),
+        'time': saved.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'shared': rng.choice(['yes', 'no']),
+        'toread': rng.choice(['yes', 'no', 'no', 'no']),
+        'tags': ' '.join(rng.sample(TAGS, rng.randint(0, 8))),
+    }
+
+
+def pinboard_bookmarks(count, seed=0):
+    """Returns a list of ``count`` bookmarks from the Pinboard API."""
+    rng = random.Random(seed)
+    return [pinboard_bookmark(rng) for _ in range(count)]
+
+
+def s3_bookmark(rng, bookmark):
+    """Returns a copy of an API bookmark as it's stored in S3, after the
+    sync scripts have added their own fields.
+    """
+    b = dict(bookmark)
+    b['slug'] = hashlib.md5(b['href'].encode('utf8')).hexdigest()[:12]
+    b['starred'] = rng.random() < 0.05
+
+    # Most bookmarks have been archived, and checked by the link checker.
+    if rng.random() < 0.8:
+        b['_backup'] = True
+        b['_validators'] = {
+            'etag': f'"{rng.getrandbits(64):x}"',
+            'last_modified': 'Tue, 26 Dec 2017 10:15:21 GMT',
+            'content_hash': hashlib.sha256(b['href'].encode('utf8')).hexdigest(),
+        }
+    if rng.random() < 0.9:
+        ok = rng.random() < 0.9
+        b['_link'] = {
+            'ok': ok,
+            'status': 200 if ok else rng.choice([404, 410, 500]),
+            'final_url': b['href'],
+            'checked_at': '2018-01-01T00:00:00Z',
+        }
+    return b
+
+
+def s3_bookmarks(count, seed=0):
+    """Returns ``count`` bookmarks in the form they're kept in S3:
+    ``{<id>: <bookmark>, ...}``.
+    """
+    rng = random.Random(seed)
+    return {
+        create_id(b['href']): s3_bookmark(rng, b)
+        for b in pinboard_bookmarks(count, seed=seed)
+    }
+
+
+def api_update(cached, seed=0, edited=0.01, added=0.01, deleted=0.005):
+    """Returns a new response from the Pinboard API, based on the bookmarks
+    in ``cached`` -- as if I'd been using Pinboard since the last sync.
+
+    The fractions of bookmarks that have been edited, added and deleted
+    are given by ``edited``, ``added`` and ``deleted``.
+    """
+    rng = random.Random(seed)
+    response = []
+    for b in cached.values():
+        roll = rng.random()
+        if roll < deleted:
+            continue
+        api_b = {k: v for k, v in b.items() if k in PINBOARD_FIELDS}
+        if roll < deleted + edited:
+            api_b['tags'] = ' '.join(rng.sample(TAGS, rng.randint(0, 8)))
+            api_b['description'] = _sentence(rng, max_words=12).rstrip('.?!')
+        response.append(api_b)
+
+    response.extend(
+        pinboard_bookmark(rng) for _ in range(int(len(cached) * added))
+    )
+    return response
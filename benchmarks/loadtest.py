@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+Load test the viewer against a fake Elasticsearch.
+
+The fake Elasticsearch replays recorded responses to ``_search`` requests,
+after a configurable delay.  By default the responses are generated from
+a synthetic corpus; pass --responses to use a JSON list of real responses
+(e.g. saved with curl).
+
+Unless --url is given, the viewer runs in this process, pointed at the
+fake Elasticsearch.  Each client logs in, then sends a mix of requests:
+the front page, tag filters, free-text searches, and deep pages that are
+reached by following a cursor link.
+
+Usage:  loadtest.py [options]
+        loadtest.py -h | --help
+
+Options:
+  --url=<URL>             Load test a viewer that's already running, instead
+                          of starting one.  It has to be using the fake
+                          Elasticsearch, e.g. with --es-port.
+  --password=<PASSWORD>   Password for the viewer [default: loadtest].
+  --concurrency=<N>       Number of clients sending requests [default: 8].
+  --duration=<SECONDS>    How long to run for [default: 30].
+  --es-latency=<MS>       Delay before the fake Elasticsearch responds to a
+                          search, in milliseconds [default: 20].
+  --es-port=<PORT>        Port for the fake Elasticsearch [default: 0].
+                          0 means any free port.
+  --responses=<FILE>      JSON list of recorded _search responses to replay.
+  --corpus-size=<N>       Size of the synthetic corpus [default: 10000].
+  --seed=<SEED>           Seed for the corpus and the request mix
+                          [default: 49].
+  --json=<FILE>           Also write the results to this file as JSON.
+"""
+
+import collections
+import hashlib
+import html
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import socketserver
+import threading
+import time
+from urllib.parse import urlencode
+
+import docopt
+import requests
+from werkzeug.serving import make_server
+
+from pincushion.bookmarks import transform_pinboard_bookmark
+from pincushion.flask.app import create_app
+
+import corpus
+
+
+# Relative weights of each kind of request in the mix.
+REQUEST_MIX = {
+    'front_page': 40,
+    'tag_filter': 25,
+    'free_text': 20,
+    'deep_page': 15,
+}
+
+PAGE_SIZE = 96
+
+
+def synthetic_responses(corpus_size, seed, count=200):
+    """Returns ``count`` responses to ``_search`` requests, built from a
+    synthetic corpus of ``corpus_size`` bookmarks.
+    """
+    rng = random.Random(seed)
+    bookmarks = list(corpus.s3_bookmarks(count=corpus_size, seed=seed).items())
+
+    responses = []
+    for _ in range(count):
+        total = rng.randint(PAGE_SIZE, corpus_size)
+        hits = []
+        for b_id, b in rng.sample(bookmarks, min(PAGE_SIZE, len(bookmarks))):
+            source = transform_pinboard_bookmark(b)
+            hits.append({
+                '_id': b_id,
+                '_source': source,
+                'sort': [source['time'], b_id],
+            })
+        tags = collections.Counter(
+            tag for _, b in rng.sample(bookmarks, min(1000, len(bookmarks)))
+            for tag in b['tags'].split()
+        )
+        responses.append({
+            'hits': {'total': total, 'hits': hits},
+            'aggregations': {
+                'tags': {
+                    'buckets': [
+                        {'key': tag, 'doc_count': count}
+                        for tag, count in tags.most_common(120)
+                    ]
+                }
+            },
+        })
+    return responses
+
+
+class FakeElasticsearch(socketserver.ThreadingMixIn, HTTPServer):
+    """An HTTP server that answers the requests the viewer makes to
+    Elasticsearch.
+
+    Each ``_search`` gets one of ``responses``, picked by a hash of the
+    request body -- so the same search always gets the same results.
+    """
+    daemon_threads = True
+
+    def __init__(self, responses, latency, port=0):
+        super().__init__(('127.0.0.1', port), _FakeElasticsearchHandler)
+        self.responses = [json.dumps(r).encode('utf8') for r in responses]
+        self.latency = latency
+        self.searches = 0
+        self._lock = threading.Lock()
+
+    def count_search(self):
+        with self._lock:
+            self.searches += 1
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class _FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/pincushion_meta/'):
+            self._send(200, b'{"_source": {"generation": 1}}')
+        elif self.path == '/':
+            self._send(200, b'{}')
+        else:
+            self._send(404, b'{"found": false}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if '/_search' not in self.path:
+            self._send(404, b'{}')
+            return
+
+        server = self.server
+        server.count_search()
+        time.sleep(server.latency)
+        digest = hashlib.sha256(body).digest()
+        i = int.from_bytes(digest[:4], 'big') % len(server.responses)
+        self._send(200, server.responses[i])
+
+    def log_message(self, *args):
+        pass
+
+
+def start_viewer(es_url, password):
+    """Run the viewer in a background thread, and return its URL."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    app = create_app(config={
+        'ES_HOST': es_url,
+        'SECRET_KEY': secrets.token_hex(),
+        'USER_PASSWORD': password,
+        'WTF_CSRF_ENABLED': False,
+    }, root_path=root)
+
+    # Logging every request would slow the server down.
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def login(url, password):
+    """Returns a ``requests.Session`` that's logged in to the viewer."""
+    sess = requests.Session()
+    resp = sess.get(f'{url}/login')
+    resp.raise_for_status()
+
+    data = {'password': password}
+    match = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', resp.text)
+    if match is not None:
+        data['csrf_token'] = match.group(1)
+
+    resp = sess.post(f'{url}/login', data=data, allow_redirects=False)
+    if resp.status_code != 302:
+        raise RuntimeError(f'Unable to log in: HTTP {resp.status_code}')
+    return sess
+
+
+def choose_request(rng):
+    """Returns (kind, path) for the next request in the mix."""
+    kind = rng.choices(
+        list(REQUEST_MIX), weights=list(REQUEST_MIX.values())
+    )[0]
+    if kind == 'front_page':
+        path = '/'
+    elif kind == 'tag_filter':
+        tags = rng.sample(corpus.TAGS, rng.choice([1, 1, 1, 2, 3]))
+        path = '/?' + urlencode({
+            'query': ' '.join(f'tags:{t}' for t in tags)
+        })
+    elif kind == 'free_text':
+        words = rng.sample(corpus.WORDS, rng.randint(1, 3))
+        path = '/?' + urlencode({'query': ' '.join(words)})
+    else:
+        path = f'/?page={rng.randint(11, 50)}'
+    return kind, path
+
+
+def _next_link(page_html):
+    match = re.search(r'href="([^"]*cursor=[^"]*)"', page_html)
+    if match is not None:
+        return html.unescape(match.group(1))
+
+
+def run_client(url, password, seed, deadline, results):
+    rng = random.Random(seed)
+    sess = login(url, password)
+
+    while time.monotonic() < deadline:
+        kind, path = choose_request(rng)
+
+        start = time.monotonic()
+        resp = sess.get(url + path)
+        results.append((kind, time.monotonic() - start, resp.status_code))
+
+        # Deep pages are reached by following the cursor in the "next"
+        # link, as a browser would.
+        if kind == 'deep_page' and resp.status_code == 200:
+            next_path = _next_link(resp.text)
+            if next_path is not None:
+                start = time.monotonic()
+                resp = sess.get(url + next_path)
+                results.append(
+                    ('deep_page', time.monotonic() - start, resp.status_code)
+                )
+
+
+def percentile(sorted_values, p):
+    """Returns the ``p``-th percentile of a sorted list, by nearest rank."""
+    rank = max(int(round(p / 100 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def summarise(results, elapsed):
+    """Returns throughput and latency percentiles for all the requests,
+    and for each kind of request.
+    """
+    def _stats(timings, errors):
+        timings = sorted(timings)
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'throughput': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50) * 1000, 1),
+            'p95_ms': round(percentile(timings, 95) * 1000, 1),
+            'p99_ms': round(percentile(timings, 99) * 1000, 1),
+        }
+
+    by_kind = collections.defaultdict(list)
+    errors = collections.Counter()
+    for kind, duration, status in results:
+        by_kind[kind].append(duration)
+        if status >= 400:
+            errors[kind] += 1
+
+    stats = {
+        'all': _stats([d for _, d, _ in results], sum(errors.values())),
+    }
+    for kind in REQUEST_MIX:
+        if by_kind[kind]:
+            stats[kind] = _stats(by_kind[kind], errors[kind])
+    return stats
+
+
+def print_summary(stats):
+    print(
+        f'{"":12} {"requests":>9} {"errors":>7} {"req/s":>8} '
+        f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+    )
+    for name, s in stats.items():
+        print(
+            f'{name:12} {s["requests"]:9d} {s["errors"]:7d} '
+            f'{s["throughput"]:8.1f} {s["p50_ms"]:8.1f} '
+            f'{s["p95_ms"]:8.1f} {s["p99_ms"]:8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    args = docopt.docopt(__doc__)
+    seed = int(args['--seed'])
+    password = args['--password']
+    concurrency = int(args['--concurrency'])
+
+    if args['--responses']:
+        with open(args['--responses']) as infile:
+            responses = json.load(infile)
+    else:
+        responses = synthetic_responses(
+            corpus_size=int(args['--corpus-size']), seed=seed
+        )
+
+    es = FakeElasticsearch(
+        responses=responses,
+        latency=int(args['--es-latency']) / 1000,
+        port=int(args['--es-port'])
+    )
+    threading.Thread(target=es.serve_forever, daemon=True).start()
+    print(f'Fake Elasticsearch is running at {es.url}')
+
+    url = args['--url'] or start_viewer(es_url=es.url, password=password)
+    print(f'Load testing {url} with {concurrency} clients...')
+
+    results = []
+    start = time.monotonic()
+    deadline = start + float(args['--duration'])
+    clients = [
+        threading.Thread(
+            target=run_client,
+            args=(url, password, seed + i, deadline, results)
+        )
+        for i in range(concurrency)
+    ]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.monotonic() - start
+
+    stats = summarise(results, elapsed)
+    print(f'Ran for {elapsed:.1f}s')
+    print_summary(stats)
+    print(f'Elasticsearch searches: {es.searches}')
+
+    if args['--json']:
+        with open(args['--json'], 'w') as outfile:
+            json.dump({
+                'elapsed': elapsed,
+                'concurrency': concurrency,
+                'es_latency_ms': int(args['--es-latency']),
+                'es_searches': es.searches,
+                'requests': stats,
+            }, outfile, indent=2)
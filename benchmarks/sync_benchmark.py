@@ -0,0 +1,609 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+Benchmark a whole sync -- run_metadata_fetcher.py, run_indexer.py and
+run_asset_fetcher.py, in that order -- against local stand-ins for
+Pinboard, S3 and Elasticsearch.
+
+For each corpus size, S3 is seeded with the bookmarks.json left by a
+previous sync, in which everything has been archived.  The fake Pinboard
+then serves that corpus with a few bookmarks edited, added and deleted:
+through the API (/v1/posts/all), through the paginated HTML pages of my
+account, and as the bookmarked pages themselves, so the asset fetcher has
+the new bookmarks to archive.
+
+Each script runs as a separate process, exactly as it would in the
+scheduled sync.  We report how long each script took and its peak memory,
+and the per-stage timings from each script's own run report.
+
+The S3 stand-in only supports the calls the scripts make (creating
+buckets, and putting and getting whole objects or byte ranges) -- not
+multipart uploads, so the asset fetcher has to use --format=warc with
+captures smaller than boto3's multipart threshold.
+
+Usage:  sync_benchmark.py [options]
+        sync_benchmark.py -h | --help
+
+Options:
+  --sizes=<SIZES>         Comma-separated numbers of bookmarks to sync
+                          [default: 1000,10000].
+  --new=<FRACTION>        Fraction of bookmarks that have been added, and
+                          so need archiving, since the last sync
+                          [default: 0.01].
+  --page-size=<N>         Bookmarks per page of the Pinboard HTML
+                          [default: 50].
+  --workers=<N>           Workers for the asset fetcher [default: 4].
+  --seed=<SEED>           Seed for the corpus [default: 50].
+  --json=<FILE>           Also write the results to this file as JSON.
+  --keep                  Keep the working directory for each size, with
+                          the logs and run reports from every script.
+"""
+
+import glob
+import hashlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import random
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import docopt
+
+from pincushion.bookmarks import create_id
+from pincushion.constants import INDEX_NAME, S3_BOOKMARKS_KEY, S3_BUCKET
+
+import corpus
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+
+# A 1x1 transparent GIF, used as the image on every bookmarked page.
+PIXEL = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00\x00!\xf9\x04'
+    b'\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D'
+    b'\x01\x00;'
+)
+
+STYLESHEET = b'body { font-family: sans-serif; }\n' * 50
+
+
+def _localise(bookmark, web_url, n):
+    # Point a bookmark at a page on the fake Pinboard, so the asset
+    # fetcher can archive it without going out to the network.
+    bookmark['href'] = f'{web_url}/pages/{n}'
+    bookmark['hash'] = hashlib.md5(bookmark['href'].encode('utf8')).hexdigest()
+
+
+def sync_corpus(count, seed, web_url, new):
+    """Returns (cached, api_response) for a sync of ``count`` bookmarks.
+
+    ``cached`` is the bookmarks.json left by the last sync, in which
+    everything has been archived.  ``api_response`` is what the Pinboard
+    API returns now, with a fraction ``new`` of bookmarks added since.
+    """
+    rng = random.Random(seed)
+
+    api_bookmarks = corpus.pinboard_bookmarks(count, seed=seed)
+    for n, b in enumerate(api_bookmarks):
+        _localise(b, web_url, n)
+
+    cached = {}
+    for b in api_bookmarks:
+        s3_b = corpus.s3_bookmark(rng, b)
+        s3_b['_backup'] = True
+        cached[create_id(b['href'])] = s3_b
+
+    api_response = corpus.api_update(cached, seed=seed, added=new)
+    for n, b in enumerate(api_response[len(api_response) - int(count * new):]):
+        _localise(b, web_url, count + n)
+
+    return cached, api_response
+
+
+def page_metadata(api_response, seed):
+    """Returns (metadata, starred) for the bookmarks in ``api_response``,
+    as they appear in the HTML pages of a Pinboard account.
+    """
+    rng = random.Random(seed)
+    metadata = []
+    for n, b in enumerate(api_response, start=1):
+        metadata.append({
+            'id': str(n),
+            'url': b['href'],
+            'url_id': str(n),
+            'slug': hashlib.md5(b['href'].encode('utf8')).hexdigest()[:12],
+            'title': b['description'],
+            'description': b['extended'],
+            'tags': b['tags'],
+            'created': b['time'].replace('T', ' ').rstrip('Z'),
+            'toread': '1' if b['toread'] == 'yes' else '0',
+            'private': '0' if b['shared'] == 'yes' else '1',
+        })
+    starred = {m['id'] for m in metadata if rng.random() < 0.05}
+    return metadata, starred
+
+
+def pinboard_page(metadata, starred, offset, page_size):
+    """Returns a page of my Pinboard account, in the form that
+    ``parse_pinboard_page`` reads.
+    """
+    page = metadata[offset:offset + page_size]
+    stars = [m['id'] for m in page if m['id'] in starred]
+
+    bmarks = ''.join(
+        f'bmarks[{m["id"]}] = {json.dumps(m, separators=(",", ":"))};'
+        for m in page
+    )
+
+    # Newer bookmarks come first, so "earlier" is the next page.
+    links = []
+    if offset + page_size < len(metadata):
+        links.append(
+            f'<a class="next_prev" '
+            f'href="/u:{USERNAME}/before:{offset + page_size}">earlier</a>'
+        )
+    links.append(
+        f'<a class="next_prev" '
+        f'href="/u:{USERNAME}/before:{max(offset - page_size, 0)}">later</a>'
+    )
+
+    return (
+        '<html><head><script>\n'
+        f'var starred = {json.dumps(stars, separators=(",", ":"))};\n'
+        f'var bmarks={{}};\n{bmarks}</script></head>\n'
+        f'<body><div id="bottom_next_prev">{"".join(links)}</div></body>'
+        '</html>'
+    ).encode('utf8')
+
+
+def bookmarked_page(n):
+    """Returns the HTML of a page that's been bookmarked."""
+    rng = random.Random(n)
+    paragraphs = ''.join(
+        f'<p>{corpus._paragraph(rng, rng.randint(3, 8))}</p>\n'
+        for _ in range(rng.randint(5, 20))
+    )
+    return (
+        f'<html><head><title>Page {n}</title>'
+        '<link rel="stylesheet" href="/static/style.css"></head>\n'
+        f'<body><h1>Page {n}</h1><img src="/static/pixel.gif">\n'
+        f'{paragraphs}</body></html>'
+    ).encode('utf8')
+
+
+class _FakeServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, port=0):
+        super().__init__(('127.0.0.1', port), handler)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # The headers and body are sent separately, so without this, every
+    # response waits for a delayed ACK -- which swamps the real timings.
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body=b'', content_type='application/json',
+              headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePinboard(_FakeServer):
+    """An HTTP server that answers the requests the sync scripts make to
+    Pinboard, and also serves the pages that have been bookmarked.
+    """
+    def __init__(self, page_size, port=0):
+        super().__init__(_FakePinboardHandler, port=port)
+        self.page_size = page_size
+        self.set_corpus([], [], set())
+
+    def set_corpus(self, api_response, metadata, starred):
+        self.api_response = json.dumps(api_response).encode('utf8')
+        self.metadata = metadata
+        self.starred = starred
+
+
+class _FakePinboardHandler(_FakeHandler):
+
+    def do_POST(self):
+        self._read_body()
+        if self.path == '/auth/':
+            # Pinboard sets a cookie, and redirects to the front page.
+            self._send(302, headers={
+                'Location': '/',
+                'Set-Cookie': 'login=benchmark; Path=/',
+            })
+        else:
+            self._send(404)
+
+    def do_GET(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        profile = f'/u:{USERNAME}'
+
+        if path == '/':
+            self._send(200, b'<html></html>', content_type='text/html')
+        elif path == '/v1/posts/all':
+            self._send(200, server.api_response)
+        elif path == profile or path.startswith(profile + '/before:'):
+            offset = int(path.split('before:')[1]) if 'before:' in path else 0
+            body = pinboard_page(
+                server.metadata, server.starred, offset, server.page_size
+            )
+            self._send(200, body, content_type='text/html')
+        elif path.startswith('/pages/'):
+            n = path.split('/')[2]
+            self._send(
+                200, bookmarked_page(n), content_type='text/html',
+                headers={'ETag': f'"{n}"'}
+            )
+        elif path == '/static/style.css':
+            self._send(200, STYLESHEET, content_type='text/css')
+        elif path == '/static/pixel.gif':
+            self._send(200, PIXEL, content_type='image/gif')
+        else:
+            self._send(404, b'Not found', content_type='text/plain')
+
+
+class FakeS3(_FakeServer):
+    """An HTTP server that stores objects in memory, and answers the S3
+    requests the sync scripts make.  Buckets are addressed by path.
+    """
+    def __init__(self, port=0):
+        super().__init__(_FakeS3Handler, port=port)
+        self.buckets = {}
+
+    def put_object(self, bucket, key, body, content_type):
+        with self._lock:
+            self.buckets.setdefault(bucket, {})[key] = (body, content_type)
+
+    def get_object(self, bucket, key):
+        return self.buckets.get(bucket, {}).get(key)
+
+
+class _FakeS3Handler(_FakeHandler):
+
+    def _bucket_and_key(self):
+        path = unquote(urlsplit(self.path).path)
+        bucket, _, key = path.lstrip('/').partition('/')
+        return bucket, key
+
+    def _error(self, status, code):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        ).encode('utf8')
+        self._send(status, body, content_type='application/xml')
+
+    def do_PUT(self):
+        body = self._read_body()
+        bucket, key = self._bucket_and_key()
+        if not key:
+            with self.server._lock:
+                self.server.buckets.setdefault(bucket, {})
+            self._send(200)
+        elif bucket not in self.server.buckets:
+            self._error(404, 'NoSuchBucket')
+        else:
+            self.server.put_object(
+                bucket, key, body,
+                self.headers.get('Content-Type', 'binary/octet-stream')
+            )
+            etag = hashlib.md5(body).hexdigest()
+            self._send(200, headers={'ETag': f'"{etag}"'})
+
+    def do_GET(self):
+        bucket, key = self._bucket_and_key()
+        obj = self.server.get_object(bucket, key)
+        if obj is None:
+            self._error(404, 'NoSuchKey')
+            return
+
+        body, content_type = obj
+        headers = {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+
+        # boto3 sends ranges of the form ``bytes=<first>-<last>``.
+        byte_range = self.headers.get('Range')
+        if byte_range is not None:
+            first, last = byte_range.split('=')[1].split('-')
+            first, last = int(first), min(int(last), len(body) - 1)
+            headers['Content-Range'] = f'bytes {first}-{last}/{len(body)}'
+            self._send(206, body[first:last + 1], content_type, headers)
+        else:
+            self._send(200, body, content_type, headers)
+
+    do_HEAD = do_GET
+
+
+class FakeElasticsearch(_FakeServer):
+    """An HTTP server that answers the requests the indexer makes to
+    Elasticsearch.  It only keeps the IDs of the indexed documents.
+    """
+    def __init__(self, port=0):
+        super().__init__(_FakeElasticsearchHandler, port=port)
+        self.indices = {}
+
+
+class _FakeElasticsearchHandler(_FakeHandler):
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf8'))
+
+    def _index_name(self):
+        return urlsplit(self.path).path.strip('/').split('/')[0]
+
+    def do_PUT(self):
+        body = self._read_body()
+        server = self.server
+        parts = urlsplit(self.path).path.strip('/').split('/')
+
+        with server._lock:
+            if len(parts) == 1:
+                if parts[0] in server.indices:
+                    self._send_json(400, {
+                        'error': {
+                            'type': 'resource_already_exists_exception',
+                            'reason': f'index [{parts[0]}] already exists',
+                        },
+                        'status': 400,
+                    })
+                    return
+                server.indices[parts[0]] = set()
+                self._send_json(200, {'acknowledged': True})
+            elif parts[1] == '_mapping':
+                json.loads(body)
+                self._send_json(200, {'acknowledged': True})
+            else:
+                json.loads(body)
+                server.indices.setdefault(parts[0], set()).add(parts[-1])
+                self._send_json(201, {'_id': parts[-1], 'result': 'created'})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path.endswith('/_bulk'):
+            self._bulk(self._read_body())
+        elif path.endswith('/_search'):
+            self._search(self._read_body())
+        elif path.endswith('/_refresh'):
+            self._read_body()
+            self._send_json(200, {'_shards': {'failed': 0}})
+        else:
+            self.do_PUT()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.endswith('/_search'):
+            self._search(self._read_body())
+        elif path == '/':
+            self._send_json(200, {'version': {'number': '6.8.0'}})
+        else:
+            self._send_json(404, {'found': False})
+
+    def _bulk(self, body):
+        server = self.server
+        lines = iter(body.decode('utf8').splitlines())
+        items = []
+        with server._lock:
+            for line in lines:
+                if not line.strip():
+                    continue
+                (op, meta), = json.loads(line).items()
+                index = server.indices.setdefault(meta['_index'], set())
+                if op == 'delete':
+                    status = 200 if meta['_id'] in index else 404
+                    index.discard(meta['_id'])
+                else:
+                    json.loads(next(lines))
+                    status = 200 if meta['_id'] in index else 201
+                    index.add(meta['_id'])
+                items.append({op: dict(meta, status=status)})
+
+        self._send_json(200, {'took': 1, 'errors': False, 'items': items})
+
+    def _search(self, body):
+        params = parse_qs(urlsplit(self.path).query)
+        query = json.loads(body) if body else {}
+        size = int(params.get('size', [query.get('size', 10)])[0])
+
+        index = self._index_name()
+        ids = sorted(self.server.indices.get(index, ()))
+        hits = [
+            {'_index': index, '_id': i, '_score': 1.0} for i in ids[:size]
+        ]
+        self._send_json(200, {'hits': {'total': len(ids), 'hits': hits}})
+
+
+def _start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_script(name, argv, env, workdir):
+    """Run one of the sync scripts in a separate process.
+
+    Returns the wall-clock time, the peak RSS, and the stages from the
+    script's run report.  Output from the script goes to a log file in
+    ``workdir``.
+    """
+    log_path = os.path.join(workdir, f'{name}.log')
+    with open(log_path, 'wb') as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, argv[0])] + argv[1:],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+        # wait4() gives us the resource usage of the process, including
+        # its peak RSS, which Popen.wait() would throw away.
+        # Like Popen, a process killed by a signal gets a negative code.
+        _, status, rusage = os.wait4(proc.pid, 0)
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        seconds = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f'{name} exited with {proc.returncode}; see {log_path}'
+        )
+
+    # On Linux, ru_maxrss is in kilobytes.
+    report_path = max(glob.glob(os.path.join(workdir, 'reports', f'{name}-*')))
+    with open(report_path) as infile:
+        report = json.load(infile)
+
+    return {
+        'script': name,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+        'stages': report['stages'],
+    }
+
+
+def benchmark_sync(size, seed, new, page_size, workers, workdir):
+    """Seed the stand-ins with a corpus of ``size`` bookmarks, and run a
+    whole sync against them.  Returns the results for each script.
+    """
+    pinboard = _start(FakePinboard(page_size=page_size))
+    s3 = _start(FakeS3())
+    es = _start(FakeElasticsearch())
+
+    try:
+        cached, api_response = sync_corpus(
+            count=size, seed=seed, web_url=pinboard.url, new=new
+        )
+        metadata, starred = page_metadata(api_response, seed=seed)
+        pinboard.set_corpus(api_response, metadata, starred)
+
+        s3.buckets[S3_BUCKET] = {}
+        s3.put_object(
+            S3_BUCKET, S3_BOOKMARKS_KEY,
+            json.dumps(cached, separators=(',', ':')).encode('utf8'),
+            'application/json'
+        )
+
+        # The last sync indexed every bookmark, so the indexer has the
+        # deleted ones to clean up.
+        es.indices[INDEX_NAME] = set(cached)
+        del cached, api_response
+
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [
+                os.path.join(ROOT, 'src'), os.environ.get('PYTHONPATH')
+            ])),
+            PINBOARD_URL=pinboard.url,
+            PINBOARD_API_URL=pinboard.url,
+            S3_ENDPOINT_URL=s3.url,
+            ELASTICSEARCH_HOST=es.url,
+            PINCUSHION_REPORT_DIR=os.path.join(workdir, 'reports'),
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            AWS_DEFAULT_REGION='eu-west-1',
+            # Newer versions of botocore send checksums as trailers on
+            # chunked uploads, which the fake S3 doesn't understand.
+            AWS_REQUEST_CHECKSUM_CALCULATION='when_required',
+            NO_PROXY='127.0.0.1,localhost',
+        )
+        env.pop('PINCUSHION_TEXTFILE_DIR', None)
+
+        credentials = [f'--username={USERNAME}', f'--password={PASSWORD}']
+        scripts = [
+            ('metadata_fetcher', [
+                'run_metadata_fetcher.py', f'--bucket={S3_BUCKET}'
+            ] + credentials),
+            ('indexer', ['run_indexer.py']),
+            ('asset_fetcher', [
+                'run_asset_fetcher.py', f'--bucket={S3_BUCKET}',
+                '--format=warc', f'--workers={workers}',
+                f'--scratch-dir={os.path.join(workdir, "scratch")}',
+            ] + credentials),
+        ]
+
+        return [
+            run_script(name, argv, env=env, workdir=workdir)
+            for name, argv in scripts
+        ]
+    finally:
+        for server in (pinboard, s3, es):
+            server.shutdown()
+            server.server_close()
+
+
+def print_results(size, results):
+    print(f'\n{size} bookmarks')
+    print(f'  {"":24} {"seconds":>9} {"peak RSS":>10} {"items":>9}')
+    for r in results:
+        print(
+            f'  {r["script"]:24} {r["seconds"]:9.2f} '
+            f'{r["peak_rss_mb"]:7.1f} MB'
+        )
+        for stage in r['stages']:
+            print(
+                f'    {stage["name"]:22} {stage["seconds"]:9.2f} '
+                f'{"":10} {stage["items"]:9d}'
+            )
+    total = sum(r['seconds'] for r in results)
+    print(f'  {"total":24} {total:9.2f}')
+
+
+if __name__ == '__main__':
+    args = docopt.docopt(__doc__)
+
+    if shutil.which('wget') is None:
+        raise SystemExit('The asset fetcher needs wget, which is missing')
+
+    all_results = {}
+    for size in [int(s) for s in args['--sizes'].split(',')]:
+        workdir = tempfile.mkdtemp(prefix=f'pincushion-sync-{size}-')
+        print(f'Syncing {size} bookmarks in {workdir}...')
+        try:
+            results = benchmark_sync(
+                size=size,
+                seed=int(args['--seed']),
+                new=float(args['--new']),
+                page_size=int(args['--page-size']),
+                workers=int(args['--workers']),
+                workdir=workdir
+            )
+        finally:
+            if not args['--keep']:
+                shutil.rmtree(workdir)
+
+        print_results(size, results)
+        all_results[size] = results
+
+    if args['--json']:
+        with open(args['--json'], 'w') as outfile:
+            json.dump(all_results, outfile, indent=2)
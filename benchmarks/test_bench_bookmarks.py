@@ -0,0 +1,39 @@
+# -*- encoding: utf-8
+"""
+Benchmarks for the bookmark processing in the sync scripts, which runs over
+every bookmark on every sync.
+"""
+
+import copy
+
+from pincushion import bookmarks
+
+import corpus
+
+
+def test_create_id(benchmark, s3_bookmarks):
+    urls = [b['href'] for b in s3_bookmarks.values()]
+
+    def _create_all():
+        for url in urls:
+            bookmarks.create_id(url)
+
+    benchmark(_create_all)
+
+
+def test_transform_pinboard_bookmark(benchmark, s3_bookmarks):
+    def _transform_all():
+        for b in s3_bookmarks.values():
+            bookmarks.transform_pinboard_bookmark(b)
+
+    benchmark(_transform_all)
+
+
+def test_merge(benchmark, s3_bookmarks):
+    new_api_response = corpus.api_update(s3_bookmarks, seed=48)
+
+    # ``merge`` modifies the cached data, so every round gets a fresh copy.
+    def _setup():
+        return (copy.deepcopy(s3_bookmarks), new_api_response), {}
+
+    benchmark.pedantic(bookmarks.merge, setup=_setup, rounds=5)
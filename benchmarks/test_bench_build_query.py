@@ -0,0 +1,40 @@
+# -*- encoding: utf-8
+"""
+Benchmarks for turning the search box into an Elasticsearch query, and
+for the links that add a tag to the current query.
+"""
+
+import pytest
+
+from pincushion.services import elasticsearch
+from pincushion.services.elasticsearch import add_tag_to_query, build_query
+
+
+QUERY_STRINGS = [
+    '',
+    'tags:python tags:rust link:ok',
+    '"humpback whale" tags:fish',
+]
+
+
+@pytest.mark.parametrize('query_string', QUERY_STRINGS)
+def test_build_query_repeated(benchmark, query_string):
+    benchmark(build_query, query_string, fields=['url', 'title'])
+
+
+@pytest.mark.parametrize('query_string', QUERY_STRINGS)
+def test_build_query_cold(benchmark, query_string):
+    def _build():
+        elasticsearch._plan_query.cache_clear()
+        build_query(query_string, fields=['url', 'title'])
+
+    benchmark(_build)
+
+
+@pytest.mark.parametrize('existing_query, new_tag', [
+    ('', 'python'),
+    ('tags:rust tags:aws', 'python'),
+    ('"humpback whale" tags:fish tags:python', 'python'),
+])
+def test_add_tag_to_query(benchmark, existing_query, new_tag):
+    benchmark(add_tag_to_query, existing_query, new_tag)
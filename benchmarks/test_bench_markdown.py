@@ -0,0 +1,94 @@
+# -*- encoding: utf-8
+"""
+Benchmarks for the Markdown filters used to render every bookmark.
+
+The "uncached" benchmarks build a fresh Markdown pipeline for every call,
+as the filters used to; the others use the filters as they are now.
+"""
+
+import random
+
+import markdown
+from markdown.extensions.smarty import SmartyExtension
+import pytest
+
+from pincushion.flask import filters
+
+import corpus
+
+
+@pytest.fixture(scope='module')
+def bookmarks():
+    return corpus.pinboard_bookmarks(count=500, seed=32)
+
+
+def _render_page(bookmarks, title_fn, description_fn):
+    for b in bookmarks:
+        title_fn(b['description'])
+        if b['extended']:
+            description_fn(b['extended'])
+
+
+def _uncached_title(md):
+    if md.startswith('#'):
+        md = f'\\{md}'
+    res = markdown.markdown(md, extensions=[SmartyExtension()])
+    return res.replace('<p>', '').replace('</p>', '')
+
+
+def _uncached_description(md):
+    return markdown.markdown(md, extensions=[
+        SmartyExtension(),
+        filters.PincushionExtension()
+    ]).replace('\n</p>', '</p>')
+
+
+def test_uncached_markdown(benchmark, bookmarks):
+    benchmark(_render_page, bookmarks, _uncached_title, _uncached_description)
+
+
+def test_reused_renderers_cold_cache(benchmark, bookmarks):
+    def _setup():
+        filters._render_markdown.cache_clear()
+
+    benchmark.pedantic(
+        _render_page,
+        args=(bookmarks, filters.title_markdown, filters.description_markdown),
+        setup=_setup,
+        rounds=5
+    )
+
+
+def test_reused_renderers_warm_cache(benchmark, bookmarks):
+    _render_page(
+        bookmarks, filters.title_markdown, filters.description_markdown
+    )
+    benchmark(
+        _render_page,
+        bookmarks, filters.title_markdown, filters.description_markdown
+    )
+
+
+@pytest.fixture(scope='module')
+def large_descriptions():
+    rng = random.Random(33)
+    return [
+        corpus.large_description(rng, paragraphs=200).splitlines()
+        for _ in range(5)
+    ]
+
+
+@pytest.mark.parametrize('preprocessor_cls', [
+    filters.AutoLinkPreprocessor,
+    filters.BlockquotePreprocessor,
+])
+def test_preprocessors_on_large_descriptions(
+    benchmark, large_descriptions, preprocessor_cls
+):
+    preprocessor = preprocessor_cls()
+
+    def _run():
+        for lines in large_descriptions:
+            preprocessor.run(lines)
+
+    benchmark(_run)
@@ -0,0 +1,29 @@
+# -*- encoding: utf-8
+"""
+Benchmarks for sorting the tags in the tag cloud, which has up to 120 tags
+on every page view.
+"""
+
+import random
+
+import pytest
+
+from pincushion.flask import filters
+
+import corpus
+
+
+@pytest.fixture(scope='module')
+def tag_cloud_tags():
+    rng = random.Random(35)
+    tags = rng.sample(corpus.TAGS, 110) + [
+        'wc:<1k', 'wc:1k-5k', 'wc:5k-10k', 'wc:10k-25k', 'wc:25k-50k',
+        'wc:50k-100k', 'wc:&lt;1k', 'wc:100k-150k', 'wc:150k-200k',
+        'wc:200k-500k',
+    ]
+    rng.shuffle(tags)
+    return tags
+
+
+def test_custom_tag_sort(benchmark, tag_cloud_tags):
+    benchmark(filters.custom_tag_sort, tag_cloud_tags)
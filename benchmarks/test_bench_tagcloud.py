@@ -0,0 +1,42 @@
+# -*- encoding: utf-8
+"""
+Benchmarks for building the tag cloud shown alongside every listing page.
+"""
+
+import random
+
+import pytest
+
+from pincushion.flask import build_tag_cloud, TagcloudOptions
+from pincushion.flask import tagcloud
+
+import corpus
+
+
+OPTIONS = TagcloudOptions(
+    size_start=9, size_end=24, colr_start='#999999', colr_end='#bd450b'
+)
+
+
+@pytest.fixture(scope='module')
+def aggregations():
+    rng = random.Random(36)
+    return [
+        {t: rng.randint(1, 3000) for t in rng.sample(corpus.TAGS, 118)}
+        for _ in range(20)
+    ]
+
+
+def test_build_tag_cloud_repeated(benchmark, aggregations):
+    counter = aggregations[0]
+    benchmark(build_tag_cloud, counter, OPTIONS)
+
+
+def test_build_tag_cloud_cold(benchmark, aggregations):
+    def _build_all():
+        tagcloud._build_tag_cloud.cache_clear()
+        tagcloud._ramp.cache_clear()
+        for counter in aggregations:
+            build_tag_cloud(dict(counter), OPTIONS)
+
+    benchmark(_build_all)
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+Compile the SCSS in assets/ and write fingerprinted, precompressed copies
+of the stylesheet to static/, along with a manifest for the viewer.
+
+Run this before starting the viewer, whenever the SCSS changes.
+"""
+
+from pincushion.flask.assets import build_assets
+
+
+if __name__ == '__main__':
+    manifest = build_assets(asset_dir='assets', static_dir='static')
+    for name, hashed_name in sorted(manifest.items()):
+        print(f'{name} -> {hashed_name}')
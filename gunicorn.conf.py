@@ -0,0 +1,32 @@
+# -*- encoding: utf-8
+"""
+gunicorn settings for the viewer.  Run with:
+
+    gunicorn --config gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Load the app once in the master process, so compiling the SCSS and
+# templates happens before we fork, not once per worker.
+preload_app = True
+
+workers = int(
+    os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+)
+
+# Most of the time in a request is spent waiting for Elasticsearch, so
+# each worker handles a few requests at once.
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+
+
+def post_worker_init(worker):
+    # Connections to Elasticsearch can't be shared across a fork, so each
+    # worker opens its own once it's started.
+    from pincushion.flask.app import warm_up_connections
+    warm_up_connections(worker.wsgi)
@@ -3,18 +3,40 @@
 """
 Use the S3 metadata, and back up assets into S3.
 
-Usage:  run_asset_fetcher.py --bucket=<BUCKET> --username=<USERNAME> --password=<PASSWORD>
+Usage:  run_asset_fetcher.py --bucket=<BUCKET> --username=<USERNAME> --password=<PASSWORD> [options]
         run_asset_fetcher.py -h | --help
+
+Options:
+  --format=<FORMAT>     How to store each capture in S3: "files" uploads every
+                        file as a separate object, "warc" bundles them into a
+                        single compressed WARC [default: files].
+  --workers=<N>         Number of pages to archive in parallel [default: 4].
+  --scratch-dir=<DIR>   Directory for in-progress captures.  It's created if
+                        necessary.  Each run works in its own subdirectory,
+                        which is deleted when the run finishes
+                        [default: /tmp/pincushion-scratch].
+  --scratch-budget=<MB> Disk space (in MB) that in-progress captures may use
+                        before workers wait for space [default: 1024].
+  --spool-size=<MB>     WARCs smaller than this (in MB) are built in memory
+                        rather than on disk [default: 16].
+  --refresh             Revisit pages that have already been archived, and
+                        archive them again if they've changed.
 """
 
+from concurrent.futures import as_completed, ThreadPoolExecutor
 import os
 import subprocess
-import tempfile
+import uuid
 
 import docopt
 
+from pincushion import archive
 from pincushion import bookmarks as pin_bookmarks
-from pincushion.services import aws
+from pincushion import revalidate
+from pincushion.constants import PINBOARD_URL
+from pincushion.instrumentation import RunReport
+from pincushion.scratch import ScratchSpace
+from pincushion.services import aws, http
 
 
 def wget(*cmd, **kwargs):
@@ -25,87 +47,115 @@ def cprint(s):
     print('\033[92m*** ' + s + '\033[0m')
 
 
-args = docopt.docopt(__doc__)
-bucket = args['--bucket']
-username = args['--username']
-password = args['--password']
+# The fields on a bookmark that this script fills in.
+BOOKMARK_FIELDS = ['_backup', '_validators', '_archive']
 
-bookmarks = aws.read_json_from_s3(bucket=bucket, key='bookmarks.json')
-metadata = aws.read_json_from_s3(bucket=bucket, key='metadata.json')
 
-# Create the wget cookies file
-subprocess.check_call([
-    'wget',
-    '--save-cookies', 'cookies.txt',
-    '--keep-session-cookies',
-    '--post-data', f'username={username}&password={password}',
-    '--delete-after', 'https://pinboard.in/auth/'
-])
+def wget_user_agent():
+    """Returns the User-Agent header that wget sends.
 
-try:
-    for b_id, bookmark in bookmarks.items():
-        matching = [m for m in metadata if m['url'] == bookmark['href']]
-        cprint(f'Should I back up {bookmark["href"]}?')
+    We check a page can be fetched before capturing it with wget, and some
+    sites treat clients differently depending on their User-Agent, so the
+    check should look the same as the capture.
+    """
+    # The first line is something like "GNU Wget 1.21.3 built on linux-gnu."
+    output = subprocess.check_output(['wget', '--version'])
+    version = output.decode('utf8').split()[2]
+    return f'Wget/{version}'
 
-        if bookmark.get('_backup', False):
-            cprint(f'Skipping backup for {bookmark["href"]}, already exists!')
-            continue
 
-        # Check wget can download the page at all
-        try:
-            subprocess.check_call(
-                ['wget', bookmark['href']],
-                cwd=tempfile.mkdtemp(),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT
-            )
-        except subprocess.CalledProcessError:
-            cprint('Page is inaccessible to wget; skipping')
-            continue
+def capture_page(url, outdir, cookies_path):
+    """Download a page and its requisites into ``outdir``, with the page
+    itself saved as ``index.html``.  Returns True if successful.
+    """
+    proc = subprocess.Popen([
+        'wget',
+        '--adjust-extension',
+        '--span-hosts',
+        '--no-verbose',
+        '--convert-links',
+        '--page-requisites',
+        '--no-directories',
+        '--load-cookies', cookies_path,
+        '--output-file', '-',
+        url
+    ], cwd=outdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    stdout, _ = proc.communicate()
 
-        outdir = tempfile.mkdtemp()
-        proc = subprocess.Popen([
-            'wget',
-            '--adjust-extension',
-            '--span-hosts',
-            '--no-verbose',
-            '--convert-links',
-            '--page-requisites',
-            '--no-directories',
-            '--load-cookies', os.path.join(os.path.abspath(os.curdir), 'cookies.txt'),
-            '--output-file', '-',
-            bookmark["href"]
-        ], cwd=outdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        stdout, _ = proc.communicate()
-
-        # First line will be someting like
-        #
-        #    2017-12-27 00:20:14 URL:https://example.org [101/101] -> "example.html" [1]
-        #
-        # We want that filename, and we want to rename it to index.html.
-        try:
-            filename = stdout.decode('utf8').splitlines()[0].split('->')[-1].strip().split()[0].strip('"')
-        except UnicodeDecodeError as err:
-            print(err)
-            continue
+    # First line will be someting like
+    #
+    #    2017-12-27 00:20:14 URL:https://example.org [101/101] -> "example.html" [1]
+    #
+    # We want that filename, and we want to rename it to index.html.
+    try:
+        filename = stdout.decode('utf8').splitlines()[0].split('->')[-1].strip().split()[0].strip('"')
+    except UnicodeDecodeError as err:
+        print(err)
+        return False
 
-        try:
-            os.rename(
-                src=os.path.join(outdir, filename),
-                dst=os.path.join(outdir, 'index.html')
+    try:
+        os.rename(
+            src=os.path.join(outdir, filename),
+            dst=os.path.join(outdir, 'index.html')
+        )
+    except FileNotFoundError as err:
+        print(err)
+        print(stdout)
+        return False
+
+    # I never care about robots.txt, but wget always fetches it.
+    try:
+        os.unlink(os.path.join(outdir, 'robots.txt'))
+    except FileNotFoundError:
+        pass
+
+    return True
+
+
+def capture_size(outdir):
+    """Returns the total size (in bytes) of the files in a capture."""
+    return sum(
+        os.path.getsize(os.path.join(outdir, name))
+        for name in os.listdir(outdir)
+    )
+
+
+def upload_capture(outdir, b_id, bookmark, bucket, archive_format, scratch):
+    """Upload a capture to S3.  Returns True if successful."""
+    if archive_format == 'warc':
+        # Bundle the capture into a single object, which is served back
+        # out by the /archive route in the viewer.  Every capture gets a new
+        # key: the viewer reads the archive at the location stored with the
+        # bookmark until it's reindexed, so we can't overwrite it in place.
+        key = f'{b_id}.{uuid.uuid4().hex}.warc.gz'
+        with scratch.spooled_file() as warc:
+            location = archive.write_archive(
+                out=warc, files=archive.files_in_directory(outdir)
             )
-        except FileNotFoundError as err:
-            print(err)
-            print(stdout)
-            continue
+            warc.seek(0)
 
-        # I never care about robots.txt, but wget always fetches it.
+            from botocore.exceptions import ClientError
+            try:
+                aws.upload_fileobj_to_s3(
+                    bucket=bucket,
+                    key=key,
+                    fileobj=warc,
+                    content_type='application/warc'
+                )
+            except ClientError:
+                cprint('Error uploading to S3?')
+                return False
+        location['key'] = key
+        bookmark['_archive'] = location
+    else:
         try:
-            os.unlink(os.path.join(outdir, 'robots.txt'))
-        except FileNotFoundError:
-            pass
+            # Clear out the last capture, so files it needed that this one
+            # doesn't aren't left behind.
+            if bookmark.get('_backup'):
+                subprocess.check_call([
+                    'aws', 's3', 'rm', '--recursive', f's3://{bucket}/{b_id}/'
+                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-        try:
             subprocess.check_call([
                 'aws', 's3', 'cp',
                 '--recursive', '--acl', 'public-read', outdir,
@@ -113,22 +163,162 @@ try:
             ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except subprocess.CalledProcessError:
             cprint(f'Error uploading to S3?')
-            continue
+            return False
+        bookmark.pop('_archive', None)
+
+    return True
+
+
+def backup_bookmark(
+    b_id, bookmark, bucket, archive_format, scratch, cookies_path, sess,
+    refresh, report
+):
+    cprint(f'Should I back up {bookmark["href"]}?')
+
+    if bookmark.get('_backup', False) and not refresh:
+        cprint(f'Skipping backup for {bookmark["href"]}, already exists!')
+        return
+
+    # If the link checker has already found this link is dead, there's
+    # no point spending a fetch on it.
+    if bookmark.get('_link', {}).get('ok') is False:
+        cprint('Link checker says this page is dead; skipping')
+        return
+
+    # Check we can download the page at all.  For pages we've already
+    # archived, this is a conditional request, so unchanged pages are
+    # cheap to skip.
+    validators = bookmark.get('_validators', {}) if bookmark.get('_backup') else {}
+
+    import requests
+    try:
+        with report.stage('revalidate') as stage:
+            stage.add(items=1)
+            changed, new_validators = revalidate.check_for_changes(
+                sess, url=bookmark['href'], validators=validators
+            )
+    except requests.exceptions.RequestException:
+        cprint('Page is inaccessible; skipping')
+        return
+
+    if not changed:
+        cprint(f'Skipping backup for {bookmark["href"]}, unchanged!')
+        bookmark['_validators'] = new_validators
+        return
+
+    # This blocks if other captures are using up all the scratch space,
+    # and the directory is deleted as soon as the upload is finished.
+    with scratch.workdir() as outdir:
+        with report.stage('archive_fetch') as stage:
+            if not capture_page(bookmark['href'], outdir, cookies_path):
+                return
+            size = capture_size(outdir)
+            stage.add(items=1, bytes=size)
+
+        with report.stage('upload') as stage:
+            if not upload_capture(
+                outdir=outdir,
+                b_id=b_id,
+                bookmark=bookmark,
+                bucket=bucket,
+                archive_format=archive_format,
+                scratch=scratch
+            ):
+                return
+            stage.add(items=1, bytes=size)
 
         bookmark['_backup'] = True
-except KeyboardInterrupt:
-    pass
+        bookmark['_validators'] = new_validators
+
+
+def backup_bookmark_in_worker(report, **kwargs):
+    # The workers run in a thread pool, which the run's profile can't see
+    # unless each thread profiles itself.
+    with report.profile_thread():
+        backup_bookmark(report=report, **kwargs)
+
+
+if __name__ == '__main__':
+    args = docopt.docopt(__doc__)
+    bucket = args['--bucket']
+    username = args['--username']
+    password = args['--password']
+    archive_format = args['--format']
+
+    if archive_format not in ('files', 'warc'):
+        raise SystemExit(f'Unrecognised archive format: {archive_format!r}')
 
+    with RunReport.from_env('asset_fetcher') as report:
+        with report.stage('s3_read') as stage:
+            bookmarks = aws.read_json_from_s3(
+                bucket=bucket, key='bookmarks.json'
+            )
+            stage.add(items=len(bookmarks))
+
+        # Create the wget cookies file
+        cookies_path = os.path.join(os.path.abspath(os.curdir), 'cookies.txt')
+        subprocess.check_call([
+            'wget',
+            '--save-cookies', cookies_path,
+            '--keep-session-cookies',
+            '--post-data', f'username={username}&password={password}',
+            '--delete-after', f'{PINBOARD_URL}/auth/'
+        ])
+
+        scratch = ScratchSpace(
+            root=args['--scratch-dir'],
+            budget=int(args['--scratch-budget']) * 1024 * 1024,
+            spool_threshold=int(args['--spool-size']) * 1024 * 1024
+        )
+
+        workers = int(args['--workers'])
+        sess = http.pooled_session(pool_size=workers)
+        sess.headers['User-Agent'] = wget_user_agent()
 
-new_bookmarks = aws.read_json_from_s3(bucket=bucket, key='bookmarks.json')
+        with scratch, ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    backup_bookmark_in_worker,
+                    b_id=b_id,
+                    bookmark=bookmark,
+                    bucket=bucket,
+                    archive_format=archive_format,
+                    scratch=scratch,
+                    cookies_path=cookies_path,
+                    sess=sess,
+                    refresh=args['--refresh'],
+                    report=report
+                )
+                for b_id, bookmark in bookmarks.items()
+            ]
 
-merged_bookmark_list = pin_bookmarks.merge(
-    cached_data=bookmarks,
-    new_api_response=list(new_bookmarks.values())
-)
+            try:
+                for fut in as_completed(futures):
+                    fut.result()
+            except KeyboardInterrupt:
+                for fut in futures:
+                    fut.cancel()
 
-aws.write_json_to_s3(
-    bucket=bucket,
-    key='bookmarks.json',
-    data=merged_bookmark_list
-)
+        with report.stage('s3_read') as stage:
+            new_bookmarks = aws.read_json_from_s3(
+                bucket=bucket, key='bookmarks.json'
+            )
+            stage.add(items=len(new_bookmarks))
+
+        # Other scripts may have changed bookmarks.json while we were
+        # archiving, so copy our fields into a fresh copy of it.
+        with report.stage('merge') as stage:
+            merged_bookmark_list = pin_bookmarks.merge_fields(
+                latest=new_bookmarks,
+                updated=bookmarks,
+                fields=BOOKMARK_FIELDS
+            )
+            stage.add(items=len(merged_bookmark_list))
+
+        with report.stage('s3_write') as stage:
+            size = aws.write_json_to_s3(
+                bucket=bucket,
+                key='bookmarks.json',
+                data=merged_bookmark_list
+            )
+            stage.add(items=len(merged_bookmark_list), bytes=size)
@@ -2,99 +2,113 @@
 # -*- encoding: utf-8
 """
 Synchronise Elasticsearch with the metadata kept in S3.
+
+Usage:  run_indexer.py
+        run_indexer.py -h | --help
 """
 
-from elasticsearch.exceptions import RequestError as ElasticsearchRequestError
-from elasticsearch.helpers import bulk
+import time
+
+import docopt
 
 from pincushion import bookmarks
 from pincushion.constants import (
-    DOC_TYPE, ES_CLIENT, INDEX_NAME, S3_BOOKMARKS_KEY, S3_BUCKET
+    DOC_TYPE, GENERATION_DOC_ID, INDEX_NAME, META_DOC_TYPE, META_INDEX_NAME,
+    S3_BOOKMARKS_KEY, S3_BUCKET
 )
-from pincushion.services import aws
+from pincushion.instrumentation import RunReport
+from pincushion.services import aws, elasticsearch
 
 
 if __name__ == '__main__':
-    print('Fetching bookmark data from S3')
-    s3_bookmarks = aws.read_json_from_s3(
-        bucket=S3_BUCKET,
-        key=S3_BOOKMARKS_KEY
-    )
-
-    print('Indexing into Elasticsearch...')
-
-    # We create ``tags`` as a multi-field, so it can be:
-    #
-    #   * searched/analysed as free text ("text")
-    #   * used for aggregations to build tag clouds ("keyword")
-    #
-    try:
-        ES_CLIENT.indices.create(
-            index=INDEX_NAME,
-            body={
-                'mappings': {
-                    DOC_TYPE: {
-                        'properties': {
-                            'tags': {
-                                'type': 'text',
-                                'fields': {
-                                    'raw': {'type': 'keyword'}
-                                }
-                            }
-                        }
-                    }
+    docopt.docopt(__doc__)
+
+    # This is slow to import, so don't load it until we know we're doing
+    # more than printing the help text.
+    from elasticsearch.helpers import bulk
+
+    ES_CLIENT = elasticsearch.get_client()
+
+    with RunReport.from_env('indexer') as report:
+        print('Fetching bookmark data from S3')
+        with report.stage('s3_read') as stage:
+            s3_bookmarks = aws.read_json_from_s3(
+                bucket=S3_BUCKET,
+                key=S3_BOOKMARKS_KEY
+            )
+            stage.add(items=len(s3_bookmarks))
+
+        print('Indexing into Elasticsearch...')
+
+        with report.stage('create_index'):
+            elasticsearch.create_index(
+                ES_CLIENT, index=INDEX_NAME, doc_type=DOC_TYPE
+            )
+
+        def _actions():
+            for b_id, b_data in s3_bookmarks.items():
+                data = {
+                    '_op_type': 'index',
+                    '_index': INDEX_NAME,
+                    '_type': DOC_TYPE,
+                    '_id': b_id,
                 }
-            }
-        )
-    except ElasticsearchRequestError as err:
-        if err.info['error']['type'] == 'resource_already_exists_exception':
-            pass
-        else:
-            raise
-
-    def _actions():
-        for b_id, b_data in s3_bookmarks.items():
-            data = {
-                '_op_type': 'index',
-                '_index': INDEX_NAME,
-                '_type': DOC_TYPE,
-                '_id': b_id,
-            }
-            data.update(bookmarks.transform_pinboard_bookmark(b_data))
-            yield data
-
-    resp = bulk(client=ES_CLIENT, actions=_actions())
-
-    if resp != (len(s3_bookmarks), []):
-        from pprint import pprint
-        pprint(resp)
-        raise RuntimeError(
-            "Errors while indexing documents into Elasticsearch."
-        )
-
-    print('Cleaning up deleted bookmarks...')
-    indexed = ES_CLIENT.search(
-        index=INDEX_NAME, _source=False, size=10000
-    )
-    hits = indexed['hits']['hits']
-    indexed_ids = [h['_id'] for h in hits]
-
-    delete_actions = []
-    for i in indexed_ids:
-        if i not in s3_bookmarks:
-            delete_actions.append({
-                '_op_type': 'delete',
-                '_index': INDEX_NAME,
-                '_type': DOC_TYPE,
-                '_id': i,
-            })
-
-    if delete_actions:
-        resp = bulk(client=ES_CLIENT, actions=delete_actions)
-
-        if resp != (len(delete_actions), []):
+                data.update(bookmarks.transform_pinboard_bookmark(b_data))
+                data['id'] = b_id
+                yield data
+
+        with report.stage('bulk_index') as stage:
+            resp = bulk(client=ES_CLIENT, actions=_actions())
+            stage.add(items=resp[0])
+
+        if resp != (len(s3_bookmarks), []):
             from pprint import pprint
             pprint(resp)
             raise RuntimeError(
-                "Errors while deleting documents from Elasticsearch."
+                "Errors while indexing documents into Elasticsearch."
+            )
+
+        print('Cleaning up deleted bookmarks...')
+        with report.stage('find_deleted') as stage:
+            indexed = ES_CLIENT.search(
+                index=INDEX_NAME, _source=False, size=10000
+            )
+            stage.add(items=len(indexed['hits']['hits']))
+        hits = indexed['hits']['hits']
+        indexed_ids = [h['_id'] for h in hits]
+
+        delete_actions = []
+        for i in indexed_ids:
+            if i not in s3_bookmarks:
+                delete_actions.append({
+                    '_op_type': 'delete',
+                    '_index': INDEX_NAME,
+                    '_type': DOC_TYPE,
+                    '_id': i,
+                })
+
+        if delete_actions:
+            with report.stage('bulk_delete') as stage:
+                resp = bulk(client=ES_CLIENT, actions=delete_actions)
+                stage.add(items=resp[0])
+
+            if resp != (len(delete_actions), []):
+                from pprint import pprint
+                pprint(resp)
+                raise RuntimeError(
+                    "Errors while deleting documents from Elasticsearch."
+                )
+
+        # Let the viewer know the index has changed, so it stops serving
+        # cached results.  We refresh first, so the new documents are
+        # visible to searches by the time the viewer hears about them.
+        print('Bumping the index generation...')
+        with report.stage('refresh'):
+            ES_CLIENT.indices.refresh(index=INDEX_NAME)
+            ES_CLIENT.index(
+                index=META_INDEX_NAME,
+                doc_type=META_DOC_TYPE,
+                id=GENERATION_DOC_ID,
+                body={'generation': int(time.time() * 1000)},
+                refresh=True
             )
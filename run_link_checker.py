@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+Check whether my bookmarked URLs still work, and record the results in S3.
+
+Usage:  run_link_checker.py --bucket=<BUCKET> [options]
+        run_link_checker.py -h | --help
+
+Options:
+  --workers=<N>         Number of URLs to check in parallel [default: 16].
+  --host-interval=<S>   Minimum number of seconds between starting requests
+                        to the same host [default: 1].
+  --timeout=<S>         Timeout (in seconds) for each request [default: 30].
+"""
+
+import docopt
+
+from pincushion import bookmarks as pin_bookmarks
+from pincushion import linkcheck
+from pincushion.instrumentation import RunReport
+from pincushion.services import aws, http
+
+
+if __name__ == '__main__':
+    args = docopt.docopt(__doc__)
+
+    bucket = args['--bucket']
+    workers = int(args['--workers'])
+
+    with RunReport.from_env('link_checker') as report:
+        with report.stage('s3_read') as stage:
+            bookmarks = aws.read_json_from_s3(
+                bucket=bucket, key='bookmarks.json'
+            )
+            stage.add(items=len(bookmarks))
+
+        sess = http.pooled_session(pool_size=workers)
+        limiter = linkcheck.HostRateLimiter(
+            interval=float(args['--host-interval'])
+        )
+
+        checked = dead = 0
+        for url, result in linkcheck.check_bookmarks(
+            sess,
+            bookmarks=bookmarks,
+            workers=workers,
+            limiter=limiter,
+            timeout=float(args['--timeout']),
+            report=report
+        ):
+            checked += 1
+            if not result['ok']:
+                dead += 1
+                print(f'{url}: {result["status"] or result["error"]}')
+
+        print(f'Checked {checked} URLs, {dead} dead')
+
+        # Bookmarks may have changed while we were checking links, so copy
+        # the results into a fresh read of them rather than overwriting it.
+        with report.stage('s3_read') as stage:
+            new_bookmarks = aws.read_json_from_s3(
+                bucket=bucket, key='bookmarks.json'
+            )
+            stage.add(items=len(new_bookmarks))
+
+        with report.stage('merge') as stage:
+            merged_bookmark_list = pin_bookmarks.merge_fields(
+                latest=new_bookmarks,
+                updated=bookmarks,
+                fields=['_link']
+            )
+            stage.add(items=len(merged_bookmark_list))
+
+        with report.stage('s3_write') as stage:
+            size = aws.write_json_to_s3(
+                bucket=bucket,
+                key='bookmarks.json',
+                data=merged_bookmark_list
+            )
+            stage.add(items=len(merged_bookmark_list), bytes=size)
@@ -0,0 +1,122 @@
+# -*- encoding: utf-8
+"""Pack a captured web page into a single WARC object.
+
+Every file in the capture is written as its own gzip member containing one
+WARC "resource" record.  Concatenated gzip members are still a valid gzip
+stream, but they also mean we can pull out a single file by reading just
+its byte range and decompressing that -- the same trick used by the
+Internet Archive for .warc.gz files.
+
+The offsets of each record are kept in an index, which is appended to the
+end of the archive as a final "metadata" record.
+
+"""
+
+import datetime as dt
+import gzip
+import json
+import mimetypes
+import os
+import uuid
+
+from pincushion.services import aws
+
+
+def _content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def _warc_record(warc_type, target_uri, content_type, body):
+    """Returns a single WARC record as a standalone gzip member."""
+    headers = [
+        ('WARC-Type', warc_type),
+        ('WARC-Record-ID', f'<urn:uuid:{uuid.uuid4()}>'),
+        ('WARC-Date', dt.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ('WARC-Target-URI', target_uri),
+        ('Content-Type', content_type),
+        ('Content-Length', str(len(body))),
+    ]
+    head = 'WARC/1.0\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers)
+    return gzip.compress(head.encode('utf8') + b'\r\n' + body + b'\r\n\r\n')
+
+
+def read_record(data):
+    """Given the bytes of a single gzipped WARC record, return a tuple
+    ``(headers, body)``.
+    """
+    raw = gzip.decompress(data)
+    head, rest = raw.split(b'\r\n\r\n', 1)
+
+    headers = {}
+    for line in head.decode('utf8').splitlines()[1:]:
+        k, v = line.split(':', 1)
+        headers[k.strip()] = v.strip()
+
+    return headers, rest[:int(headers['Content-Length'])]
+
+
+def files_in_directory(path):
+    """Yields ``(name, body)`` for every file in a directory."""
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as infile:
+            yield name, infile.read()
+
+
+def write_archive(out, files):
+    """Write a set of files as a WARC to the file-like object ``out``.
+
+    :param out: Writable file-like object.
+    :param files: Iterable of ``(name, body)`` pairs.
+
+    Returns a dict giving the location of the index record, which should be
+    kept alongside the bookmark so files can be read back later.
+
+    """
+    index = {}
+    offset = 0
+    for name, body in files:
+        content_type = _content_type(name)
+        record = _warc_record('resource', name, content_type, body)
+        out.write(record)
+        index[name] = [offset, len(record), content_type]
+        offset += len(record)
+
+    index_record = _warc_record(
+        'metadata', 'index.json', 'application/json',
+        json.dumps(index, sort_keys=True).encode('utf8')
+    )
+    out.write(index_record)
+
+    return {'index_offset': offset, 'index_length': len(index_record)}
+
+
+def read_index(bucket, archive):
+    """Read the index of a WARC archive held in S3.
+
+    :param bucket: Name of the S3 bucket.
+    :param archive: The ``_archive`` field stored on the bookmark.
+
+    """
+    data = aws.read_bytes_from_s3(
+        bucket=bucket,
+        key=archive['key'],
+        offset=archive['index_offset'],
+        length=archive['index_length']
+    )
+    _, body = read_record(data)
+    return json.loads(body)
+
+
+def read_file(bucket, key, index, name):
+    """Read a single file from a WARC archive held in S3.
+
+    Returns a tuple ``(content_type, body)``, or raises ``KeyError`` if
+    the file isn't in the archive.
+
+    """
+    offset, length, content_type = index[name]
+    data = aws.read_bytes_from_s3(
+        bucket=bucket, key=key, offset=offset, length=length
+    )
+    _, body = read_record(data)
+    return content_type, body
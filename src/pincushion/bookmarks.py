@@ -47,6 +47,38 @@ def merge(cached_data, new_api_response):
     return result
 
 
+def merge_fields(latest, updated, fields):
+    """Copy ``fields`` from ``updated`` into ``latest``, and return the result.
+
+    Both are cached sets of data from S3, of the form:
+
+        {<id>: <bookmark_metadata>, ...}
+
+    The sync scripts each own a few fields on a bookmark (e.g. the asset
+    fetcher owns ``_backup``).  When a script saves its results, ``updated``
+    is the copy it read when it started, with those fields filled in, and
+    ``latest`` is a fresh copy that other scripts may have changed since.
+
+    Owned fields are taken from ``updated`` -- including removing them, if
+    they're not set there -- and everything else is left as in ``latest``.
+    Bookmarks that aren't in both are left alone.
+
+    """
+    for b_id, bookmark in latest.items():
+        try:
+            source = updated[b_id]
+        except KeyError:
+            continue
+
+        for field in fields:
+            if field in source:
+                bookmark[field] = source[field]
+            else:
+                bookmark.pop(field, None)
+
+    return latest
+
+
 def transform_pinboard_bookmark(bookmark):
     """Transform a bookmark from the Pinboard API into my model."""
     b = bookmark.copy()
@@ -57,6 +89,18 @@ def transform_pinboard_bookmark(bookmark):
     del b['meta']
     del b['shared']
 
+    # These are only used to decide when to re-archive a page.
+    b.pop('_validators', None)
+
+    # Results from the link checker get flattened into top-level fields,
+    # so they're easy to filter on in Elasticsearch.
+    link = b.pop('_link', None)
+    if link is not None:
+        b['link_ok'] = link['ok']
+        b['link_status'] = link['status']
+        b['link_final_url'] = link['final_url']
+        b['link_checked_at'] = link['checked_at']
+
     # These fields have somewhat awkward names to match the old Delicious API.
     # See https://pinboard.in/api#posts_add.  Give them more sensible names!
     b['title'] = b.pop('description')
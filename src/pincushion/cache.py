@@ -0,0 +1,92 @@
+# -*- encoding: utf-8
+"""An in-memory cache for expensive lookups in the viewer."""
+
+import collections
+from concurrent.futures import Future
+import threading
+import time
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Values are filled in with :meth:`get_or_compute`.  If several threads
+    miss on the same key at once, only the first one computes the value --
+    the rest wait for it and share the result.
+
+    :param maxsize: Maximum number of entries to keep.  When the cache is
+        full, the least recently used entry is discarded.
+    :param ttl: Number of seconds to keep an entry for.
+
+    """
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key``, or ``default`` if it's
+        missing or expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, or call ``compute()`` to
+        create it if it's missing or expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                pass
+            else:
+                if expires > self._clock():
+                    self._data.move_to_end(key)
+                    return value
+                del self._data[key]
+
+            try:
+                fut = self._pending[key]
+            except KeyError:
+                fut = self._pending[key] = Future()
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            return fut.result()
+
+        try:
+            value = compute()
+        except BaseException as err:
+            fut.set_exception(err)
+            raise
+        else:
+            fut.set_result(value)
+            with self._lock:
+                self._data[key] = (self._clock() + self.ttl, value)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
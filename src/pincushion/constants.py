@@ -2,8 +2,6 @@
 
 import os
 
-from elasticsearch import Elasticsearch
-
 
 S3_BUCKET = 'alexwlchan-pincushion'
 S3_BOOKMARKS_KEY = 'bookmarks.json'
@@ -11,6 +9,20 @@ S3_BOOKMARKS_KEY = 'bookmarks.json'
 INDEX_NAME = 'bookmarks'
 DOC_TYPE = 'bookmarks'
 
+# Every time the indexer runs, it records a new "generation" in this index,
+# which tells the viewer to throw away any cached search results.
+META_INDEX_NAME = 'pincushion_meta'
+META_DOC_TYPE = 'meta'
+GENERATION_DOC_ID = 'generation'
+
 ES_HOST = (
     os.environ.get('ELASTICSEARCH_HOST', 'http://localhost:9200/').rstrip('/'))
-ES_CLIENT = Elasticsearch(hosts=[ES_HOST])
+
+# These can be pointed at local stand-ins, e.g. for benchmarking a sync.
+# If S3_ENDPOINT_URL isn't set, we use the real S3.
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+
+PINBOARD_URL = (
+    os.environ.get('PINBOARD_URL', 'https://pinboard.in').rstrip('/'))
+PINBOARD_API_URL = (
+    os.environ.get('PINBOARD_API_URL', 'https://api.pinboard.in').rstrip('/'))
@@ -0,0 +1,628 @@
+# -*- encoding: utf-8
+"""The web app for browsing my bookmarks.
+
+Use ``create_app()`` to get a WSGI app, e.g. for gunicorn.
+
+"""
+
+import datetime as dt
+import functools
+import hashlib
+import json
+import mimetypes
+import os
+import time
+
+import attr
+from flask import (
+    abort, current_app, Flask, g, make_response, redirect, render_template,
+    request, Response, send_from_directory, url_for
+)
+from flask_login import (
+    current_user, LoginManager, login_required, login_user, logout_user
+)
+from flask_wtf import FlaskForm
+from markupsafe import Markup
+import requests
+from wtforms import PasswordField
+from wtforms.validators import DataRequired
+
+from pincushion import archive, profiling
+from pincushion.cache import TTLCache
+from pincushion.constants import (
+    ES_HOST, GENERATION_DOC_ID, META_DOC_TYPE, META_INDEX_NAME, S3_BUCKET
+)
+from pincushion.flask import assets, filters, timing
+from pincushion.flask.fragments import fragment_key, FragmentCache
+from pincushion.flask.tagcloud import build_tag_cloud, TagcloudOptions
+from pincushion.services import elasticsearch, http
+
+
+# (connect, read) timeouts for requests to Elasticsearch, in seconds.
+ES_TIMEOUT = (3.05, 10)
+
+# Up to this page, pagination links use page numbers.  Past it, we use
+# cursors, because an offset that deep makes Elasticsearch collect and sort
+# every result before it.
+MAX_NUMBERED_PAGE = 10
+
+TAG_CLOUD_SIZE = 120
+
+TAG_CLOUD_OPTIONS = TagcloudOptions(
+    size_start=9, size_end=24, colr_start='#999999', colr_end='#bd450b'
+)
+
+
+def config_from_env():
+    """Read the app config from environment variables."""
+    return {
+        'ES_HOST': ES_HOST,
+        'SECRET_KEY': os.environ['PINCUSHION_SECRET_KEY'],
+        'USER_PASSWORD': os.environ['PINCUSHION_PASSWORD'],
+        'FRAGMENT_CACHE_DIR': os.environ.get('PINCUSHION_FRAGMENT_CACHE'),
+        'ENABLE_TIMING': bool(os.environ.get('PINCUSHION_TIMING')),
+        'PROFILE_DIR': os.environ.get('PINCUSHION_PROFILE_DIR'),
+    }
+
+
+class _Viewer:
+    """Everything that's shared between requests to a single app:
+    the connections to Elasticsearch, and the caches in front of it.
+    """
+    def __init__(self, app):
+        self.app = app
+
+        # Every request to Elasticsearch goes through this session, so
+        # connections are kept alive and reused between page views.
+        self.es_session = http.pooled_session(pool_size=10)
+
+        # Search results are cached for a few minutes, and the cache is
+        # thrown away whenever the indexer records a new index generation.
+        # We only check the generation every few seconds, so that isn't an
+        # ES request per page.
+        self.search_cache = TTLCache(maxsize=256, ttl=300)
+        self.generation_cache = TTLCache(maxsize=1, ttl=5)
+        self._last_generation = None
+
+        # The tag cloud is the same on every page of a query, so once we've
+        # seen it we don't ask Elasticsearch to aggregate the tags again.
+        self.tag_cloud_cache = TTLCache(maxsize=256, ttl=300)
+
+        # The number of results for each query.  If there's only one,
+        # the tag cloud isn't shown, so we don't ask for it at all.  The
+        # total can't change until the index does, so we keep it longer.
+        self.total_cache = TTLCache(maxsize=1024, ttl=3600)
+
+        # Each bookmark is rendered once and reused on every page it
+        # appears on.  If FRAGMENT_CACHE_DIR is set, rendered bookmarks are
+        # shared between processes.
+        self.fragment_cache = FragmentCache(
+            maxsize=4096, directory=app.config.get('FRAGMENT_CACHE_DIR')
+        )
+
+        # Fingerprinted assets, and the compressed copies we have of each.
+        self.static_dir = os.path.join(app.root_path, 'static')
+        self.manifest = assets.load_manifest(self.static_dir)
+        self.hashed_assets = {
+            hashed_name: [
+                (encoding, ext)
+                for encoding, ext in assets.ENCODINGS
+                if os.path.exists(
+                    os.path.join(self.static_dir, hashed_name + ext)
+                )
+            ]
+            for hashed_name in self.manifest.values()
+        }
+
+        self._template_version = None
+
+    @property
+    def es_host(self):
+        return self.app.config['ES_HOST']
+
+    def _fetch_bookmarks(
+        self, query, page, page_size, cursor, tag_cloud_size
+    ):
+        query = elasticsearch.build_query(
+            query_string=query,
+            page=page,
+            page_size=page_size,
+            cursor=cursor,
+            fields=elasticsearch.LISTING_FIELDS,
+            tag_cloud_size=tag_cloud_size
+        )
+
+        with timing.span('es'):
+            resp = self.es_session.post(
+                f'{self.es_host}/bookmarks/bookmarks/_search',
+                params={'filter_path': elasticsearch.SEARCH_FILTER_PATH},
+                data=json.dumps(query),
+                headers={'Content-Type': 'application/json'},
+                timeout=ES_TIMEOUT
+            )
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError:
+                print(resp.text)
+                raise
+            data = resp.json()
+
+        # Backwards cursors get their results in reverse order.
+        reverse = 'search_after' in query and cursor.reverse
+
+        return elasticsearch.parse_search_response(
+            data, page=page, page_size=page_size, reverse=reverse
+        )
+
+    def index_generation(self):
+        def _fetch_generation():
+            with timing.span('es'):
+                resp = self.es_session.get(
+                    f'{self.es_host}/{META_INDEX_NAME}/{META_DOC_TYPE}/'
+                    f'{GENERATION_DOC_ID}',
+                    timeout=ES_TIMEOUT
+                )
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            return resp.json()['_source']['generation']
+
+        generation = self.generation_cache.get_or_compute(
+            'generation', _fetch_generation
+        )
+        if generation != self._last_generation:
+            self.search_cache.clear()
+            self.tag_cloud_cache.clear()
+            self.total_cache.clear()
+            self._last_generation = generation
+        return generation
+
+    def fetch_bookmarks(self, query, page, page_size=96, cursor=None):
+        query = elasticsearch.normalise_query(query)
+        generation = self.index_generation()
+
+        def _fetch():
+            tags = self.tag_cloud_cache.get((generation, query))
+            if self.total_cache.get((generation, query), 2) <= 1:
+                tags = {}
+            results = self._fetch_bookmarks(
+                query=query, page=page, page_size=page_size, cursor=cursor,
+                tag_cloud_size=0 if tags is not None else TAG_CLOUD_SIZE
+            )
+            self.total_cache.get_or_compute(
+                (generation, query), lambda: results.total_size
+            )
+            if tags is None:
+                self.tag_cloud_cache.get_or_compute(
+                    (generation, query), lambda: results.tags
+                )
+            else:
+                results.tags = tags
+            return results
+
+        cursor_token = (
+            elasticsearch.encode_cursor(cursor) if cursor is not None else None
+        )
+        key = (generation, query, page, page_size, cursor_token)
+        return self.search_cache.get_or_compute(key, _fetch)
+
+    def fetch_archive_location(self, b_id):
+        with timing.span('es'):
+            resp = self.es_session.get(
+                f'{self.es_host}/bookmarks/bookmarks/{b_id}',
+                params={'_source': '_archive'},
+                timeout=ES_TIMEOUT
+            )
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.json()['_source'].get('_archive')
+
+    def asset_url(self, name):
+        # If the assets have been built, we link to the fingerprinted copy
+        # -- which browsers can cache forever.  Otherwise we fall back to
+        # the original file.
+        return '/static/' + self.manifest.get(name, name)
+
+    def template_version(self):
+        # Pages change if I edit the templates or the assets, so those go
+        # into the ETag as well as the search results.
+        if self._template_version is None:
+            h = hashlib.sha256()
+            template_dir = os.path.join(
+                self.app.root_path, self.app.template_folder
+            )
+            for root, _, filenames in sorted(os.walk(template_dir)):
+                for f in sorted(filenames):
+                    h.update(open(os.path.join(root, f), 'rb').read())
+            h.update(json.dumps(self.manifest, sort_keys=True).encode('utf8'))
+            self._template_version = h.hexdigest()
+        return self._template_version
+
+    def index_etag(self, query, page, cursor):
+        # A page only changes when the index does, or when enough time
+        # passes that the "saved N minutes ago" text would be different.
+        # Equivalent queries get the same results, so they share an ETag.
+        parts = [
+            self.template_version(),
+            self.index_generation(),
+            elasticsearch.normalise_query(query),
+            page,
+            (
+                elasticsearch.encode_cursor(cursor)
+                if cursor is not None else None
+            ),
+            int(time.time() // filters.SLANG_TIME_BUCKET),
+        ]
+        return hashlib.sha256(json.dumps(parts).encode('utf8')).hexdigest()
+
+    def render_bookmark(self, b):
+        # The only part of a bookmark that changes over time is the "saved
+        # N days ago" text, so that goes in the key alongside its contents.
+        key = fragment_key(
+            self.template_version(), b, filters.slang_time(b['time'])
+        )
+        html = self.fragment_cache.get_or_render(
+            key, lambda: render_template('_bookmark.html', b=b)
+        )
+        return Markup(html)
+
+
+def _viewer():
+    return current_app.extensions['pincushion']
+
+
+# The asset fetcher writes every capture to a new key, rather than
+# overwriting the last one, so the index at a given location never changes.
+@functools.lru_cache(maxsize=256)
+def _read_archive_index(key, index_offset, index_length):
+    return archive.read_index(bucket=S3_BUCKET, archive={
+        'key': key,
+        'index_offset': index_offset,
+        'index_length': index_length,
+    })
+
+
+def static_file(filename):
+    viewer = _viewer()
+    try:
+        variants = viewer.hashed_assets[filename]
+    except KeyError:
+        return send_from_directory(viewer.static_dir, filename)
+
+    # Fingerprinted assets never change, so they can be cached forever,
+    # and we send whichever precompressed copy the browser can handle.
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, ext in variants:
+        if request.accept_encodings[encoding]:
+            resp = send_from_directory(
+                viewer.static_dir, filename + ext, mimetype=mimetype
+            )
+            resp.headers['Content-Encoding'] = encoding
+            break
+    else:
+        resp = send_from_directory(
+            viewer.static_dir, filename, mimetype=mimetype
+        )
+
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+
+def _with_cache_headers(resp, etag):
+    resp.set_etag(etag)
+
+    # Browsers can keep a copy, but have to check it's still current
+    # before they use it.  Only logged-in users can see the page.
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.headers['Vary'] = 'Cookie'
+    return resp
+
+
+def _build_pagination_url(desired_page, cursor=None):
+    if desired_page < 1:
+        return None
+    args = request.args.copy()
+    args.pop('page', None)
+    args.pop('cursor', None)
+    args.pop('profile', None)
+    if cursor is not None and desired_page > MAX_NUMBERED_PAGE:
+        args['cursor'] = cursor
+    else:
+        args['page'] = desired_page
+    return url_for(request.endpoint, **args)
+
+
+@login_required
+def index():
+    if 'query' in request.args and request.args['query'] == '':
+        args = request.args.copy()
+        del args['query']
+        return redirect(url_for(request.endpoint, **args))
+
+    viewer = _viewer()
+    query = request.args.get('query', '')
+
+    if 'cursor' in request.args:
+        try:
+            cursor = elasticsearch.decode_cursor(request.args['cursor'])
+        except ValueError:
+            abort(400)
+        page = cursor.page
+    else:
+        cursor = None
+        page = int(request.args.get('page', '1'))
+
+    # If the browser already has this page, we can skip Elasticsearch and
+    # the templates entirely.
+    etag = viewer.index_etag(query=query, page=page, cursor=cursor)
+    if request.if_none_match.contains(etag):
+        return _with_cache_headers(Response(status=304), etag)
+
+    results = viewer.fetch_bookmarks(query=query, page=page, cursor=cursor)
+
+    if results.total_pages == page:
+        next_page_url = None
+    else:
+        next_page_url = _build_pagination_url(
+            desired_page=page + 1, cursor=results.next_cursor
+        )
+
+    with timing.span('render'):
+        html = render_template(
+            'index.html',
+            results=results,
+            query=query,
+            title=f'Results for “{query}”' if query else '',
+            notitle=(
+                f'No results for “{query}”' if query else 'No bookmarks found'
+            ),
+            next_page_url=next_page_url,
+            prev_page_url=_build_pagination_url(
+                desired_page=page - 1, cursor=results.prev_cursor
+            ),
+            tags=results.tags
+        )
+    return _with_cache_headers(make_response(html), etag)
+
+
+# Archived pages are third-party content, served from the viewer's origin
+# and inside the logged-in session.  The sandbox puts them in a unique
+# origin with scripts, forms and popups disabled, so they can't act with
+# the viewer's cookies; nosniff stops a file being run as something other
+# than its stored type.
+ARCHIVE_HEADERS = {
+    'Content-Security-Policy': 'sandbox',
+    'X-Content-Type-Options': 'nosniff',
+}
+
+
+@login_required
+def archived_file(b_id, name):
+    # Bookmarks archived as a single WARC can't be linked to directly in S3,
+    # so we look up the index and pull out the file with a range read.
+    location = _viewer().fetch_archive_location(b_id)
+    if location is None:
+        abort(404)
+
+    with timing.span('s3'):
+        index = _read_archive_index(**location)
+        try:
+            content_type, body = archive.read_file(
+                bucket=S3_BUCKET, key=location['key'], index=index,
+                name=name
+            )
+        except KeyError:
+            abort(404)
+
+    return Response(
+        body, content_type=content_type, headers=ARCHIVE_HEADERS
+    )
+
+
+@attr.s
+class User:
+    password = attr.ib()
+
+    is_active = True
+    is_anonymous = False
+
+    @property
+    def is_authenticated(self):
+        return self.password == current_app.config['USER_PASSWORD']
+
+    def get_id(self):
+        return 1
+
+
+def load_user(user_id):
+    return User(password=current_app.config['USER_PASSWORD'])
+
+
+class LoginForm(FlaskForm):
+    password = PasswordField('password', validators=[DataRequired()])
+
+
+def login():
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User(form.data['password'])
+        if not user.is_authenticated:
+            return abort(401)
+
+        login_user(user, remember=True, duration=dt.timedelta(days=365))
+        return redirect('/')
+    return render_template('login.html', form=form)
+
+
+@login_required
+def logout():
+    logout_user()
+    return redirect('/')
+
+
+def page_forbidden(error):
+    message = (
+        "The server could not verify that you are authorized to access the "
+        "URL requested. You either supplied the wrong credentials (e.g. a bad "
+        "password), or your browser doesn't understand how to supply the "
+        "credentials required."
+    )
+    return render_template(
+        'error.html',
+        title='401 Not Authorized',
+        message=message), 401
+
+
+def page_not_found(error):
+    message = (
+        'The requested URL was not found on the server. If you entered the '
+        'URL manually please check your spelling and try again.'
+    )
+    return render_template(
+        'error.html',
+        title='404 Not Found',
+        message=message), 404
+
+
+def init_profiling(app, profiler):
+    """Let a logged-in user profile a request by adding ``?profile=1``.
+
+    The profile is saved by ``profiler``, and its filename is sent in the
+    ``X-Profile`` header.  If the profiler is busy or rate limited, the
+    request is served as normal.
+    """
+    def start_profile():
+        if request.args.get('profile') and current_user.is_authenticated:
+            g.pincushion_profile = profiler.start()
+
+    def stop_profile(profile):
+        return profiler.stop(profile, request.endpoint or 'unmatched')
+
+    def add_profile_header(resp):
+        profile = g.pop('pincushion_profile', None)
+        if profile is not None:
+            resp.headers['X-Profile'] = stop_profile(profile)
+        return resp
+
+    # ``after_request`` is skipped if an exception propagates out of the
+    # view (e.g. in debug mode), but ``teardown_request`` always runs -- so
+    # any profile that's still going is stopped there.  Otherwise it would
+    # keep running on this thread, and block every later profile.
+    def finish_profile(exc):
+        profile = g.pop('pincushion_profile', None)
+        if profile is not None:
+            stop_profile(profile)
+
+    app.extensions['pincushion_profiler'] = profiler
+    app.before_request(start_profile)
+    app.after_request(add_profile_header)
+    app.teardown_request(finish_profile)
+
+
+def warm_up(app):
+    """Do the one-off work that would otherwise slow down the first request:
+    compiling the templates and hashing them for the ETag.
+
+    This is safe to call before forking worker processes.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    app.extensions['pincushion'].template_version()
+
+
+def warm_up_connections(app):
+    """Open a connection to Elasticsearch, so the first request doesn't
+    have to.
+
+    Connections can't be shared between processes, so call this in each
+    worker *after* it's been forked.
+    """
+    try:
+        app.extensions['pincushion'].es_session.get(
+            app.config['ES_HOST'], timeout=ES_TIMEOUT
+        )
+    except requests.exceptions.RequestException as err:
+        app.logger.warning('Unable to connect to Elasticsearch: %s', err)
+
+
+def create_app(config=None, root_path=None):
+    """Create the viewer app.
+
+    :param config: A dict of config values.  If ``None``, the config is read
+        from environment variables with ``config_from_env()``.
+    :param root_path: The directory containing ``templates`` and ``static``.
+        Defaults to the current working directory.
+
+    Build the static assets with ``build_static.py`` first.
+
+    """
+    if config is None:
+        config = config_from_env()
+
+    # We serve static files ourselves, so we can use the precompressed
+    # copies of the fingerprinted assets.
+    app = Flask(
+        __name__, root_path=root_path or os.getcwd(), static_folder=None
+    )
+    app.config.update(config)
+
+    viewer = _Viewer(app)
+    app.extensions['pincushion'] = viewer
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.user_loader(load_user)
+
+    app.jinja_env.filters['asset_url'] = viewer.asset_url
+    app.jinja_env.filters['slang_time'] = filters.slang_time
+    app.jinja_env.filters['add_tag_to_query'] = elasticsearch.add_tag_to_query
+
+    app.jinja_env.filters['custom_tag_sort'] = filters.custom_tag_sort
+    app.jinja_env.filters['description_markdown'] = (
+        filters.description_markdown)
+    app.jinja_env.filters['title_markdown'] = filters.title_markdown
+
+    app.jinja_env.filters['build_tag_cloud'] = lambda t: build_tag_cloud(
+        t, TAG_CLOUD_OPTIONS
+    )
+    app.jinja_env.filters['render_bookmark'] = viewer.render_bookmark
+
+    # The query is exposed in the <input> search box with the ``safe``
+    # filter, so HTML entities aren't escaped --- but we need to avoid
+    # closing the value attribute early.
+    app.jinja_env.filters['display_query'] = (
+        lambda q: q.replace('"', '&quot;'))
+
+    if app.config.get('PROFILE_DIR'):
+        init_profiling(app, profiling.Profiler(app.config['PROFILE_DIR']))
+
+    # With timing enabled, the slowest filters are timed as stages of their
+    # own.  When it's disabled, they're left alone, so they cost nothing.
+    if app.config.get('ENABLE_TIMING'):
+        timing.init_app(app)
+        for filter_name, stage in [
+            ('title_markdown', 'markdown'),
+            ('description_markdown', 'markdown'),
+            ('build_tag_cloud', 'tagcloud'),
+        ]:
+            app.jinja_env.filters[filter_name] = timing.timed(
+                stage, app.jinja_env.filters[filter_name]
+            )
+
+    app.add_url_rule(
+        '/static/<path:filename>', endpoint='static', view_func=static_file
+    )
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/archive/<b_id>/<path:name>', view_func=archived_file)
+    app.add_url_rule('/login', view_func=login, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', view_func=logout)
+
+    app.register_error_handler(401, page_forbidden)
+    app.register_error_handler(404, page_not_found)
+
+    warm_up(app)
+
+    return app
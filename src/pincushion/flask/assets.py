@@ -0,0 +1,104 @@
+# -*- encoding: utf-8
+"""Build the static assets for the viewer.
+
+The stylesheet is compiled once, at build time, and written with a hash
+of its contents in the filename -- so browsers can cache it forever, and
+we get a new URL whenever it changes.  Each file also gets gzip and
+Brotli-compressed copies, so the viewer doesn't have to compress it on
+every request.
+
+The hashed filenames are recorded in a manifest, which the viewer reads
+at startup.
+
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = 'manifest.json'
+
+# Compressed copies of each asset, in order of preference, as
+# (Content-Encoding, file extension).
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def compile_scss(path):
+    """Compile an SCSS file, and return the CSS."""
+    from scss.compiler import compile_file
+    return compile_file(path)
+
+
+def fingerprint(name, data):
+    """Add a hash of ``data`` to a filename, e.g. style.css becomes
+    style.0123456789ab.css.
+    """
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f'{stem}.{digest}{ext}'
+
+
+def _brotli_compress(data):
+    # Brotli is optional -- if it isn't installed, browsers get gzip.
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data)
+
+
+def write_asset(static_dir, name, data):
+    """Write a fingerprinted copy of an asset, plus compressed variants.
+
+    Returns the fingerprinted filename.
+    """
+    hashed_name = fingerprint(name, data)
+    path = os.path.join(static_dir, hashed_name)
+
+    with open(path, 'wb') as outfile:
+        outfile.write(data)
+
+    # Setting ``mtime`` (and leaving out the filename) means the same input
+    # always gives the same output.
+    with open(path + '.gz', 'wb') as outfile:
+        with gzip.GzipFile(
+            filename='', fileobj=outfile, mode='wb', compresslevel=9, mtime=0
+        ) as gzfile:
+            gzfile.write(data)
+
+    compressed = _brotli_compress(data)
+    if compressed is not None:
+        with open(path + '.br', 'wb') as outfile:
+            outfile.write(compressed)
+
+    return hashed_name
+
+
+def build_assets(asset_dir, static_dir, compile=compile_scss):
+    """Compile the stylesheet, write the fingerprinted assets, and write
+    the manifest.  Returns the manifest.
+    """
+    css = compile(os.path.join(asset_dir, 'style.scss'))
+
+    manifest = {
+        'style.css': write_asset(static_dir, 'style.css', css.encode('utf8')),
+    }
+
+    with open(os.path.join(static_dir, MANIFEST_NAME), 'w') as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Read the manifest written by ``build_assets``.
+
+    If the assets haven't been built, this returns an empty dict.
+    """
+    try:
+        with open(os.path.join(static_dir, MANIFEST_NAME)) as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return {}
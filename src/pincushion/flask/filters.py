@@ -1,7 +1,10 @@
 # -*- encoding: utf-8
 
+import datetime as dt
 import functools
 import re
+import threading
+import time
 
 import markdown
 from markdown.extensions import Extension
@@ -19,21 +22,52 @@ def title_markdown(md):
     if md.startswith('#'):
         md = f'\\{md}'
 
-    res = markdown.markdown(md, extensions=[SmartyExtension()])
+    res = _render_markdown('title', md)
     return res.replace('<p>', '').replace('</p>', '')
 
 
+AUTOLINK_REGEX = re.compile(r'https?://[^\s]+')
+
+
+def _wrap_url(match):
+    return f'<{match.group(0)}>'
+
+
 class AutoLinkPreprocessor(Preprocessor):
     """
     Preprocessor that converts anything that looks like a URL into a link.
     """
     def run(self, lines):
-        new_lines = []
-        for line in lines:
-            for u in re.findall(r'(https?://[^\s]+?)(?:\s|$)', line):
-                line = line.replace(u, f'<{u}>')
-            new_lines.append(line)
-        return new_lines
+        if not lines:
+            return lines
+
+        # A URL can't contain a newline, so we can do every line in one go.
+        text = '\n'.join(lines)
+        return AUTOLINK_REGEX.sub(_wrap_url, text).split('\n')
+
+
+BLOCKQUOTE_REGEX = re.compile(r'<blockquote>([^<]+?)</blockquote>')
+
+
+def _blockquote_to_markdown(match):
+    bq_inner = match.group(1)
+    bq_md_lines = []
+
+    # We need to preserve line breaks in the original Markdown --
+    # even if it's a non-standard part of the HTML spec, it's what
+    # the Pinboard website does.
+    inner_lines = bq_inner.strip().splitlines()
+    for i, line in enumerate(inner_lines):
+        if i == len(inner_lines) - 1:
+            bq_md_lines.append(f'> {line}')
+        else:
+            if inner_lines[i + 1].strip():
+                bq_md_lines.append(f'> {line}  ')
+            else:
+                bq_md_lines.append(f'> {line}')
+
+    bq_md = '\n'.join(bq_md_lines)
+    return '\n\n' + bq_md + '\n\n'
 
 
 class BlockquotePreprocessor(Preprocessor):
@@ -42,28 +76,7 @@ class BlockquotePreprocessor(Preprocessor):
     """
     def run(self, lines):
         text = '\n'.join(lines)
-        blockquotes = re.findall(r'<blockquote>(?:[^<]+?)</blockquote>', text)
-        for bq_html in blockquotes:
-            bq_inner = bq_html[len('<blockquote>'):-len('</blockquote>')]
-            bq_md_lines = []
-
-            # We need to preserve line breaks in the original Markdown --
-            # even if it's a non-standard part of the HTML spec, it's what
-            # the Pinboard website does.
-            inner_lines = bq_inner.strip().splitlines()
-            for i, line in enumerate(inner_lines):
-                if i == len(inner_lines) - 1:
-                    bq_md_lines.append(f'> {line}')
-                else:
-                    if inner_lines[i + 1].strip():
-                        bq_md_lines.append(f'> {line}  ')
-                    else:
-                        bq_md_lines.append(f'> {line}')
-
-            bq_md = '\n'.join(bq_md_lines)
-
-            text = text.replace(bq_html, '\n\n' + bq_md + '\n\n')
-        return text.splitlines()
+        return BLOCKQUOTE_REGEX.sub(_blockquote_to_markdown, text).splitlines()
 
 
 class PincushionExtension(Extension):
@@ -81,24 +94,46 @@ class PincushionExtension(Extension):
         )
 
 
-def description_markdown(md):
-    """Renders a Markdown string as HTML for use in a bookmark description."""
-    return markdown.markdown(md, extensions=[
-        SmartyExtension(),
-        PincushionExtension()
-    ]).replace('\n</p>', '</p>')
+# Building a Markdown instance means setting up the whole processing
+# pipeline, which is expensive -- so each thread keeps one instance of each
+# kind, and resets it between documents.
+_MARKDOWN_EXTENSIONS = {
+    'title': lambda: [SmartyExtension()],
+    'description': lambda: [SmartyExtension(), PincushionExtension()],
+}
 
+_local = threading.local()
+
+
+def _markdown_instance(kind):
+    renderers = _local.__dict__.setdefault('renderers', {})
+    try:
+        return renderers[kind]
+    except KeyError:
+        renderers[kind] = markdown.Markdown(
+            extensions=_MARKDOWN_EXTENSIONS[kind]()
+        )
+        return renderers[kind]
 
-def cmp(x, y):
-    """
-    Replacement for built-in function cmp that was removed in Python 3
 
-    Compare the two objects x and y and return an integer according to
-    the outcome. The return value is negative if x < y, zero if x == y
-    and strictly positive if x > y.
+@functools.lru_cache(maxsize=4096)
+def _render_markdown(kind, md):
+    """Renders a Markdown string as HTML.
+
+    The same bookmarks get rendered over and over again, so results are
+    memoised on the source text.
+
     """
-    # Taken from http://portingguide.readthedocs.io/en/latest/comparisons.html
-    return (x > y) - (x < y)
+    renderer = _markdown_instance(kind)
+    try:
+        return renderer.convert(md)
+    finally:
+        renderer.reset()
+
+
+def description_markdown(md):
+    """Renders a Markdown string as HTML for use in a bookmark description."""
+    return _render_markdown('description', md).replace('\n</p>', '</p>')
 
 
 WC_TAG_REGEX = re.compile(
@@ -109,48 +144,144 @@ WC_TAG_REGEX = re.compile(
     r')$')
 
 
+@functools.lru_cache(maxsize=4096)
+def _tag_sort_key(tag):
+    """Returns the key used to sort a tag in ``custom_tag_sort``.
+
+    Most tags sort alphabetically, but word count tags like 'wc:<1k' or
+    'wc:1k-5k' sort so they form a neatly ascending set of word counts.
+    Every tag starting 'wc:' sorts to the same place alphabetically, so
+    we can give them a key that compares equal on 'wc:', then puts them
+    in order by the word count.
+
+    """
+    match = WC_TAG_REGEX.match(tag)
+    if match is None:
+        return (tag,)
+
+    # e.g. wc:<1k sorts before wc:1k-5k
+    if match.group('upper_open') is not None:
+        return ('wc:', int(match.group('upper_open')), 0)
+    else:
+        return ('wc:', int(match.group('lower_closed')), 1)
+
+
 def custom_tag_sort(tags):
     """Sorts my tags, but does so in a slightly non-standard way that's
     more pleasing for my use.
     """
-    def _comparator(x, y):
-        # If we see a word count tag like 'wc:<1k' or 'wc:1k-5k', sort them
-        # so they form a neatly ascending set of word counts.
-        if x.startswith('wc:') and y.startswith('wc:'):
-            match_x = WC_TAG_REGEX.match(x)
-            match_y = WC_TAG_REGEX.match(y)
-            assert match_x is not None
-            assert match_y is not None
-
-            # Here '_interval' is one of 'upper_open' or 'lower_closed', and
-            # '_value' is the corresponding integer value.
-            x_interval, x_value = list({
-                k: int(v)
-                for k, v in match_x.groupdict().items()
-                if v is not None}.items())[0]
-            y_interval, y_value = list({
-                k: int(v)
-                for k, v in match_y.groupdict().items()
-                if v is not None}.items())[0]
-
-            # If they're the same type of interval, it's enough to compare
-            # the corresponding values.
-            #
-            # e.g. X = wc:1k-5k and Y = wc:5k-10k
-            if x_interval == y_interval:
-                return cmp(x_value, y_value)
-
-            # e.g. X = wc:<1k and Y = wc:1k-5k
-            elif x_interval == 'upper_open':
-                return cmp(x_value, y_value) or -1
-
-            # e.g. X = 1k-5k and Y = wc:<1k
-            elif x_interval == 'lower_closed':
-                return cmp(x_value, y_value) or 1
+    return sorted(tags, key=_tag_sort_key)
+
+
+PINBOARD_TIME_REGEX = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})Z$'
+)
+
+
+def _parse_pinboard_time(d):
+    """Parses a timestamp in the format used by Pinboard, which is always
+    ISO 8601 in UTC, e.g. ``2017-12-26T10:15:21Z``.
+    """
+    match = PINBOARD_TIME_REGEX.match(d)
+    if match is None:
+        raise ValueError(f"Unrecognised timestamp: {d!r}")
+    return dt.datetime(*(int(g) for g in match.groups()))
+
+
+def _plural(count, singular):
+    return f'{count} {singular}' if count == 1 else f'{count} {singular}s'
+
+
+def _natural_seconds(seconds):
+    """Describes a delta of less than a day, given in seconds."""
+    if seconds == 0:
+        return 'a moment'
+    elif seconds == 1:
+        return 'a second'
+    elif seconds < 60:
+        return _plural(seconds, 'second')
+    elif seconds < 120:
+        return 'a minute'
+    elif seconds < 3600:
+        return _plural(seconds // 60, 'minute')
+    elif seconds < 3600 * 2:
+        return 'an hour'
+    else:
+        return _plural(seconds // 3600, 'hour')
+
+
+def _natural_days(days, months):
+    """Describes a delta of at least a day, but less than a year."""
+    if days == 1:
+        return 'a day'
+    elif not months:
+        return _plural(days, 'day')
+    elif months == 1:
+        return 'a month'
+    else:
+        return _plural(months, 'month')
+
+
+def _natural_years(years, days, months):
+    """Describes a delta of a year or more."""
+    if years > 1:
+        return _plural(years, 'year')
+    elif not months and not days:
+        return 'a year'
+    elif not months:
+        return f'1 year, {_plural(days, "day")}'
+    else:
+        return f'1 year, {_plural(months, "month")}'
 
-            else:
-                assert False  # Unreachable
 
-        return cmp(x, y)
+def _natural_delta(delta):
+    """Describes a (positive) timedelta in words.
 
-    return sorted(tags, key=functools.cmp_to_key(_comparator))
+    This is the algorithm used by ``humanize.naturaldelta``, which is what
+    we used to get through maya.  Months are 30.5 days, and years are 365.
+    """
+    years = delta.days // 365
+    days = delta.days % 365
+    months = int(days // 30.5)
+
+    if not years and days < 1:
+        return _natural_seconds(delta.seconds)
+    elif years == 0:
+        return _natural_days(days, months)
+    else:
+        return _natural_years(years, days, months)
+
+
+def _slang_time(d, now):
+    then = _parse_pinboard_time(d)
+    if then > now:
+        description = _natural_delta(then - now)
+        tense = '%s from now'
+    else:
+        description = _natural_delta(now - then)
+        tense = '%s ago'
+
+    if description == 'a moment':
+        return 'now'
+    return tense % description
+
+
+# Relative times are calculated against the end of a one-minute window,
+# so every bookmark rendered in the same minute can share the result.
+SLANG_TIME_BUCKET = 60
+
+
+@functools.lru_cache(maxsize=8192)
+def _cached_slang_time(d, bucket):
+    now = dt.datetime.utcfromtimestamp((bucket + 1) * SLANG_TIME_BUCKET)
+    return _slang_time(d, now=now)
+
+
+def slang_time(d):
+    """Describes a Pinboard timestamp relative to now, e.g. "3 days ago".
+
+    This gives the same output as ``maya.parse(d).slang_time()``, but
+    without the cost of maya's general-purpose date parsing.
+
+    """
+    return _cached_slang_time(d, int(time.time() // SLANG_TIME_BUCKET))
@@ -0,0 +1,125 @@
+# -*- encoding: utf-8
+"""Cache rendered HTML fragments, so we don't re-render the same bookmark
+every time it appears on a page.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from pincushion.cache import TTLCache
+
+
+def fragment_key(*parts):
+    """Build a cache key from some JSON-serialisable data.
+
+    Put everything the fragment depends on into ``parts`` -- if any of it
+    changes, so does the key, so we never need to invalidate anything.
+    """
+    data = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+
+class FragmentCache:
+    """Two-tier cache for rendered fragments.
+
+    Fragments are kept in an in-memory LRU cache.  If ``directory`` is set,
+    they're also written to disk, so they can be shared between processes
+    (e.g. several gunicorn workers) and survive a restart.
+
+    Keys change whenever a fragment does -- including its "N days ago"
+    text -- so old files pile up.  Every ``prune_interval`` writes, the
+    least recently used files are deleted until the directory is back
+    under ``max_bytes``.  It's also safe to clear out the directory at
+    any time.
+
+    """
+    def __init__(
+        self, maxsize, directory=None, max_bytes=100 * 1024 * 1024,
+        prune_interval=100
+    ):
+        self._memory = TTLCache(maxsize=maxsize, ttl=float('inf'))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._memory)
+
+    def get_or_render(self, key, render):
+        """Return the fragment for ``key``, or call ``render()`` to
+        create it.
+        """
+        return self._memory.get_or_compute(
+            key, lambda: self._read_or_render(key, render)
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.html')
+
+    def _read_or_render(self, key, render):
+        if self.directory is None:
+            return render()
+
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf8') as infile:
+                html = infile.read()
+
+            # Mark the file as recently used, so it's pruned last.
+            os.utime(path)
+            return html
+        except FileNotFoundError:
+            pass
+
+        html = render()
+
+        # Write to a temporary file and move it into place, so another
+        # process never sees a half-written fragment.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf8') as outfile:
+            outfile.write(html)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            should_prune = (self._writes % self.prune_interval == 0)
+        if should_prune:
+            self.prune()
+
+        return html
+
+    def prune(self):
+        """Delete the least recently used fragments on disk, until they
+        take up no more than ``max_bytes``.
+
+        Other processes may be pruning at the same time, so files can
+        disappear from under us.
+        """
+        fragments = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                # Skip in-progress writes from other processes.
+                if not name.endswith('.html'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                fragments.append((stat.st_mtime, path, stat.st_size))
+
+        total = sum(size for _, _, size in fragments)
+        for _, path, size in sorted(fragments):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
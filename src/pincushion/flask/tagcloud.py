@@ -5,55 +5,22 @@ Based on https://github.com/addywaddy/jquery.tagcloud.js, ported to Python.
 
 """
 
-import attr
-
-
-@attr.s
-class _HexColour:
-    red = attr.ib()
-    green = attr.ib()
-    blue = attr.ib()
-
-    @property
-    def ashex(self):
-        return '#%02x%02x%02x' % (
-            int(self.red), int(self.green), int(self.blue))
+import functools
 
-    def __add__(self, other):
-        assert isinstance(other, _HexColour)
-        return _HexColour(
-            red=(self.red + other.red),
-            green=(self.green + other.green),
-            blue=(self.blue + other.blue)
-        )
-
-    def __mul__(self, other):
-        assert isinstance(other, int)
-        return _HexColour(
-            red=(self.red * other),
-            green=(self.green * other),
-            blue=(self.blue * other)
-        )
+import attr
 
 
 def _hex_colour(c):
+    """Parse a colour like ``#bd450b`` into a ``(red, green, blue)`` tuple."""
     c = c.lstrip('#')
     assert len(c) == 6
     red = int(c[0:2], 16)
     green = int(c[2:4], 16)
     blue = int(c[4:6], 16)
-    return _HexColour(red=red, green=green, blue=blue)
-
+    return (red, green, blue)
 
-def _colour_increment(colr_start, colr_end, weight_range):
-    return _HexColour(
-        red=(colr_start.red - colr_end.red) / weight_range,
-        green=(colr_start.green - colr_end.green) / weight_range,
-        blue=(colr_start.blue - colr_end.blue) / weight_range,
-    )
 
-
-@attr.s
+@attr.s(frozen=True)
 class TagcloudOptions:
     size_start = attr.ib()
     size_end = attr.ib()
@@ -62,20 +29,54 @@ class TagcloudOptions:
     colr_end = attr.ib(convert=_hex_colour)
 
 
-@attr.s
+# Entries are cached and shared between tag clouds, so they're immutable.
+@attr.s(slots=True, frozen=True)
 class TagcloudEntry:
     size = attr.ib()
     colr = attr.ib()
 
 
-def build_tag_cloud(counter, options):
-    """Get the font/size for every element in ``counter`` for rendering
-    a tag cloud.
-    """
-    if not counter:
-        return {}
+class _Ramp:
+    """The sizes and colours for every weighting in ``0..weight_range``.
 
-    weights = counter.values()
+    Entries are filled in the first time they're looked up, so a large
+    weight range doesn't cost anything for the weightings we never see.
+
+    """
+    def __init__(self, options, weight_range):
+        self.size_start = options.size_start
+        self.font_incr = (options.size_end - options.size_start) / weight_range
+        self.colr_start = options.colr_start
+        self.colr_incr = tuple(
+            (end - start) / weight_range
+            for start, end in zip(options.colr_start, options.colr_end)
+        )
+        self._entries = {}
+
+    def __getitem__(self, weighting):
+        entry = self._entries.get(weighting)
+        if entry is None:
+            r, g, b = self.colr_start
+            r_incr, g_incr, b_incr = self.colr_incr
+            entry = self._entries[weighting] = TagcloudEntry(
+                size=self.size_start + self.font_incr * weighting,
+                colr='#%02x%02x%02x' % (
+                    int(r + r_incr * weighting),
+                    int(g + g_incr * weighting),
+                    int(b + b_incr * weighting),
+                )
+            )
+        return entry
+
+
+@functools.lru_cache(maxsize=64)
+def _ramp(options, weight_range):
+    return _Ramp(options, weight_range)
+
+
+@functools.lru_cache(maxsize=256)
+def _build_tag_cloud(items, options):
+    weights = [w for _, w in items]
     weight_min = min(weights)
     weight_max = max(weights)
 
@@ -83,16 +84,17 @@ def build_tag_cloud(counter, options):
     if weight_range == 0:
         weight_range = 1
 
-    font_incr = (options.size_end - options.size_start) / weight_range
-    colr_incr = _colour_increment(
-        options.colr_end, options.colr_start, weight_range=weight_range
-    )
+    ramp = _ramp(options, weight_range)
+    return {label: ramp[weight - weight_min] for label, weight in items}
+
 
-    result = {}
-    for label, weight in counter.items():
-        weighting = weight - weight_min
-        font_size = options.size_start + font_incr * weighting
-        font_colr = options.colr_start + colr_incr * weighting
-        result[label] = TagcloudEntry(size=font_size, colr=font_colr.ashex)
+def build_tag_cloud(counter, options):
+    """Get the font/size for every element in ``counter`` for rendering
+    a tag cloud.
+
+    The result is cached, so callers shouldn't modify it.
+    """
+    if not counter:
+        return {}
 
-    return result
+    return _build_tag_cloud(tuple(counter.items()), options)
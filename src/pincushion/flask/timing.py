@@ -0,0 +1,214 @@
+# -*- encoding: utf-8
+"""Time the stages of each request to the viewer.
+
+With timing enabled, each request records how long it spends in each
+stage -- Elasticsearch, markdown, the tag cloud, rendering the templates.
+The times are sent back in a ``Server-Timing`` header (which browsers show
+in their dev tools), and collected into latency histograms that are served
+at ``/metrics`` in the Prometheus text format.  Like the rest of the viewer,
+``/metrics`` needs you to log in.
+
+With timing disabled, nothing is hooked up, and ``span()`` returns a shared
+no-op context manager -- so the instrumented code does almost no extra
+work.
+
+The histograms live in memory, so under gunicorn each worker keeps (and
+serves) its own.
+
+"""
+
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+from flask import g, request, Response
+from flask_login import login_required
+
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+# Each metric is a histogram, with a single label.
+METRICS = {
+    'pincushion_request_duration_seconds': (
+        'endpoint', 'Time taken to handle a request.'
+    ),
+    'pincushion_stage_duration_seconds': (
+        'stage', 'Time spent in each stage of a request.'
+    ),
+}
+
+
+class _NoSpan:
+    """A context manager that does nothing, for when timing is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, like a Prometheus
+    histogram.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.sum = 0.0
+        self._counts = [0] * (len(buckets) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def cumulative_counts(self):
+        """Returns a list of (upper bound, number of observations <= that
+        bound), ending with +Inf.
+        """
+        bounds = [str(b) for b in self.buckets] + ['+Inf']
+        totals = []
+        running = 0
+        for c in self._counts:
+            running += c
+            totals.append(running)
+        return list(zip(bounds, totals))
+
+
+class Metrics:
+    """The histograms for every metric in ``METRICS``, keyed by label."""
+
+    def __init__(self):
+        self._histograms = {name: {} for name in METRICS}
+        self._lock = threading.Lock()
+
+    def observe(self, name, label, value):
+        histograms = self._histograms[name]
+        try:
+            histogram = histograms[label]
+        except KeyError:
+            with self._lock:
+                histogram = histograms.setdefault(label, Histogram())
+        histogram.observe(value)
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (label_name, help_text) in sorted(METRICS.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for label, histogram in sorted(self._histograms[name].items()):
+                label = f'{label_name}="{label}"'
+                for bound, total in histogram.cumulative_counts():
+                    lines.append(
+                        f'{name}_bucket{{{label},le="{bound}"}} {total}'
+                    )
+                lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """Adds up the time spent in each stage of a single request."""
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.start = clock()
+        self.spans = {}
+
+    def elapsed(self):
+        return self._clock() - self.start
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            duration = self._clock() - start
+            self.spans[name] = self.spans.get(name, 0) + duration
+
+    def server_timing(self, total):
+        """Returns the value of a ``Server-Timing`` header, with durations
+        in milliseconds.
+        """
+        entries = list(self.spans.items()) + [('total', total)]
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}' for name, duration in entries
+        )
+
+
+def span(name):
+    """Time a block of code as part of the stage ``name``.
+
+    If a stage is entered more than once in a request, the times are added.
+    Outside a timed request, this does nothing.
+    """
+    timer = g.get('pincushion_timer')
+    if timer is None:
+        return _NO_SPAN
+    return timer.span(name)
+
+
+def timed(name, func):
+    """Wrap ``func`` so that every call is timed as part of stage ``name``."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app):
+    """Time every request to ``app``, and serve the histograms at
+    ``/metrics``.  Returns the ``Metrics``.
+    """
+    metrics = Metrics()
+
+    def start_timer():
+        g.pincushion_timer = RequestTimer()
+
+    def record_timings(resp):
+        timer = g.pop('pincushion_timer')
+        total = timer.elapsed()
+        resp.headers['Server-Timing'] = timer.server_timing(total)
+
+        metrics.observe(
+            'pincushion_request_duration_seconds',
+            request.endpoint or 'unmatched',
+            total
+        )
+        for name, duration in timer.spans.items():
+            metrics.observe(
+                'pincushion_stage_duration_seconds', name, duration
+            )
+        return resp
+
+    # The endpoint names and latencies say a fair bit about what's been
+    # looked at, so they're only shown to the logged-in user, like
+    # everything else in the viewer.
+    @login_required
+    def serve_metrics():
+        return Response(
+            metrics.render(), content_type='text/plain; version=0.0.4'
+        )
+
+    app.before_request(start_timer)
+    app.after_request(record_timings)
+    app.add_url_rule('/metrics', endpoint='metrics', view_func=serve_metrics)
+
+    app.extensions['pincushion_metrics'] = metrics
+    return metrics
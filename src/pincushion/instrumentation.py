@@ -0,0 +1,256 @@
+# -*- encoding: utf-8
+"""Record how long each stage of a sync run takes, and how much it does.
+
+Each script wraps its stages in ``report.stage(name)``, and counts the
+items and bytes it handles.  At the end of the run, the report is printed,
+and optionally saved:
+
+*   ``PINCUSHION_REPORT_DIR`` -- a JSON report is written here, one file
+    per run.
+*   ``PINCUSHION_TEXTFILE_DIR`` -- the numbers are written here in the
+    Prometheus text format, for node_exporter's textfile collector.  This
+    file is overwritten by each run.
+*   ``PINCUSHION_PROFILE_DIR`` -- the whole run is profiled, and the
+    profile is saved here (see ``pincushion.profiling``).  cProfile only
+    sees the thread that started it, so work in a thread pool is only
+    included if it's wrapped in ``report.profile_thread()``.
+
+A stage can be entered many times (e.g. once per page), and from several
+threads at once -- the times are added together, so a stage run in
+parallel can take longer than the run itself.
+
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import tempfile
+import threading
+import time
+
+import attr
+
+from pincushion.profiling import Profiler
+
+
+@attr.s
+class Stage:
+    name = attr.ib()
+    calls = attr.ib(default=0)
+    seconds = attr.ib(default=0.0)
+    items = attr.ib(default=0)
+    bytes = attr.ib(default=0)
+
+    def add(self, items=0, bytes=0):
+        self.items += items
+        self.bytes += bytes
+
+    def rate(self, n):
+        return n / self.seconds if self.seconds else 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'seconds': round(self.seconds, 6),
+            'items': self.items,
+            'bytes': self.bytes,
+            'items_per_second': round(self.rate(self.items), 3),
+            'bytes_per_second': round(self.rate(self.bytes), 3),
+        }
+
+
+def _utc_timestamp(t, fmt):
+    return time.strftime(fmt, time.gmtime(t))
+
+
+def _write_atomically(path, text):
+    # The textfile collector might read the file at any moment, so we
+    # never leave a half-written copy in place.
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as outfile:
+        outfile.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunReport:
+    """Timings and counts for each stage of a single run of ``script``.
+
+    Use it as a context manager: the report is finished (and written) when
+    the block exits, and records whether the run succeeded.
+
+    :param script: Name of the script, e.g. ``indexer``.
+    :param report_dir: If set, write a JSON report to this directory.
+    :param textfile_dir: If set, write Prometheus metrics to this directory.
+    :param out: File to print the summary to.  Defaults to stdout.
+    :param profiler: If set, a ``Profiler`` to profile the whole run with.
+
+    """
+    def __init__(
+        self, script, report_dir=None, textfile_dir=None,
+        clock=time.perf_counter, wall_clock=time.time, out=None,
+        profiler=None
+    ):
+        self.script = script
+        self.report_dir = report_dir
+        self.textfile_dir = textfile_dir
+        self.stages = {}
+        self.succeeded = None
+        self.duration = None
+        self.profiler = profiler
+        self.profile = None
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._out = out
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_profiles = []
+
+    @classmethod
+    def from_env(cls, script):
+        return cls(
+            script=script,
+            report_dir=os.environ.get('PINCUSHION_REPORT_DIR'),
+            textfile_dir=os.environ.get('PINCUSHION_TEXTFILE_DIR'),
+            profiler=Profiler.from_env()
+        )
+
+    def __enter__(self):
+        self.started_at = self._wall_clock()
+        self._start = self._clock()
+        self._profile = (
+            self.profiler.start() if self.profiler is not None else None
+        )
+        self._main_thread = threading.get_ident()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(succeeded=exc_type is None)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a block of code as part of stage ``name``.
+
+        Yields a ``Stage``, whose ``add()`` method counts the items and
+        bytes handled in this block.
+        """
+        counts = Stage(name)
+        start = self._clock()
+        try:
+            yield counts
+        finally:
+            elapsed = self._clock() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, Stage(name))
+                stage.calls += 1
+                stage.seconds += elapsed
+                stage.add(items=counts.items, bytes=counts.bytes)
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        """Include a block of code run in another thread (e.g. a worker in
+        a thread pool) in the profile of the run.
+
+        Each thread gets its own profile, which is merged into the run's
+        profile at the end.  This does nothing if the run isn't being
+        profiled, or if it's called from the thread that started the run.
+        """
+        if self._profile is None or threading.get_ident() == self._main_thread:
+            yield
+            return
+
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def to_dict(self):
+        return {
+            'script': self.script,
+            'started_at': _utc_timestamp(
+                self.started_at, '%Y-%m-%dT%H:%M:%SZ'
+            ),
+            'duration': round(self.duration, 6),
+            'succeeded': self.succeeded,
+            'profile': self.profile,
+            'stages': [s.to_dict() for s in self.stages.values()],
+        }
+
+    def to_prometheus(self):
+        labels = f'script="{self.script}"'
+        lines = [
+            '# TYPE pincushion_sync_last_run_timestamp_seconds gauge',
+            f'pincushion_sync_last_run_timestamp_seconds{{{labels}}} '
+            f'{self.started_at}',
+            '# TYPE pincushion_sync_duration_seconds gauge',
+            f'pincushion_sync_duration_seconds{{{labels}}} {self.duration}',
+            '# TYPE pincushion_sync_success gauge',
+            f'pincushion_sync_success{{{labels}}} {int(self.succeeded)}',
+        ]
+        for field in ('seconds', 'items', 'bytes'):
+            name = f'pincushion_sync_stage_{field}'
+            lines.append(f'# TYPE {name} gauge')
+            for stage in self.stages.values():
+                lines.append(
+                    f'{name}{{{labels},stage="{stage.name}"}} '
+                    f'{getattr(stage, field)}'
+                )
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """A table of the stages, for printing at the end of a run."""
+        lines = [f'{self.script}: finished in {self.duration:.1f}s']
+        if self.profile is not None:
+            lines.append(f'  profile written to {self.profile}')
+        for stage in self.stages.values():
+            line = (
+                f'  {stage.name:<16} {stage.seconds:9.2f}s '
+                f'{stage.calls:7d} calls {stage.items:8d} items'
+            )
+            if stage.items:
+                line += f' ({stage.rate(stage.items):.1f}/s)'
+            if stage.bytes:
+                line += f' {stage.bytes / 1024 / 1024:.1f} MB'
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def finish(self, succeeded=True):
+        """Record the end of the run, print a summary, and write the
+        report files.
+        """
+        self.duration = self._clock() - self._start
+        self.succeeded = succeeded
+
+        if self._profile is not None:
+            self.profile = os.path.join(
+                self.profiler.directory,
+                self.profiler.stop(
+                    self._profile, self.script, others=self._thread_profiles
+                )
+            )
+
+        print(self.summary(), file=self._out)
+
+        if self.report_dir is not None:
+            os.makedirs(self.report_dir, exist_ok=True)
+            timestamp = _utc_timestamp(self.started_at, '%Y%m%dT%H%M%SZ')
+            path = os.path.join(
+                self.report_dir, f'{self.script}-{timestamp}.json'
+            )
+            with open(path, 'w') as outfile:
+                json.dump(self.to_dict(), outfile, indent=2)
+
+        if self.textfile_dir is not None:
+            name = f'pincushion_{self.script}.prom'
+            _write_atomically(
+                os.path.join(self.textfile_dir, name), self.to_prometheus()
+            )
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8
+"""Check whether the URLs of my bookmarks still work."""
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """Spaces out requests so that we wait at least ``interval`` seconds
+    between starting requests to the same host.
+
+    Slots are handed out in order, so threads waiting on a busy host don't
+    hold up threads that want a different host.
+
+    """
+    def __init__(self, interval, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            self._sleep(slot - now)
+
+
+def _now():
+    return dt.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def check_url(sess, url, timeout=30):
+    """Check whether a URL is still alive.
+
+    We try a HEAD request first, because it's cheap -- but plenty of servers
+    don't implement HEAD properly, so we retry with a GET before deciding
+    the link is dead.
+
+    Returns a dict with the status code, the URL we ended up at after
+    any redirects, and when the check was made.
+
+    """
+    # requests is slow to import, so we only load it when we need it.
+    import requests
+
+    result = {'checked_at': _now()}
+
+    try:
+        resp = sess.head(url, allow_redirects=True, timeout=timeout)
+        if resp.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=resp)
+    except requests.exceptions.RequestException:
+        try:
+            # We only care about the status, so don't download the body.
+            resp = sess.get(
+                url, allow_redirects=True, timeout=timeout, stream=True
+            )
+            resp.close()
+        except requests.exceptions.RequestException as err:
+            result.update({
+                'status': None,
+                'ok': False,
+                'final_url': None,
+                'error': type(err).__name__,
+            })
+            return result
+
+    result.update({
+        'status': resp.status_code,
+        'ok': resp.status_code < 400,
+        'final_url': resp.url,
+    })
+    return result
+
+
+def interleave_by_host(urls):
+    """Reorder a list of URLs so that consecutive URLs are on different
+    hosts where possible.
+
+    This stops the worker pool getting stuck behind the rate limit for a
+    single host that appears lots of times in a row.
+
+    """
+    by_host = {}
+    for u in urls:
+        by_host.setdefault(urlparse(u).netloc, []).append(u)
+
+    queues = list(by_host.values())
+    result = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        result.extend(q[i] for q in queues if i < len(q))
+    return result
+
+
+def check_urls(sess, urls, workers, limiter, timeout=30, report=None):
+    """Check a collection of URLs concurrently.
+
+    Yields ``(url, result)`` pairs, in the same order as ``urls``.
+
+    If ``report`` is a ``RunReport``, each check is timed as part of the
+    ``check_url`` stage, and the workers are included in its profile.
+
+    """
+    def _check(url):
+        limiter.wait(url)
+        if report is None:
+            return url, check_url(sess, url, timeout=timeout)
+
+        with report.profile_thread(), report.stage('check_url') as stage:
+            stage.add(items=1)
+            return url, check_url(sess, url, timeout=timeout)
+
+    with ThreadPoolExecutor(workers) as executor:
+        yield from executor.map(_check, urls)
+
+
+def check_bookmarks(
+    sess, bookmarks, workers, limiter, timeout=30, report=None
+):
+    """Check the URL of every bookmark in ``bookmarks``, a dict of the form
+    ``{<id>: <bookmark_metadata>, ...}``, and store the result on each
+    bookmark as ``_link``.
+
+    Yields ``(url, result)`` pairs as each URL is checked.  Bookmarks that
+    share a URL only get checked once.
+
+    """
+    by_url = {}
+    for bookmark in bookmarks.values():
+        by_url.setdefault(bookmark['href'], []).append(bookmark)
+
+    # Interleave hosts, so the workers aren't all stuck waiting on the
+    # rate limit for whichever site I've bookmarked most.
+    results = check_urls(
+        sess,
+        urls=interleave_by_host(list(by_url)),
+        workers=workers,
+        limiter=limiter,
+        timeout=timeout,
+        report=report
+    )
+
+    for url, result in results:
+        for bookmark in by_url[url]:
+            bookmark['_link'] = result
+        yield url, result
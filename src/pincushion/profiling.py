@@ -0,0 +1,113 @@
+# -*- encoding: utf-8
+"""Profile a single viewer request, or a whole run of a script, on demand.
+
+Profiling is off unless ``PINCUSHION_PROFILE_DIR`` is set.  When it is:
+
+*   The sync scripts profile the whole run (see ``RunReport``).
+*   The viewer profiles any request from a logged-in user with
+    ``?profile=1`` in the URL, and names the profile in an ``X-Profile``
+    response header.
+
+Profiles are written with cProfile, in the ``.prof`` format that
+``pstats``, snakeviz and friends can read.
+
+So that profiling can be left switched on, at most one profile is taken
+at a time, there's a minimum interval between profiles, and the oldest
+profiles are deleted when the directory grows past a size limit.
+
+"""
+
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+
+class Profiler:
+    """Takes rate-limited profiles, and saves them to ``directory``.
+
+    :param directory: Directory to write profiles to.  It's created if
+        necessary.
+    :param min_interval: Minimum number of seconds between the start of
+        one profile and the next.
+    :param max_bytes: Total size of the profiles to keep.  When a new
+        profile takes the directory past this, the oldest are deleted --
+        but the newest profile is always kept.
+
+    """
+    def __init__(
+        self, directory, min_interval=60, max_bytes=100 * 1024 * 1024,
+        clock=time.monotonic
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.min_interval = min_interval
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._last_start = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Returns a ``Profiler`` if ``PINCUSHION_PROFILE_DIR`` is set,
+        or None if it isn't.
+        """
+        directory = os.environ.get('PINCUSHION_PROFILE_DIR')
+        if directory is None:
+            return None
+        return cls(directory)
+
+    def start(self):
+        """Start profiling the current thread, if the rate limit allows.
+
+        Returns a ``cProfile.Profile`` to pass to :meth:`stop`, or None
+        if we can't profile right now.
+        """
+        with self._lock:
+            now = self._clock()
+            if self._running or (
+                self._last_start is not None and
+                now - self._last_start < self.min_interval
+            ):
+                return None
+            self._running = True
+            self._last_start = now
+
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, name, others=()):
+        """Stop a profile, and save it.  Returns the filename.
+
+        ``others`` are finished profiles of other threads, which are
+        merged into the saved profile.
+        """
+        profile.disable()
+        try:
+            filename = f'{name}-{int(time.time() * 1000)}-{os.getpid()}.prof'
+            path = os.path.join(self.directory, filename)
+            pstats.Stats(profile, *others).dump_stats(path)
+            self._prune(keep=path)
+        finally:
+            with self._lock:
+                self._running = False
+        return filename
+
+    def _prune(self, keep):
+        # Delete the oldest profiles until we're under the size limit --
+        # but never the one we've just written.
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.prof') and entry.path != keep:
+                stat = entry.stat()
+                profiles.append((stat.st_mtime, entry.path, stat.st_size))
+
+        total = os.path.getsize(keep) + sum(size for _, _, size in profiles)
+        for _, path, size in sorted(profiles):
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
@@ -0,0 +1,61 @@
+# -*- encoding: utf-8
+"""Decide whether an archived page has changed since we last saw it.
+
+For every archived bookmark we keep a set of validators: the ETag and
+Last-Modified headers from the server, and a hash of the body.  When we
+come back to a page, we send a conditional request -- if the server says
+it's unchanged (304), or the body hashes to the same value, there's no
+need to archive it again.
+
+"""
+
+import hashlib
+
+
+def content_hash(body):
+    """Returns a hash of a response body, for spotting unchanged pages."""
+    return hashlib.sha256(body).hexdigest()
+
+
+def conditional_headers(validators):
+    """Returns the headers for a conditional GET, given the validators
+    stored with a bookmark.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def check_for_changes(sess, url, validators, timeout=30):
+    """Fetch a page, and work out if it has changed.
+
+    :param sess: A ``requests.Session`` to make the request with.
+    :param url: URL of the page.
+    :param validators: Validators stored from the last time we archived
+        this page; may be empty if it's never been archived.
+    :param timeout: Timeout (in seconds) for the request.
+
+    Returns a tuple ``(changed, new_validators)``, or raises
+    ``requests.exceptions.RequestException`` if the page can't be fetched.
+
+    """
+    resp = sess.get(
+        url, headers=conditional_headers(validators), timeout=timeout
+    )
+
+    if resp.status_code == 304:
+        return False, validators
+
+    resp.raise_for_status()
+
+    new_validators = {'sha256': content_hash(resp.content)}
+    if 'ETag' in resp.headers:
+        new_validators['etag'] = resp.headers['ETag']
+    if 'Last-Modified' in resp.headers:
+        new_validators['last_modified'] = resp.headers['Last-Modified']
+
+    changed = (new_validators['sha256'] != validators.get('sha256'))
+    return changed, new_validators
@@ -0,0 +1,96 @@
+# -*- encoding: utf-8
+"""Manage the temporary disk space used while archiving pages.
+
+Everything is kept in a private directory under a scratch root, which has a
+budget for the total space it may use.  Callers that want a working directory block
+until there's room in the budget, which applies back-pressure to a pool of
+workers rather than letting them fill the disk.
+
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+def _disk_usage(path):
+    """Returns the total size (in bytes) of all the files under ``path``."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class ScratchSpace:
+    """A scratch directory with a limit on the total space it uses.
+
+    :param root: Directory to keep scratch files in.  It's created if it
+        doesn't exist.  The files go in a private directory under ``root``,
+        and only that directory is removed when the ``ScratchSpace`` is
+        closed -- ``root`` itself, and anything else in it, are left alone.
+    :param budget: Total size (in bytes) of files to allow in the private
+        directory before new work has to wait.
+    :param spool_threshold: Size (in bytes) at which files from
+        :meth:`spooled_file` stop being held in memory and spill to disk.
+    :param poll_interval: How often (in seconds) to re-check disk usage
+        while waiting for space.
+
+    """
+    def __init__(self, root, budget, spool_threshold, poll_interval=1):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.path = tempfile.mkdtemp(prefix='pincushion-', dir=root)
+        self.budget = budget
+        self.spool_threshold = spool_threshold
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def usage(self):
+        return _disk_usage(self.path)
+
+    @contextlib.contextmanager
+    def workdir(self):
+        """Create a working directory under the scratch root, waiting until
+        the scratch space is under budget.  The directory and everything in
+        it is deleted on exit.
+        """
+        with self._cond:
+            # Other workers may still be writing files, so we can't rely on
+            # being notified when space frees up -- poll as well.
+            while self.usage() >= self.budget:
+                self._cond.wait(timeout=self.poll_interval)
+            path = tempfile.mkdtemp(dir=self.path)
+
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._cond:
+                self._cond.notify_all()
+
+    def spooled_file(self):
+        """Returns a temporary file that's kept in memory until it grows
+        past ``spool_threshold``, then spills to the scratch directory.
+
+        Spilled files are unlinked as soon as they're created, so they don't
+        count towards :meth:`usage` -- use them for data that's derived from
+        a live :meth:`workdir`, and is no bigger than it.
+        """
+        return tempfile.SpooledTemporaryFile(
+            max_size=self.spool_threshold, dir=self.path
+        )
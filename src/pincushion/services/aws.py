@@ -2,7 +2,13 @@
 
 import json
 
-import boto3
+from pincushion.constants import S3_ENDPOINT_URL
+
+
+def _s3_client():
+    # boto3 is slow to import, so we only load it when we need it.
+    import boto3
+    return boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
 
 
 def read_json_from_s3(bucket, key):
@@ -12,7 +18,7 @@ def read_json_from_s3(bucket, key):
     :param key: Key to read.
 
     """
-    client = boto3.client('s3')
+    client = _s3_client()
     obj = client.get_object(Bucket=bucket, Key=key)
     body = obj['Body'].read()
     return json.loads(body)
@@ -25,11 +31,51 @@ def write_json_to_s3(bucket, key, data):
     :param key: Key to write.
     :param data: Data to JSON-encode and upload.
 
+    Returns the size of the upload in bytes.
+
     """
-    client = boto3.client('s3')
+    client = _s3_client()
 
     # This data will only be read by machines, so compacting the JSON to
     # save storage and transfer costs makes sense.
     json_string = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    body = json_string.encode('utf8')
+
+    client.put_object(Bucket=bucket, Key=key, Body=body)
+    return len(body)
+
+
+def read_bytes_from_s3(bucket, key, offset, length):
+    """Read a range of bytes from an object in S3.
+
+    :param bucket: Name of the source S3 bucket.
+    :param key: Key to read.
+    :param offset: Offset of the first byte to read.
+    :param length: Number of bytes to read.
 
-    client.put_object(Bucket=bucket, Key=key, Body=json_string.encode('utf8'))
+    """
+    client = _s3_client()
+    obj = client.get_object(
+        Bucket=bucket,
+        Key=key,
+        Range=f'bytes={offset}-{offset + length - 1}'
+    )
+    return obj['Body'].read()
+
+
+def upload_fileobj_to_s3(bucket, key, fileobj, content_type):
+    """Upload the contents of a file-like object to S3.
+
+    :param bucket: Name of the destination S3 bucket.
+    :param key: Key to write.
+    :param fileobj: Readable file-like object, positioned at the start.
+    :param content_type: Content-Type to store with the object.
+
+    """
+    client = _s3_client()
+    client.upload_fileobj(
+        Fileobj=fileobj,
+        Bucket=bucket,
+        Key=key,
+        ExtraArgs={'ContentType': content_type}
+    )
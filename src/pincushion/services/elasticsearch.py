@@ -1,10 +1,77 @@
 # -*- encoding: utf-8
 
+import base64
+import binascii
+import functools
+import json
 import math
 import shlex
 
 import attr
 
+from pincushion.constants import ES_HOST
+
+
+@functools.lru_cache()
+def get_client(host=ES_HOST):
+    """Returns an Elasticsearch client for ``host``.
+
+    The client (and the elasticsearch library) is only loaded the first
+    time it's needed, because it's slow to import.
+    """
+    from elasticsearch import Elasticsearch
+    return Elasticsearch(hosts=[host])
+
+
+# We create ``tags`` as a multi-field, so it can be:
+#
+#   * searched/analysed as free text ("text")
+#   * used for aggregations to build tag clouds ("keyword")
+#
+# The ``link_*`` fields come from run_link_checker.py, and are only
+# ever used as exact-match filters.
+#
+# The ``id`` is a copy of the document ID, which the viewer uses as
+# a tiebreaker when paging through bookmarks with the same time.
+BOOKMARK_MAPPING = {
+    'properties': {
+        'tags': {
+            'type': 'text',
+            'fields': {
+                'raw': {'type': 'keyword'}
+            }
+        },
+        'id': {'type': 'keyword'},
+        'link_ok': {'type': 'boolean'},
+        'link_status': {'type': 'integer'},
+        'link_final_url': {'type': 'keyword'},
+        'link_checked_at': {'type': 'date'},
+    }
+}
+
+
+def create_index(client, index, doc_type):
+    """Create the bookmarks index, or bring the mapping of an existing
+    index up to date.
+
+    Mappings are only applied when an index is created, so without the
+    update, fields added since then would be mapped dynamically the first
+    time they're indexed -- e.g. ``id`` as ``text``, which can't be sorted.
+    """
+    from elasticsearch.exceptions import RequestError
+
+    try:
+        client.indices.create(
+            index=index,
+            body={'mappings': {doc_type: BOOKMARK_MAPPING}}
+        )
+    except RequestError as err:
+        if err.info['error']['type'] != 'resource_already_exists_exception':
+            raise
+        client.indices.put_mapping(
+            index=index, doc_type=doc_type, body=BOOKMARK_MAPPING
+        )
+
 
 def add_tag_to_query(existing_query, new_tag):
     """Given a query in Elasticsearch's query string syntax, add another tag
@@ -25,6 +92,105 @@ def add_tag_to_query(existing_query, new_tag):
     return ' '.join([existing_query, tag_marker]).strip()
 
 
+# Query tokens that filter on the results of the link checker, and the
+# value of ``link_ok`` they match.
+LINK_FILTERS = {
+    'link:ok': True,
+    'link:dead': False,
+}
+
+
+def normalise_query(query_string):
+    """Normalise a query string, so that equivalent queries share a cache
+    entry.  We ignore differences in whitespace, and the order of the tag
+    and link filters -- every filter has to match, whatever the order.
+    """
+    try:
+        tokens = shlex.split(query_string)
+    except ValueError:
+        return ' '.join(query_string.split())
+
+    def _is_filter(token):
+        return token.startswith('tags:') or token in LINK_FILTERS
+
+    terms = [t for t in tokens if not _is_filter(t)]
+    filters = sorted(t for t in tokens if _is_filter(t))
+    return ' '.join(shlex.quote(t) for t in terms + filters)
+
+
+# The fields of a bookmark that get rendered in the listing view.  Anything
+# else in the document is left out of search responses.
+LISTING_FIELDS = [
+    'url', 'title', 'description', 'tags', 'time', 'slug',
+    'toread', 'starred', '_backup', '_archive',
+]
+
+# Passed as the ``filter_path`` parameter on searches, so Elasticsearch
+# only sends back the parts of the response that we actually read.
+SEARCH_FILTER_PATH = ','.join([
+    'hits.total',
+    'hits.hits._id',
+    'hits.hits._source',
+    'hits.hits.sort',
+    'aggregations.tags.buckets',
+])
+
+
+# Listings that aren't ranked by relevance are sorted newest first.  The
+# ``id`` is a tiebreaker, so every bookmark has a unique position in the
+# sort order -- which ``search_after`` needs to page through them.
+def _time_sort(order):
+    return [
+        {'time': order},
+        {'id': {'order': order, 'unmapped_type': 'keyword'}},
+    ]
+
+
+@attr.s
+class Cursor:
+    """Points at a position in a time-sorted listing.
+
+    ``sort_values`` are the sort values of the last bookmark on the previous
+    page (if ``reverse`` is False) or the first bookmark on the next page
+    (if ``reverse`` is True).  ``page`` is the number of the page the cursor
+    leads to, so we can still tell the user where they are.
+
+    """
+    page = attr.ib()
+    sort_values = attr.ib()
+    reverse = attr.ib(default=False)
+
+
+def encode_cursor(cursor):
+    """Turn a ``Cursor`` into an opaque token for use in a URL."""
+    data = json.dumps(
+        [cursor.page, cursor.sort_values, cursor.reverse],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(data.encode('utf8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Turn a token from ``encode_cursor`` back into a ``Cursor``.
+
+    Raises ``ValueError`` if the token is malformed.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        page, sort_values, reverse = data
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError(f'Malformed cursor: {token!r}')
+
+    if not (
+        isinstance(page, int) and page >= 1 and
+        isinstance(sort_values, list) and
+        isinstance(reverse, bool)
+    ):
+        raise ValueError(f'Malformed cursor: {token!r}')
+
+    return Cursor(page=page, sort_values=sort_values, reverse=reverse)
+
+
 @attr.s
 class ResultList:
     """Represents a set of results from Elasticsearch.
@@ -39,6 +205,11 @@ class ResultList:
     bookmarks = attr.ib()
     tags = attr.ib()
 
+    # Sort values of the first and last bookmark, if the results were
+    # sorted by time.  These are used to build cursors.
+    first_sort = attr.ib(default=None)
+    last_sort = attr.ib(default=None)
+
     @property
     def start_idx(self):
         return 1 + self.page_size * (self.page - 1)
@@ -51,22 +222,77 @@ class ResultList:
     def total_pages(self):
         return math.ceil(self.total_size / self.page_size)
 
+    @property
+    def next_cursor(self):
+        if self.last_sort is None or self.page >= self.total_pages:
+            return None
+        return encode_cursor(
+            Cursor(page=self.page + 1, sort_values=self.last_sort)
+        )
 
-def build_query(query_string, page=1, page_size=96):
-    """Returns a dict suitable for passing to Elasticsearch."""
-    # These parameters can be set irrespective of the query string.
-    # Note: 'from' is an offset parameter, and is 0-indexed.
-    query = {
-        'from': (page - 1) * page_size,
-        'size': page_size,
-    }
+    @property
+    def prev_cursor(self):
+        if self.first_sort is None or self.page <= 1:
+            return None
+        return encode_cursor(Cursor(
+            page=self.page - 1, sort_values=self.first_sort, reverse=True
+        ))
+
+
+def parse_search_response(data, page, page_size, reverse=False):
+    """Turn the decoded JSON from an Elasticsearch search into a
+    ``ResultList``.
+
+    If the query was built from a ``reverse`` cursor, the hits come back
+    in reverse order, so we flip them round.
+
+    Empty lists are dropped from responses trimmed with ``filter_path``,
+    so we can't assume the hits or the tag buckets are present.
+    """
+    hits = data['hits'].get('hits', [])
+    if reverse:
+        hits = hits[::-1]
 
+    bookmarks = []
+    for hit in hits:
+        b = hit['_source']
+        b['id'] = hit['_id']
+        bookmarks.append(b)
+
+    buckets = data.get('aggregations', {}).get('tags', {}).get('buckets', [])
+    tags = {b['key']: b['doc_count'] for b in buckets}
+
+    return ResultList(
+        total_size=data['hits']['total'],
+        page=page,
+        page_size=page_size,
+        bookmarks=bookmarks,
+        tags=tags,
+        first_sort=hits[0].get('sort') if hits else None,
+        last_sort=hits[-1].get('sort') if hits else None
+    )
+
+
+@attr.s(frozen=True)
+class _QueryPlan:
+    """The parts of a query string that ``build_query`` cares about."""
+    sort_by_time = attr.ib()
+    simple_qs = attr.ib()
+    tags = attr.ib()
+    link_filters = attr.ib()
+
+
+@functools.lru_cache(maxsize=1024)
+def _plan_query(query_string):
     def _is_filter(token):
-        return _is_tag(token)
+        return _is_tag(token) or _is_link_filter(token)
 
     def _is_tag(token):
         return token.startswith('tags:')
 
+    def _is_link_filter(token):
+        return token in LINK_FILTERS
+
     query_string = query_string.strip()
 
     # Attempt to split the query string into tokens, but don't try too hard.
@@ -77,50 +303,107 @@ def build_query(query_string, page=1, page_size=96):
     except ValueError:
         tokens = [query_string]
 
-    if not query_string or all(_is_filter(t) for t in tokens):
-        query['sort'] = [{'time': 'desc'}]
+    return _QueryPlan(
+        sort_by_time=(
+            not query_string or all(_is_filter(t) for t in tokens)
+        ),
+        simple_qs=' '.join(t for t in tokens if not _is_filter(t)),
+        tags=tuple(t.split(':', 1)[-1] for t in tokens if _is_tag(t)),
+        link_filters=tuple(t for t in tokens if _is_link_filter(t)),
+    )
+
+
+def _sort_by_time(query, cursor):
+    """Sort a query newest first, starting from ``cursor`` if it's set."""
+    query['sort'] = _time_sort('desc')
+
+    if cursor is not None:
+        del query['from']
+        query['search_after'] = cursor.sort_values
+
+        # To go backwards, we walk the sort in the opposite direction
+        # from the first bookmark on the next page.
+        if cursor.reverse:
+            query['sort'] = _time_sort('asc')
 
-    query['query'] = {'bool': {'filter': []}}
-    bool_conditions = query['query']['bool']
+
+def _bool_conditions(plan):
+    """Returns the conditions of the ``bool`` query for a query plan."""
+    bool_conditions = {}
 
     # If there are any fields which don't get replaced as tag filters,
     # add them with the simple_query_string syntax.
-    simple_qs = ' '.join(t for t in tokens if not _is_filter(t))
-    if simple_qs:
+    if plan.simple_qs:
         bool_conditions['must'] = {
-            'query_string': {'query': simple_qs}
+            'query_string': {'query': plan.simple_qs}
         }
 
-    # Any tags get added as explicit "this must match" fields.
-    tag_tokens = [t for t in tokens if _is_tag(t)]
-    tags = [t.split(':', 1)[-1] for t in tag_tokens]
-    if tags:
-        bool_conditions['filter'].append({
-            'terms_set': {
-                'tags.raw': {
-                    'terms': tags,
-
-                    # This tells Elasticsearch: every term should match!
-                    'minimum_should_match_script': {
-                        'source': 'params.num_terms'
-                    }
-                }
-            }
-        })
+    # Any tags get added as explicit "this must match" fields.  One term
+    # filter per tag means every tag has to match, and unlike a script,
+    # Elasticsearch can cache each filter and reuse it between queries.
+    filters = [{'term': {'tags.raw': tag}} for tag in plan.tags]
+
+    # Filters on the results of the link checker.
+    filters.extend(
+        {'term': {'link_ok': LINK_FILTERS[t]}} for t in plan.link_filters
+    )
+
+    if filters:
+        bool_conditions['filter'] = filters
+
+    return bool_conditions
+
 
-    if not bool_conditions['filter']:
-        del bool_conditions['filter']
+def build_query(
+    query_string, page=1, page_size=96, cursor=None, fields=None,
+    tag_cloud_size=120
+):
+    """Returns a dict suitable for passing to Elasticsearch.
 
-    # We always ask for an aggregation on tags.raw (which is a keyword field,
+    If ``fields`` is set, only those fields are returned from each document.
+    ``tag_cloud_size`` is the number of tags to aggregate for the tag cloud;
+    pass 0 to skip the aggregation entirely.
+
+    If ``cursor`` is set and the results are sorted by time, we use
+    ``search_after`` rather than an offset, so deep pages are as cheap
+    as the first.  Relevance-ranked queries don't get cursors, so they
+    fall back to the cursor's page number.
+
+    """
+    if cursor is not None:
+        page = cursor.page
+
+    # These parameters can be set irrespective of the query string.
+    # Note: 'from' is an offset parameter, and is 0-indexed.
+    query = {
+        'from': (page - 1) * page_size,
+        'size': page_size,
+    }
+
+    if fields is not None:
+        query['_source'] = list(fields)
+
+    # Parsing the query string is cached, because the same few queries
+    # come up again and again.  The plan is immutable, so we build a fresh
+    # dict from it every time.
+    plan = _plan_query(query_string)
+
+    if plan.sort_by_time:
+        _sort_by_time(query, cursor)
+
+    query['query'] = {'bool': _bool_conditions(plan)}
+
+    # We ask for an aggregation on tags.raw (which is a keyword field,
     # unlike the free-text field we can't aggregate), which is used to display
     # the contextual tag cloud.
-    query['aggregations'] = {
-        'tags': {
-            'terms': {
-                'field': 'tags.raw',
-                'size': 120
+    if tag_cloud_size:
+        query['aggregations'] = {
+            'tags': {
+                'terms': {
+                    'field': 'tags.raw',
+                    'size': tag_cloud_size
+                }
             }
         }
-    }
 
     return query
@@ -0,0 +1,16 @@
+# -*- encoding: utf-8
+
+
+def pooled_session(pool_size):
+    """Returns a ``requests.Session`` that keeps up to ``pool_size``
+    connections open to each host, for sharing between worker threads.
+    """
+    # requests is slow to import, so we only load it when we need it.
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
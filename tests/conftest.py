@@ -0,0 +1,15 @@
+# -*- encoding: utf-8
+"""
+Shared test configuration.
+"""
+
+from hypothesis import settings
+
+
+# Older versions of Hypothesis measure their own coverage to guide the
+# search for failing examples.  That stops coverage.py tracing any threads
+# started afterwards, so code we only run in worker threads looks like it's
+# never run.
+if hasattr(settings.default, 'use_coverage'):
+    settings.register_profile('pincushion', settings(use_coverage=False))
+    settings.load_profile('pincushion')
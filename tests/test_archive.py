@@ -0,0 +1,120 @@
+# -*- encoding: utf-8
+
+import gzip
+import io
+import json
+
+import boto3
+from hypothesis import given
+from hypothesis.strategies import binary, dictionaries, from_regex
+from moto import mock_s3
+import pytest
+
+from pincushion import archive
+
+
+FILES = [
+    ('index.html', b'<html><img src="cat.jpg"></html>'),
+    ('cat.jpg', b'\xff\xd8\xff\xe0 not really a JPEG'),
+    ('style.css', b'body { color: red; }'),
+]
+
+
+def test_every_record_is_a_separate_gzip_member():
+    out = io.BytesIO()
+    location = archive.write_archive(out=out, files=FILES)
+
+    # The whole thing is still a valid gzip stream...
+    data = out.getvalue()
+    assert gzip.decompress(data).startswith(b'WARC/1.0\r\n')
+
+    # ...and the index is the final member.
+    assert location['index_offset'] + location['index_length'] == len(data)
+
+
+def _read_back(data, location):
+    _, index_body = archive.read_record(data[location['index_offset']:])
+    index = json.loads(index_body)
+    return {
+        name: archive.read_record(data[offset:offset + length])
+        for name, (offset, length, _) in index.items()
+    }
+
+
+def test_records_have_warc_headers():
+    out = io.BytesIO()
+    location = archive.write_archive(out=out, files=FILES[:1])
+
+    headers, body = _read_back(out.getvalue(), location)['index.html']
+    assert headers['WARC-Type'] == 'resource'
+    assert headers['WARC-Target-URI'] == 'index.html'
+    assert headers['Content-Type'] == 'text/html'
+    assert body == FILES[0][1]
+
+
+@given(files=dictionaries(
+    keys=from_regex(r'\A[a-z0-9]{1,10}\.(html|css|js|png)\Z'),
+    values=binary()
+))
+def test_files_can_be_read_back_by_offset(files):
+    out = io.BytesIO()
+    location = archive.write_archive(out=out, files=files.items())
+
+    records = _read_back(out.getvalue(), location)
+    assert {name: body for name, (_, body) in records.items()} == files
+
+
+def test_files_in_directory(tmpdir):
+    tmpdir.join('b.css').write(b'body {}', mode='wb')
+    tmpdir.join('a.html').write(b'<html></html>', mode='wb')
+
+    assert list(archive.files_in_directory(str(tmpdir))) == [
+        ('a.html', b'<html></html>'),
+        ('b.css', b'body {}'),
+    ]
+
+
+@pytest.fixture
+def bucket():
+    with mock_s3():
+        client = boto3.client('s3', region_name='eu-west-1')
+        client.create_bucket(
+            Bucket='bukkit',
+            CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+        )
+
+        out = io.BytesIO()
+        location = archive.write_archive(out=out, files=FILES)
+        client.put_object(
+            Bucket='bukkit', Key='example.warc.gz', Body=out.getvalue()
+        )
+
+        location['key'] = 'example.warc.gz'
+        yield location
+
+
+def test_read_index_from_s3(bucket):
+    index = archive.read_index(bucket='bukkit', archive=bucket)
+    assert sorted(index) == ['cat.jpg', 'index.html', 'style.css']
+
+
+@pytest.mark.parametrize('name, content_type, body', [
+    (name, content_type, body)
+    for (name, body), content_type in zip(
+        FILES, ['text/html', 'image/jpeg', 'text/css']
+    )
+])
+def test_read_file_from_s3(bucket, name, content_type, body):
+    index = archive.read_index(bucket='bukkit', archive=bucket)
+    result = archive.read_file(
+        bucket='bukkit', key=bucket['key'], index=index, name=name
+    )
+    assert result == (content_type, body)
+
+
+def test_reading_missing_file_is_keyerror(bucket):
+    index = archive.read_index(bucket='bukkit', archive=bucket)
+    with pytest.raises(KeyError):
+        archive.read_file(
+            bucket='bukkit', key=bucket['key'], index=index, name='nope.png'
+        )
@@ -71,6 +71,45 @@ def test_merging_bookmarks(cached_data, api_response, expected):
     assert result == expected
 
 
+@pytest.mark.parametrize('latest, updated, expected', [
+    # Owned fields in the updated copy replace the stale ones
+    (
+        {'example': {'href': 'example', '_backup': True, '_archive': 'old'}},
+        {'example': {'href': 'example', '_backup': True, '_archive': 'new'}},
+        {'example': {'href': 'example', '_backup': True, '_archive': 'new'}}
+    ),
+
+    # Owned fields that aren't in the updated copy are removed
+    (
+        {'example': {'href': 'example', '_archive': 'old'}},
+        {'example': {'href': 'example', '_backup': True}},
+        {'example': {'href': 'example', '_backup': True}}
+    ),
+
+    # Other fields come from the latest copy
+    (
+        {'example': {'href': 'example', 'tags': 'new', '_link': 'new'}},
+        {'example': {'href': 'example', 'tags': 'old', '_link': 'old'}},
+        {'example': {'href': 'example', 'tags': 'new', '_link': 'new'}}
+    ),
+
+    # Bookmarks that have been added or deleted in the meantime are
+    # left alone
+    (
+        {'added': {'href': 'added'}},
+        {'deleted': {'href': 'deleted', '_backup': True}},
+        {'added': {'href': 'added'}}
+    ),
+])
+def test_merging_fields(latest, updated, expected):
+    result = bookmarks.merge_fields(
+        latest=latest,
+        updated=updated,
+        fields=['_backup', '_archive']
+    )
+    assert result == expected
+
+
 @pytest.fixture
 def api_bookmark():
     return {
@@ -93,6 +132,29 @@ class TestTransformBookmark:
         b = bookmarks.transform_pinboard_bookmark(api_bookmark)
         assert field_name not in b
 
+    def test_archive_validators_are_deleted(self, api_bookmark):
+        api_bookmark['_validators'] = {'etag': '"123"', 'sha256': 'abc'}
+        b = bookmarks.transform_pinboard_bookmark(api_bookmark)
+        assert '_validators' not in b
+
+    def test_link_check_results_are_flattened(self, api_bookmark):
+        api_bookmark['_link'] = {
+            'ok': False,
+            'status': 404,
+            'final_url': 'https://example.org/gone',
+            'checked_at': '2018-01-02T03:04:05Z',
+        }
+        b = bookmarks.transform_pinboard_bookmark(api_bookmark)
+        assert '_link' not in b
+        assert b['link_ok'] is False
+        assert b['link_status'] == 404
+        assert b['link_final_url'] == 'https://example.org/gone'
+        assert b['link_checked_at'] == '2018-01-02T03:04:05Z'
+
+    def test_unchecked_links_dont_get_link_fields(self, api_bookmark):
+        b = bookmarks.transform_pinboard_bookmark(api_bookmark)
+        assert not any(k.startswith('link_') for k in b)
+
     def test_title_field_is_renamed(self, api_bookmark):
         b = bookmarks.transform_pinboard_bookmark(api_bookmark)
         assert b['title'] == api_bookmark['description']
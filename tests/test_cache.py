@@ -0,0 +1,143 @@
+# -*- encoding: utf-8
+
+import threading
+
+import pytest
+
+from pincushion.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_values_are_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+    compute = Counter()
+
+    assert cache.get_or_compute('a', compute) == 1
+    assert cache.get_or_compute('a', compute) == 1
+    assert compute.calls == 1
+
+
+def test_values_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    compute = Counter()
+
+    assert cache.get_or_compute('a', compute) == 1
+    clock.now = 59
+    assert cache.get_or_compute('a', compute) == 1
+    clock.now = 61
+    assert cache.get_or_compute('a', compute) == 2
+
+
+def test_get_returns_cached_values():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.get_or_compute('a', lambda: 'A')
+
+    assert cache.get('a') == 'A'
+    assert cache.get('b') is None
+    assert cache.get('b', default='B') == 'B'
+
+    clock.now = 61
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_value_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+
+    cache.get_or_compute('a', lambda: 'A')
+    cache.get_or_compute('b', lambda: 'B')
+    cache.get_or_compute('a', lambda: 'A2')
+    cache.get_or_compute('c', lambda: 'C')
+
+    assert len(cache) == 2
+    assert cache.get_or_compute('a', lambda: 'A3') == 'A'
+    assert cache.get_or_compute('b', lambda: 'B2') == 'B2'
+
+
+def test_clear_empties_the_cache():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.get_or_compute('a', lambda: 'A')
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get_or_compute('a', lambda: 'A2') == 'A2'
+
+
+def test_errors_are_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    def _fail():
+        raise ValueError('Elasticsearch is down')
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute('a', _fail)
+
+    assert cache.get_or_compute('a', lambda: 'A') == 'A'
+
+
+def _run_concurrently(cache, compute, count=5):
+    results = []
+
+    def _worker():
+        try:
+            results.append(cache.get_or_compute('a', compute))
+        except Exception as err:
+            results.append(err)
+
+    threads = [threading.Thread(target=_worker) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def _slow_compute():
+        calls.append(1)
+        release.wait()
+        return 'A'
+
+    threads, results = _run_concurrently(cache, _slow_compute)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == ['A'] * 5
+
+
+def test_concurrent_misses_share_errors():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = threading.Event()
+
+    def _slow_fail():
+        release.wait()
+        raise ValueError('Elasticsearch is down')
+
+    threads, results = _run_concurrently(cache, _slow_fail)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 5
+    assert all(isinstance(r, ValueError) for r in results)
@@ -0,0 +1,507 @@
+# -*- encoding: utf-8
+
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+
+import attr
+import boto3
+import brotli
+from moto import mock_s3
+import pytest
+import requests
+
+from pincushion import archive
+from pincushion.constants import S3_BUCKET
+from pincushion.flask import app as viewer_app
+from pincushion.flask import assets
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOKMARK = {
+    'url': 'https://example.org/',
+    'title': 'An *example* bookmark',
+    'description': 'See https://example.org',
+    'tags': ['fish', 'chips'],
+    'time': '2017-12-26T10:15:21Z',
+    'slug': 'abc123',
+    'toread': False,
+}
+
+
+@attr.s
+class FakeResponse:
+    status_code = attr.ib()
+    data = attr.ib()
+    text = ''
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+
+class FakeElasticsearch:
+    """Pretends to be the ``requests.Session`` the viewer uses to talk
+    to Elasticsearch.
+    """
+    def __init__(self, hits=None, docs=None, status_code=200, total=None):
+        self.hits = hits or []
+        self.total = total
+        self.generation = 1
+        self.docs = docs or {}
+        self.status_code = status_code
+        self.requests = []
+
+    def post(self, url, params, data, headers, timeout):
+        self.requests.append(('POST', url))
+        self.last_query = json.loads(data)
+        return FakeResponse(status_code=self.status_code, data={
+            'hits': {
+                'total': self.total or len(self.hits),
+                'hits': [
+                    {'_id': b_id, '_source': dict(b), 'sort': [i, b_id]}
+                    for i, (b_id, b) in enumerate(self.hits)
+                ],
+            },
+            'aggregations': {
+                'tags': {'buckets': [{'key': 'fish', 'doc_count': 1}]}
+            },
+        })
+
+    def get(self, url, timeout, params=None):
+        self.requests.append(('GET', url))
+        if '/pincushion_meta/' in url:
+            if self.generation is None:
+                return FakeResponse(404, {'found': False})
+            return FakeResponse(200, {'_source': {'generation': 1}})
+        b_id = url.rsplit('/', 1)[-1]
+        if b_id in self.docs:
+            return FakeResponse(200, {'_source': self.docs[b_id]})
+        return FakeResponse(404, {'found': False})
+
+
+STYLESHEET = b'body { color: red; }' * 100
+
+
+@pytest.fixture
+def root_path(tmpdir):
+    shutil.copytree(
+        os.path.join(ROOT, 'templates'), str(tmpdir.join('templates'))
+    )
+    static_dir = tmpdir.mkdir('static')
+    static_dir.join('favicon.ico').write_binary(b'not really an icon')
+    assets.build_assets(
+        asset_dir='assets',
+        static_dir=str(static_dir),
+        compile=lambda path: STYLESHEET.decode('utf8')
+    )
+    return str(tmpdir)
+
+
+@pytest.fixture
+def es():
+    return FakeElasticsearch(hits=[('example-org', BOOKMARK)])
+
+
+@pytest.fixture
+def app(root_path, es):
+    app = viewer_app.create_app(config={
+        'ES_HOST': 'http://es.local',
+        'SECRET_KEY': 'secret',
+        'USER_PASSWORD': 'password',
+        'WTF_CSRF_ENABLED': False,
+    }, root_path=root_path)
+    app.extensions['pincushion'].es_session = es
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    resp = client.post('/login', data={'password': 'password'})
+    assert resp.status_code == 302
+    return client
+
+
+def test_index_requires_login(app):
+    resp = app.test_client().get('/')
+    assert resp.status_code == 401
+
+
+def test_login_with_wrong_password_is_rejected(app):
+    resp = app.test_client().post('/login', data={'password': 'wrong'})
+    assert resp.status_code == 401
+
+
+def test_login_page_is_rendered(app):
+    resp = app.test_client().get('/login')
+    assert resp.status_code == 200
+    assert b'password' in resp.data
+
+
+def test_logout(client):
+    assert client.get('/logout').status_code == 302
+    assert client.get('/').status_code == 401
+
+
+def test_index_shows_bookmarks(client):
+    resp = client.get('/')
+    assert resp.status_code == 200
+
+    html = resp.data.decode('utf8')
+    assert 'An <em>example</em> bookmark' in html
+    hashed_name = assets.fingerprint('style.css', STYLESHEET)
+    assert f'/static/{hashed_name}' in html
+
+
+def test_empty_query_is_redirected(client):
+    resp = client.get('/?query=&page=2')
+    assert resp.status_code == 302
+    assert resp.headers['Location'].endswith('/?page=2')
+
+
+def test_malformed_cursor_is_rejected(client):
+    assert client.get('/?cursor=nonsense').status_code == 400
+
+
+def test_search_results_are_cached(client, es):
+    client.get('/?query=tags:fish')
+    client.get('/?query=tags:fish')
+    searches = [url for method, url in es.requests if method == 'POST']
+    assert searches == ['http://es.local/bookmarks/bookmarks/_search']
+
+
+def test_elasticsearch_errors_are_500s(client, es):
+    es.status_code = 500
+    assert client.get('/').status_code == 500
+
+
+def test_index_is_marked_as_private(client):
+    resp = client.get('/')
+    assert resp.headers['ETag']
+    assert resp.headers['Cache-Control'] == 'private, no-cache'
+    assert resp.headers['Vary'] == 'Cookie'
+
+
+def test_matching_etag_gets_304_without_a_search(client, es):
+    etag = client.get('/').headers['ETag']
+    es.requests.clear()
+
+    resp = client.get('/', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+    assert not [r for r in es.requests if r[0] == 'POST']
+
+
+def test_index_works_before_the_first_index_generation(client, es):
+    es.generation = None
+    assert client.get('/').status_code == 200
+
+
+def test_tag_cloud_is_only_aggregated_once_per_query(client, es):
+    es.hits = [(f'b{i}', BOOKMARK) for i in range(96)]
+    es.total = 200
+
+    client.get('/?query=tags:fish')
+    assert 'aggregations' in es.last_query
+
+    html = client.get('/?query=tags:fish&page=2').data.decode('utf8')
+    assert 'aggregations' not in es.last_query
+    assert 'tag__cloud' in html
+
+
+def test_tag_cloud_isnt_aggregated_once_we_know_its_hidden(app, client, es):
+    client.get('/?query=tags:fish')
+    assert 'aggregations' in es.last_query
+
+    # Once the cached tag cloud and results have expired, we still know
+    # there's only one result, so there's no cloud to show.
+    viewer = app.extensions['pincushion']
+    viewer.tag_cloud_cache.clear()
+    viewer.search_cache.clear()
+
+    html = client.get('/?query=tags:fish').data.decode('utf8')
+    assert 'aggregations' not in es.last_query
+    assert 'tag__cloud' not in html
+
+
+def test_cursor_pages_are_fetched_with_search_after(client, es):
+    es.hits = [(f'b{i}', BOOKMARK) for i in range(96)]
+    es.total = 2000
+
+    html = client.get('/?page=11').data.decode('utf8')
+    cursor = html.split('?cursor=')[1].split('"')[0]
+
+    resp = client.get(f'/?cursor={cursor}')
+    assert resp.status_code == 200
+    assert es.last_query['search_after'] == [95, 'b95']
+    assert 'Page 12 of' in resp.data.decode('utf8')
+
+
+def test_different_pages_get_different_etags(client):
+    etag1 = client.get('/?query=tags:fish').headers['ETag']
+    etag2 = client.get('/?query=tags:chips').headers['ETag']
+    assert etag1 != etag2
+
+
+def test_equivalent_queries_get_the_same_etag(client):
+    etag1 = client.get('/?query=tags:fish%20tags:chips').headers['ETag']
+    etag2 = client.get('/?query=tags:chips%20%20tags:fish').headers['ETag']
+    assert etag1 == etag2
+
+
+def test_deep_pages_link_with_cursors(client, es):
+    es.hits = [(f'b{i}', BOOKMARK) for i in range(96)]
+    es.total = 2000
+
+    html = client.get('/?page=11').data.decode('utf8')
+    assert '?page=10' in html
+    assert '?cursor=' in html
+    assert '?page=12' not in html
+
+
+def test_missing_bookmark_archive_is_404(client):
+    assert client.get('/archive/nope/index.html').status_code == 404
+
+
+def test_bookmark_without_archive_is_404(client, es):
+    es.docs['example-org'] = {}
+    assert client.get('/archive/example-org/index.html').status_code == 404
+
+
+@mock_s3
+def test_archived_files_are_served(client, es):
+    client_s3 = boto3.client('s3')
+    client_s3.create_bucket(Bucket=S3_BUCKET)
+
+    out = io.BytesIO()
+    location = archive.write_archive(out=out, files=[
+        ('index.html', b'<html>cat</html>'),
+    ])
+    client_s3.put_object(
+        Bucket=S3_BUCKET, Key='example-org.warc.gz', Body=out.getvalue()
+    )
+    location['key'] = 'example-org.warc.gz'
+    es.docs['example-org'] = {'_archive': location}
+
+    resp = client.get('/archive/example-org/index.html')
+    assert resp.status_code == 200
+    assert resp.data == b'<html>cat</html>'
+    assert resp.headers['Content-Type'].startswith('text/html')
+
+    # Archived pages mustn't be able to run scripts in the viewer's origin.
+    assert resp.headers['Content-Security-Policy'] == 'sandbox'
+    assert resp.headers['X-Content-Type-Options'] == 'nosniff'
+
+    assert client.get('/archive/example-org/missing.png').status_code == 404
+
+
+def test_warm_up_compiles_every_template(app):
+    compiled = {name for _, name in app.jinja_env.cache.keys()}
+    assert compiled == set(app.jinja_env.list_templates())
+
+
+def test_warm_up_connections_opens_a_connection(app, es):
+    viewer_app.warm_up_connections(app)
+    assert es.requests == [('GET', 'http://es.local')]
+
+
+def test_warm_up_connections_survives_elasticsearch_being_down(
+    app, caplog, monkeypatch
+):
+    class BrokenSession:
+        def get(self, url, timeout):
+            raise requests.exceptions.ConnectionError()
+
+    # Older versions of Flask stop the app's log messages reaching the
+    # root logger, which is where caplog listens for them.
+    monkeypatch.setattr(app.logger, 'propagate', True)
+
+    app.extensions['pincushion'].es_session = BrokenSession()
+    viewer_app.warm_up_connections(app)
+    assert 'Unable to connect to Elasticsearch' in caplog.text
+
+
+def _get_stylesheet(app, accept_encoding):
+    hashed_name = assets.fingerprint('style.css', STYLESHEET)
+    return app.test_client().get(
+        f'/static/{hashed_name}',
+        headers={'Accept-Encoding': accept_encoding}
+    )
+
+
+@pytest.mark.parametrize('accept_encoding, content_encoding, decompress', [
+    ('gzip, deflate, br', 'br', brotli.decompress),
+    ('gzip, deflate', 'gzip', gzip.decompress),
+    ('', None, lambda data: data),
+])
+def test_fingerprinted_assets_are_precompressed(
+    app, accept_encoding, content_encoding, decompress
+):
+    resp = _get_stylesheet(app, accept_encoding)
+    assert resp.status_code == 200
+    assert resp.headers.get('Content-Encoding') == content_encoding
+    assert resp.headers['Content-Type'].startswith('text/css')
+    assert decompress(resp.data) == STYLESHEET
+
+
+def test_fingerprinted_assets_are_cached_forever(app):
+    resp = _get_stylesheet(app, 'gzip')
+    assert resp.headers['Cache-Control'] == (
+        'public, max-age=31536000, immutable'
+    )
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+
+def test_other_static_files_are_served_normally(app):
+    resp = app.test_client().get('/static/favicon.ico')
+    assert resp.status_code == 200
+    assert resp.data == b'not really an icon'
+    assert 'immutable' not in resp.headers.get('Cache-Control', '')
+
+
+def test_unbuilt_assets_fall_back_to_the_original_file(tmpdir):
+    shutil.copytree(
+        os.path.join(ROOT, 'templates'), str(tmpdir.join('templates'))
+    )
+    app = viewer_app.create_app(config={}, root_path=str(tmpdir))
+    viewer = app.extensions['pincushion']
+    assert viewer.asset_url('style.css') == '/static/style.css'
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv('PINCUSHION_SECRET_KEY', 'secret')
+    monkeypatch.setenv('PINCUSHION_PASSWORD', 'password')
+    monkeypatch.delenv('PINCUSHION_FRAGMENT_CACHE', raising=False)
+
+    config = viewer_app.config_from_env()
+    assert config['SECRET_KEY'] == 'secret'
+    assert config['USER_PASSWORD'] == 'password'
+    assert config['FRAGMENT_CACHE_DIR'] is None
+
+
+def test_create_app_reads_config_from_env(root_path, monkeypatch):
+    monkeypatch.setattr(viewer_app, 'config_from_env', lambda: {
+        'SECRET_KEY': 'from-env',
+    })
+    app = viewer_app.create_app(root_path=root_path)
+    assert app.config['SECRET_KEY'] == 'from-env'
+
+
+@pytest.fixture
+def timed_app(app):
+    app = viewer_app.create_app(
+        config=dict(app.config, ENABLE_TIMING=True), root_path=app.root_path
+    )
+    app.extensions['pincushion'].es_session = FakeElasticsearch(
+        hits=[('example-org', BOOKMARK), ('example-com', BOOKMARK)]
+    )
+    return app
+
+
+def test_responses_have_no_timings_by_default(client):
+    assert 'Server-Timing' not in client.get('/').headers
+    assert client.get('/metrics').status_code == 404
+
+
+def test_server_timing_shows_each_stage(timed_app):
+    client = timed_app.test_client()
+    client.post('/login', data={'password': 'password'})
+
+    resp = client.get('/')
+    stages = [
+        entry.split(';')[0]
+        for entry in resp.headers['Server-Timing'].split(', ')
+    ]
+    assert stages == ['es', 'markdown', 'tagcloud', 'render', 'total']
+
+
+def test_timings_are_collected_as_metrics(timed_app):
+    client = timed_app.test_client()
+    client.post('/login', data={'password': 'password'})
+    client.get('/')
+    client.get('/')
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith('text/plain')
+
+    text = resp.data.decode('utf8')
+    assert (
+        'pincushion_request_duration_seconds_count{endpoint="index"} 2\n'
+        in text
+    )
+    assert 'pincushion_stage_duration_seconds_count{stage="es"} 1\n' in text
+    assert (
+        'pincushion_stage_duration_seconds_count{stage="render"} 2\n' in text
+    )
+
+
+def test_metrics_require_login(timed_app):
+    resp = timed_app.test_client().get('/metrics')
+    assert resp.status_code == 401
+
+
+@pytest.fixture
+def profiled_app(app, tmpdir):
+    app = viewer_app.create_app(
+        config=dict(app.config, PROFILE_DIR=str(tmpdir.join('profiles'))),
+        root_path=app.root_path
+    )
+    app.extensions['pincushion'].es_session = FakeElasticsearch(
+        hits=[('example-org', BOOKMARK)]
+    )
+    return app
+
+
+def test_logged_in_users_can_profile_a_request(profiled_app, tmpdir):
+    client = profiled_app.test_client()
+    client.post('/login', data={'password': 'password'})
+
+    resp = client.get('/?profile=1')
+    assert resp.status_code == 200
+    assert resp.headers['X-Profile'].startswith('index-')
+    assert os.listdir(str(tmpdir.join('profiles'))) == [
+        resp.headers['X-Profile']
+    ]
+
+    # Profiles are rate limited
+    assert 'X-Profile' not in client.get('/?profile=1').headers
+
+
+def test_anonymous_users_cannot_profile(profiled_app, tmpdir):
+    resp = profiled_app.test_client().get('/?profile=1')
+    assert resp.status_code == 401
+    assert 'X-Profile' not in resp.headers
+    assert os.listdir(str(tmpdir.join('profiles'))) == []
+
+
+def test_failed_requests_still_finish_the_profile(profiled_app, tmpdir):
+    profiled_app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = profiled_app.test_client()
+    client.post('/login', data={'password': 'password'})
+    profiled_app.extensions['pincushion'].es_session.status_code = 500
+
+    assert client.get('/?profile=1').status_code == 500
+    assert len(os.listdir(str(tmpdir.join('profiles')))) == 1
+
+
+def test_profile_is_stopped_if_an_exception_propagates(profiled_app, tmpdir):
+    profiled_app.config['PROPAGATE_EXCEPTIONS'] = True
+    client = profiled_app.test_client()
+    client.post('/login', data={'password': 'password'})
+    profiled_app.extensions['pincushion'].es_session.status_code = 500
+
+    with pytest.raises(Exception):
+        client.get('/?profile=1')
+
+    assert len(os.listdir(str(tmpdir.join('profiles')))) == 1
+    assert profiled_app.extensions['pincushion_profiler']._running is False
+    assert sys.getprofile() is None
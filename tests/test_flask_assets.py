@@ -0,0 +1,85 @@
+# -*- encoding: utf-8
+
+import gzip
+import json
+import sys
+
+import brotli
+import pytest
+
+from pincushion.flask import assets
+
+
+def test_fingerprint_depends_on_contents():
+    name1 = assets.fingerprint('style.css', b'body { color: red; }')
+    name2 = assets.fingerprint('style.css', b'body { color: blue; }')
+
+    assert name1.startswith('style.') and name1.endswith('.css')
+    assert name1 != name2
+    assert name1 == assets.fingerprint('style.css', b'body { color: red; }')
+
+
+def test_write_asset_writes_compressed_variants(tmpdir):
+    data = b'body { color: red; }' * 100
+    hashed_name = assets.write_asset(str(tmpdir), 'style.css', data)
+
+    def _read(name):
+        return tmpdir.join(name).read_binary()
+
+    assert _read(hashed_name) == data
+    assert gzip.decompress(_read(hashed_name + '.gz')) == data
+    assert brotli.decompress(_read(hashed_name + '.br')) == data
+
+
+def test_gzip_variant_is_reproducible(tmpdir):
+    hashed_name = assets.write_asset(str(tmpdir), 'style.css', b'body {}')
+    first = tmpdir.join(hashed_name + '.gz').read_binary()
+
+    assets.write_asset(str(tmpdir), 'style.css', b'body {}')
+    assert tmpdir.join(hashed_name + '.gz').read_binary() == first
+
+
+def test_brotli_is_optional(tmpdir, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'brotli', None)
+    hashed_name = assets.write_asset(str(tmpdir), 'style.css', b'body {}')
+
+    assert tmpdir.join(hashed_name + '.gz').exists()
+    assert not tmpdir.join(hashed_name + '.br').exists()
+
+
+def test_build_assets_writes_a_manifest(tmpdir):
+    compiled = []
+
+    def _compile(path):
+        compiled.append(path)
+        return 'body { color: red; }'
+
+    manifest = assets.build_assets(
+        asset_dir='assets', static_dir=str(tmpdir), compile=_compile
+    )
+
+    assert compiled == ['assets/style.scss']
+    assert manifest == {
+        'style.css': assets.fingerprint('style.css', b'body { color: red; }')
+    }
+    assert json.loads(tmpdir.join('manifest.json').read()) == manifest
+    assert assets.load_manifest(str(tmpdir)) == manifest
+
+
+def test_missing_manifest_is_empty(tmpdir):
+    assert assets.load_manifest(str(tmpdir)) == {}
+
+
+def test_compile_scss(monkeypatch):
+    # The real compiler is tested by pyscss; we just check we call it.
+    fake_compiler = type(sys)('scss.compiler')
+    fake_compiler.compile_file = lambda path: f'/* {path} */'
+    monkeypatch.setitem(sys.modules, 'scss.compiler', fake_compiler)
+
+    css = assets.compile_scss('assets/style.scss')
+    assert css == '/* assets/style.scss */'
+
+
+@pytest.mark.parametrize('name', ['style.css', 'print.css'])
+def test_fingerprint_keeps_extension(name):
+    assert assets.fingerprint(name, b'').endswith('.css')
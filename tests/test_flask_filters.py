@@ -1,9 +1,16 @@
 # -*- encoding: utf-8
 
+import datetime as dt
+import functools
+import re
 import textwrap
+import threading
+import time
 
 from hypothesis import assume, given
-from hypothesis.strategies import lists, text
+from hypothesis.strategies import (
+    from_regex, lists, one_of, sampled_from, text
+)
 import pytest
 
 from pincushion.flask import filters
@@ -117,6 +124,88 @@ def test_description_markdown(md, expected_html):
     assert filters.description_markdown(md) == expected_html
 
 
+# These are the original implementations of the preprocessors, which did
+# a separate replace() for every match.  The new versions should produce
+# the same output.
+
+def _original_autolink(lines):
+    new_lines = []
+    for line in lines:
+        for u in re.findall(r'(https?://[^\s]+?)(?:\s|$)', line):
+            line = line.replace(u, f'<{u}>')
+        new_lines.append(line)
+    return new_lines
+
+
+def _original_blockquote(lines):
+    text = '\n'.join(lines)
+    blockquotes = re.findall(r'<blockquote>(?:[^<]+?)</blockquote>', text)
+    for bq_html in blockquotes:
+        bq_inner = bq_html[len('<blockquote>'):-len('</blockquote>')]
+        bq_md_lines = []
+        inner_lines = bq_inner.strip().splitlines()
+        for i, line in enumerate(inner_lines):
+            if i == len(inner_lines) - 1:
+                bq_md_lines.append(f'> {line}')
+            else:
+                if inner_lines[i + 1].strip():
+                    bq_md_lines.append(f'> {line}  ')
+                else:
+                    bq_md_lines.append(f'> {line}')
+        bq_md = '\n'.join(bq_md_lines)
+        text = text.replace(bq_html, '\n\n' + bq_md + '\n\n')
+    return text.splitlines()
+
+
+def words():
+    return from_regex(r'\A[a-zA-Z.,;:!?()]{1,10}\Z')
+
+
+def _number_urls(tokens):
+    return ' '.join(
+        f'{t}{n}~' if t.startswith('http') else t
+        for n, t in enumerate(tokens)
+    )
+
+
+def url_lines():
+    # The original implementation wraps a URL twice if it's repeated, or
+    # if it's a prefix of another URL on the same line -- so the URLs here
+    # are numbered to make them distinct, and end in a character that
+    # can't be the start of a longer URL.
+    urls = sampled_from([
+        'http://example.org/', 'https://example.net/a/', 'https://x.com?q=',
+    ])
+    return lists(one_of(words(), urls), max_size=20).map(_number_urls)
+
+
+@given(lines=lists(url_lines()))
+def test_autolink_matches_original(lines):
+    preprocessor = filters.AutoLinkPreprocessor()
+    assert preprocessor.run(lines) == _original_autolink(lines)
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('https://example.org and https://example.org',
+     '<https://example.org> and <https://example.org>'),
+    ('https://example.org and https://example.org/path',
+     '<https://example.org> and <https://example.org/path>'),
+])
+def test_autolink_only_wraps_each_url_once(line, expected):
+    preprocessor = filters.AutoLinkPreprocessor()
+    assert preprocessor.run([line]) == [expected]
+
+
+@given(fragments=lists(sampled_from([
+    '<blockquote>', '</blockquote>', '<b>', 'Hello', 'world', ' ', '\n',
+    '\n\n', '  \n', 'https://example.org',
+])))
+def test_blockquote_matches_original(fragments):
+    lines = ''.join(fragments).split('\n')
+    preprocessor = filters.BlockquotePreprocessor()
+    assert preprocessor.run(lines) == _original_blockquote(lines)
+
+
 @pytest.mark.parametrize('tags, expected_sorted_tags', [
     (['rust'], ['rust']),
     (['politics', 'brexit'], ['brexit', 'politics']),
@@ -143,3 +232,130 @@ def test_custom_tag_sort_ignores_non_wc_tags(tags):
     assume(not any(t.startswith('wc:') for t in tags))
     result = filters.custom_tag_sort(tags)
     assert result == sorted(tags)
+
+
+def test_markdown_renderers_are_reused():
+    filters.description_markdown('The first description')
+    renderer = filters._markdown_instance('description')
+    filters.description_markdown('A second description')
+    assert filters._markdown_instance('description') is renderer
+
+
+def test_markdown_renderers_are_per_thread():
+    renderers = []
+
+    def _worker():
+        renderers.append(filters._markdown_instance('title'))
+
+    threads = [threading.Thread(target=_worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert renderers[0] is not renderers[1]
+
+
+def test_markdown_state_doesnt_leak_between_descriptions():
+    # Reference-style links are remembered by the Markdown instance, so
+    # this checks the renderer is reset between documents.
+    first = filters.description_markdown(
+        'A [reference link][1]\n\n[1]: https://example.org'
+    )
+    assert 'href="https://example.org"' in first
+
+    second = filters.description_markdown('Another [reference link][1]')
+    assert 'href' not in second
+
+
+NOW = dt.datetime(2018, 1, 1, 12, 0, 0)
+
+
+@pytest.mark.parametrize('delta, expected', [
+    (dt.timedelta(seconds=0), 'now'),
+    (dt.timedelta(seconds=1), 'a second ago'),
+    (dt.timedelta(seconds=30), '30 seconds ago'),
+    (dt.timedelta(seconds=90), 'a minute ago'),
+    (dt.timedelta(minutes=5), '5 minutes ago'),
+    (dt.timedelta(minutes=90), 'an hour ago'),
+    (dt.timedelta(hours=5), '5 hours ago'),
+    (dt.timedelta(days=1, hours=3), 'a day ago'),
+    (dt.timedelta(days=12), '12 days ago'),
+    (dt.timedelta(days=40), 'a month ago'),
+    (dt.timedelta(days=100), '3 months ago'),
+    (dt.timedelta(days=365), 'a year ago'),
+    (dt.timedelta(days=366), '1 year, 1 day ago'),
+    (dt.timedelta(days=380), '1 year, 15 days ago'),
+    (dt.timedelta(days=400), '1 year, 1 month ago'),
+    (dt.timedelta(days=500), '1 year, 4 months ago'),
+    (dt.timedelta(days=800), '2 years ago'),
+    (dt.timedelta(days=-3), '3 days from now'),
+])
+def test_slang_time(delta, expected):
+    d = (NOW - delta).strftime('%Y-%m-%dT%H:%M:%SZ')
+    assert filters._slang_time(d, now=NOW) == expected
+
+
+@pytest.mark.parametrize('d', [
+    '', '2017-12-26', '2017-12-26 10:15:21', '2017-12-26T10:15:21+01:00',
+])
+def test_slang_time_rejects_unexpected_timestamps(d):
+    with pytest.raises(ValueError):
+        filters._slang_time(d, now=NOW)
+
+
+def test_slang_time_uses_current_time(monkeypatch):
+    now = NOW.replace(tzinfo=dt.timezone.utc).timestamp()
+    monkeypatch.setattr(time, 'time', lambda: now)
+
+    assert filters.slang_time('2017-12-29T12:00:00Z') == '3 days ago'
+
+
+def _original_custom_tag_sort(tags):
+    # The original implementation of custom_tag_sort, which compared tags
+    # pairwise with a cmp-style function.
+    def cmp(x, y):
+        return (x > y) - (x < y)
+
+    def _comparator(x, y):
+        if x.startswith('wc:') and y.startswith('wc:'):
+            match_x = filters.WC_TAG_REGEX.match(x)
+            match_y = filters.WC_TAG_REGEX.match(y)
+            assert match_x is not None
+            assert match_y is not None
+
+            x_interval, x_value = list({
+                k: int(v)
+                for k, v in match_x.groupdict().items()
+                if v is not None}.items())[0]
+            y_interval, y_value = list({
+                k: int(v)
+                for k, v in match_y.groupdict().items()
+                if v is not None}.items())[0]
+
+            if x_interval == y_interval:
+                return cmp(x_value, y_value)
+            elif x_interval == 'upper_open':
+                return cmp(x_value, y_value) or -1
+            else:
+                return cmp(x_value, y_value) or 1
+
+        return cmp(x, y)
+
+    return sorted(tags, key=functools.cmp_to_key(_comparator))
+
+
+def wc_tags():
+    return one_of(
+        from_regex(r'\Awc:(<|&lt;)[0-9]{1,3}k\Z'),
+        from_regex(r'\Awc:[0-9]{1,3}k-[0-9]{1,3}k\Z'),
+    )
+
+
+@given(lists(one_of(text(), wc_tags(), sampled_from(['wc', 'w', 'wca']))))
+def test_custom_tag_sort_matches_original(tags):
+    assume(not any(
+        t.startswith('wc:') and filters.WC_TAG_REGEX.match(t) is None
+        for t in tags
+    ))
+    assert filters.custom_tag_sort(tags) == _original_custom_tag_sort(tags)
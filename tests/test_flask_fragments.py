@@ -0,0 +1,104 @@
+# -*- encoding: utf-8
+
+import os
+
+from pincushion.flask.fragments import fragment_key, FragmentCache
+
+
+class Renderer:
+    def __init__(self, html):
+        self.html = html
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.html
+
+
+def test_fragment_key_depends_on_all_parts():
+    b = {'id': 'example-org', 'title': 'Example'}
+    assert fragment_key(b, '2 days ago') == fragment_key(b, '2 days ago')
+    assert fragment_key(b, '2 days ago') != fragment_key(b, '3 days ago')
+    assert (
+        fragment_key(b, '2 days ago') !=
+        fragment_key(dict(b, title='Changed'), '2 days ago')
+    )
+
+
+def test_fragments_are_cached_in_memory():
+    cache = FragmentCache(maxsize=10)
+    render = Renderer('<p>fish</p>')
+
+    assert cache.get_or_render('a', render) == '<p>fish</p>'
+    assert cache.get_or_render('a', render) == '<p>fish</p>'
+    assert render.calls == 1
+    assert len(cache) == 1
+
+
+def test_fragments_are_shared_on_disk(tmpdir):
+    cache1 = FragmentCache(maxsize=10, directory=str(tmpdir))
+    cache2 = FragmentCache(maxsize=10, directory=str(tmpdir))
+    render = Renderer('<p>“chips”</p>')
+
+    assert cache1.get_or_render('abcdef', render) == '<p>“chips”</p>'
+    assert cache2.get_or_render('abcdef', render) == '<p>“chips”</p>'
+    assert render.calls == 1
+
+
+def test_no_temporary_files_are_left_behind(tmpdir):
+    cache = FragmentCache(maxsize=10, directory=str(tmpdir))
+    cache.get_or_render('abcdef', Renderer('<p>peas</p>'))
+
+    assert os.listdir(str(tmpdir)) == ['ab']
+    assert os.listdir(str(tmpdir.join('ab'))) == ['abcdef.html']
+
+
+def test_least_recently_used_fragments_are_pruned(tmpdir):
+    cache = FragmentCache(
+        maxsize=10, directory=str(tmpdir), max_bytes=25, prune_interval=3
+    )
+    for i, key in enumerate(['aa1', 'bb2']):
+        cache.get_or_render(key, Renderer('x' * 10))
+        os.utime(cache._path(key), (i, i))
+
+    # Reading a fragment from disk marks it as recently used, so 'aa1'
+    # outlives 'bb2'.
+    FragmentCache(maxsize=10, directory=str(tmpdir)).get_or_render(
+        'aa1', Renderer('unused')
+    )
+    cache.get_or_render('cc3', Renderer('x' * 10))
+
+    assert os.path.exists(cache._path('aa1'))
+    assert not os.path.exists(cache._path('bb2'))
+    assert os.path.exists(cache._path('cc3'))
+
+
+def test_pruning_skips_temporary_files(tmpdir):
+    cache = FragmentCache(maxsize=10, directory=str(tmpdir), max_bytes=0)
+    cache.get_or_render('aa1', Renderer('x' * 10))
+    tmpdir.join('aa', 'tmp1234').write('in progress')
+
+    cache.prune()
+    assert os.listdir(str(tmpdir.join('aa'))) == ['tmp1234']
+
+
+def test_pruning_tolerates_files_deleted_by_another_process(
+    tmpdir, monkeypatch
+):
+    cache = FragmentCache(maxsize=10, directory=str(tmpdir), max_bytes=0)
+    for key in ['aa1', 'bb2']:
+        cache.get_or_render(key, Renderer('x' * 10))
+
+    real_stat = os.stat
+
+    def _stat(path, *args, **kwargs):
+        if path.endswith('aa1.html'):
+            raise FileNotFoundError(path)
+        return real_stat(path, *args, **kwargs)
+
+    def _unlink(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'stat', _stat)
+    monkeypatch.setattr(os, 'unlink', _unlink)
+    cache.prune()
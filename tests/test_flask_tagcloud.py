@@ -1,7 +1,9 @@
 # -*- encoding: utf-8
 
+import attr
 from hypothesis import given
 from hypothesis.strategies import dictionaries, integers, text
+import pytest
 
 from pincushion.flask import build_tag_cloud, TagcloudOptions
 
@@ -63,3 +65,77 @@ def test_same_start_end_size_means_always_same_size(
 
     result = build_tag_cloud(counter=counter, options=options)
     assert all(v.size == 12 for v in result.values())
+
+
+def _reference_tag_cloud(counter, options):
+    # The original implementation, which built a new colour object for
+    # every tag.  The lookup table should give exactly the same results.
+    weight_min = min(counter.values())
+    weight_range = (max(counter.values()) - weight_min) or 1
+    font_incr = (options.size_end - options.size_start) / weight_range
+    colr_incr = [
+        (end - start) / weight_range
+        for start, end in zip(options.colr_start, options.colr_end)
+    ]
+
+    result = {}
+    for label, weight in counter.items():
+        weighting = weight - weight_min
+        colr = [
+            start + incr * weighting
+            for start, incr in zip(options.colr_start, colr_incr)
+        ]
+        result[label] = (
+            options.size_start + font_incr * weighting,
+            '#%02x%02x%02x' % tuple(int(c) for c in colr)
+        )
+    return result
+
+
+@given(
+    size_start=font_size(), size_end=font_size(),
+    colr_start=hex_colour(), colr_end=hex_colour(),
+    counter=counters()
+)
+def test_matches_reference_implementation(
+    size_start, size_end, colr_start, colr_end, counter
+):
+    options = TagcloudOptions(
+        size_start=size_start,
+        size_end=size_end,
+        colr_start=colr_start,
+        colr_end=colr_end
+    )
+
+    result = build_tag_cloud(counter=counter, options=options)
+    if counter:
+        expected = _reference_tag_cloud(counter, options)
+    else:
+        expected = {}
+    assert {k: (v.size, v.colr) for k, v in result.items()} == expected
+
+
+def test_results_are_cached_per_aggregation():
+    options = TagcloudOptions(
+        size_start=9, size_end=24, colr_start='#999999', colr_end='#bd450b'
+    )
+
+    result1 = build_tag_cloud({'python': 10, 'rust': 3}, options=options)
+    result2 = build_tag_cloud({'python': 10, 'rust': 3}, options=options)
+    result3 = build_tag_cloud({'python': 10, 'rust': 4}, options=options)
+
+    assert result1 is result2
+    assert result1 is not result3
+    assert result1['python'] == result3['python']
+    assert result1['python'].colr == '#bd450b'
+    assert result1['rust'].colr == '#999999'
+
+
+def test_cached_entries_cannot_be_modified():
+    options = TagcloudOptions(
+        size_start=9, size_end=24, colr_start='#999999', colr_end='#bd450b'
+    )
+    result = build_tag_cloud({'python': 10, 'rust': 3}, options=options)
+
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        result['python'].size = 100
@@ -0,0 +1,66 @@
+# -*- encoding: utf-8
+
+import flask
+
+from pincushion.flask import timing
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = timing.Histogram(buckets=(0.1, 1))
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [
+        ('0.1', 2), ('1', 3), ('+Inf', 4)
+    ]
+    assert histogram.count == 4
+    assert histogram.sum == 2.65
+
+
+def test_metrics_are_rendered_in_prometheus_format():
+    metrics = timing.Metrics()
+    metrics.observe('pincushion_stage_duration_seconds', 'es', 0.002)
+    metrics.observe('pincushion_stage_duration_seconds', 'es', 0.02)
+
+    text = metrics.render()
+    assert '# TYPE pincushion_stage_duration_seconds histogram\n' in text
+    assert (
+        'pincushion_stage_duration_seconds_bucket{stage="es",le="0.0025"} 1\n'
+        in text
+    )
+    assert (
+        'pincushion_stage_duration_seconds_bucket{stage="es",le="+Inf"} 2\n'
+        in text
+    )
+    assert 'pincushion_stage_duration_seconds_count{stage="es"} 2\n' in text
+    assert '# TYPE pincushion_request_duration_seconds histogram\n' in text
+
+
+def test_repeated_spans_are_added_together():
+    clock = FakeClock()
+    timer = timing.RequestTimer(clock=clock)
+
+    with timer.span('markdown'):
+        clock.now += 0.001
+    with timer.span('es'):
+        clock.now += 0.010
+    with timer.span('markdown'):
+        clock.now += 0.002
+
+    assert timer.server_timing(timer.elapsed()) == (
+        'markdown;dur=3.0, es;dur=10.0, total;dur=13.0'
+    )
+
+
+def test_span_does_nothing_outside_a_timed_request():
+    app = flask.Flask(__name__)
+    with app.test_request_context('/'):
+        assert timing.timed('es', lambda x: x + 1)(1) == 2
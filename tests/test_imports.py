@@ -0,0 +1,154 @@
+# -*- encoding: utf-8
+"""
+Check that the entry points stay quick to start.
+
+Short-lived scripts (and restarted viewer workers) can spend most of their
+time importing, so heavy libraries should only be loaded when they're
+actually used.  These tests run each entry point in a fresh interpreter,
+and check which modules it loaded and how long that took.
+
+The timings come from ``python -X importtime``, which was added in
+Python 3.7; older versions ignore it, so we skip those checks there.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pincushion
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(pincushion.__file__)))
+
+# Libraries that take 50ms+ to import, and which we don't want to load
+# until we need them.
+HEAVY_MODULES = {
+    'boto3', 'botocore', 'elasticsearch', 'flask', 'markdown', 'requests',
+}
+
+
+def _run_python(args, **kwargs):
+    proc = subprocess.run(
+        [sys.executable] + args,
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=SRC),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        **kwargs
+    )
+    assert proc.returncode == 0, proc.stderr
+    return proc
+
+
+# Runs some code, then writes the names of the top-level modules it loaded
+# to stderr.  ``--help`` makes docopt exit, so we catch SystemExit to make
+# sure we still get the list.
+_LIST_MODULES = '''
+import sys
+try:
+    exec(sys.stdin.read())
+except SystemExit:
+    pass
+print(' '.join(sorted({m.split('.')[0] for m in sys.modules})), file=sys.stderr)
+'''
+
+
+def _loaded_modules(code, expected):
+    """Run ``code`` in a fresh interpreter, and return the set of top-level
+    modules it loaded.
+    """
+    proc = _run_python(['-c', _LIST_MODULES], input=code)
+    modules = set(proc.stderr.splitlines()[-1].split())
+
+    # If the code didn't run (or we didn't read the list properly), every
+    # check would pass without testing anything.  ``expected`` is a module
+    # we know the code loads.
+    assert expected in modules, proc.stderr
+    return modules
+
+
+def _run_script(script):
+    return (
+        'import runpy\n'
+        f'sys.argv = [{script!r}, "--help"]\n'
+        f'runpy.run_path({script!r}, run_name="__main__")\n'
+    )
+
+
+def _import_times(args):
+    """Run Python with ``-X importtime``, and return a dict of top-level
+    module name -> cumulative import time (in microseconds).
+    """
+    proc = _run_python(['-X', 'importtime'] + args)
+
+    # Lines look like "import time:  self [us] | cumulative | name", with
+    # the name indented to show nesting.  We only want the top-level ones.
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('  ') or not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+
+    # If we didn't find any import times, every check would pass without
+    # testing anything.
+    assert times, f'No import times found in:\n{proc.stderr}'
+    return times
+
+
+@pytest.mark.parametrize('module', [
+    'pincushion.archive',
+    'pincushion.bookmarks',
+    'pincushion.constants',
+    'pincushion.instrumentation',
+    'pincushion.linkcheck',
+    'pincushion.profiling',
+    'pincushion.revalidate',
+    'pincushion.scratch',
+    'pincushion.services.aws',
+    'pincushion.services.elasticsearch',
+    'pincushion.services.http',
+])
+def test_library_modules_dont_load_heavy_dependencies(module):
+    modules = _loaded_modules(f'import {module}', expected='pincushion')
+    assert not (modules & HEAVY_MODULES)
+
+
+@pytest.mark.parametrize('script', [
+    'run_asset_fetcher.py',
+    'run_indexer.py',
+    'run_link_checker.py',
+    'run_metadata_fetcher.py',
+    'run_viewer.py',
+])
+def test_scripts_print_help_without_loading_heavy_dependencies(script):
+    modules = _loaded_modules(_run_script(script), expected='docopt')
+    assert not (modules & HEAVY_MODULES)
+
+
+# Budgets for the total import time of each entry point, in milliseconds.
+# These are deliberately generous, so they only catch big regressions --
+# like a heavy import sneaking back in at the top level.  The viewer is
+# allowed more: it loads Flask and markdown up front, but gunicorn preloads
+# it once, before forking the workers.
+@pytest.mark.parametrize('args, budget_ms', [
+    (['run_indexer.py', '--help'], 150),
+    (['run_link_checker.py', '--help'], 150),
+    (['run_metadata_fetcher.py', '--help'], 150),
+    (['run_asset_fetcher.py', '--help'], 150),
+    (['run_viewer.py', '--help'], 150),
+    (['-c', 'import pincushion.flask.app'], 1500),
+])
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason='-X importtime needs Python 3.7+'
+)
+def test_import_time_budget(args, budget_ms):
+    times = _import_times(args)
+    assert sum(times.values()) / 1000 < budget_ms
@@ -0,0 +1,185 @@
+# -*- encoding: utf-8
+
+import io
+import json
+import os
+import pstats
+import threading
+
+import pytest
+
+from pincushion.instrumentation import RunReport
+from pincushion.profiling import Profiler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_report(clock, **kwargs):
+    return RunReport(
+        'indexer', clock=clock, wall_clock=lambda: 1514764800.0,
+        out=io.StringIO(), **kwargs
+    )
+
+
+def test_stages_are_added_up(clock):
+    with make_report(clock) as report:
+        for _ in range(2):
+            with report.stage('pinboard_page') as stage:
+                clock.now += 0.5
+                stage.add(items=1, bytes=1000)
+        with report.stage('merge') as stage:
+            clock.now += 2
+            stage.add(items=400)
+
+    assert report.to_dict() == {
+        'script': 'indexer',
+        'started_at': '2018-01-01T00:00:00Z',
+        'duration': 3.0,
+        'succeeded': True,
+        'profile': None,
+        'stages': [
+            {
+                'name': 'pinboard_page',
+                'calls': 2,
+                'seconds': 1.0,
+                'items': 2,
+                'bytes': 2000,
+                'items_per_second': 2.0,
+                'bytes_per_second': 2000.0,
+            },
+            {
+                'name': 'merge',
+                'calls': 1,
+                'seconds': 2.0,
+                'items': 400,
+                'bytes': 0,
+                'items_per_second': 200.0,
+                'bytes_per_second': 0.0,
+            },
+        ],
+    }
+
+
+def test_instant_stages_have_zero_rate(clock):
+    with make_report(clock) as report:
+        with report.stage('merge') as stage:
+            stage.add(items=10)
+
+    assert report.to_dict()['stages'][0]['items_per_second'] == 0
+
+
+def test_failed_run_is_recorded(clock, tmpdir):
+    report = make_report(clock, textfile_dir=str(tmpdir))
+    with pytest.raises(ValueError):
+        with report:
+            with report.stage('s3_read'):
+                raise ValueError()
+
+    assert report.succeeded is False
+    assert report.stages['s3_read'].calls == 1
+    assert 'pincushion_sync_success{script="indexer"} 0\n' in (
+        tmpdir.join('pincushion_indexer.prom').read()
+    )
+
+
+def test_summary_is_printed(clock):
+    with make_report(clock) as report:
+        with report.stage('s3_write') as stage:
+            clock.now += 1
+            stage.add(items=5, bytes=3 * 1024 * 1024)
+
+    assert report._out.getvalue() == (
+        'indexer: finished in 1.0s\n'
+        '  s3_write              1.00s       1 calls        5 items '
+        '(5.0/s) 3.0 MB\n'
+    )
+
+
+def test_json_report_is_written(clock, tmpdir):
+    report_dir = str(tmpdir.join('reports'))
+    with make_report(clock, report_dir=report_dir) as report:
+        pass
+
+    assert os.listdir(report_dir) == ['indexer-20180101T000000Z.json']
+    with open(os.path.join(report_dir, os.listdir(report_dir)[0])) as f:
+        assert json.load(f) == report.to_dict()
+
+
+def test_textfile_is_written(clock, tmpdir):
+    with make_report(clock, textfile_dir=str(tmpdir)) as report:
+        with report.stage('bulk_index') as stage:
+            clock.now += 4
+            stage.add(items=100)
+
+    assert os.listdir(str(tmpdir)) == ['pincushion_indexer.prom']
+    text = tmpdir.join('pincushion_indexer.prom').read()
+    assert 'pincushion_sync_duration_seconds{script="indexer"} 4.0\n' in text
+    assert (
+        'pincushion_sync_stage_items{script="indexer",stage="bulk_index"} '
+        '100\n'
+    ) in text
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv('PINCUSHION_REPORT_DIR', '/reports')
+    monkeypatch.delenv('PINCUSHION_TEXTFILE_DIR', raising=False)
+
+    report = RunReport.from_env('asset_fetcher')
+    assert report.script == 'asset_fetcher'
+    assert report.report_dir == '/reports'
+    assert report.textfile_dir is None
+
+
+def test_run_can_be_profiled(clock, tmpdir):
+    profiler = Profiler(str(tmpdir))
+    with make_report(clock, profiler=profiler) as report:
+        pass
+
+    assert os.path.dirname(report.profile) == str(tmpdir)
+    assert os.path.exists(report.profile)
+    assert report.to_dict()['profile'] == report.profile
+    assert f'profile written to {report.profile}' in report.summary()
+
+
+def test_worker_threads_are_profiled(clock, tmpdir):
+    def worker_only_function():
+        return sum(i * i for i in range(1000))
+
+    def worker():
+        for _ in range(2):
+            with report.profile_thread():
+                worker_only_function()
+
+    profiler = Profiler(str(tmpdir))
+    with make_report(clock, profiler=profiler) as report:
+        # The main thread isn't profiled twice.
+        with report.profile_thread():
+            pass
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    assert len(report._thread_profiles) == 1
+    stats = pstats.Stats(report.profile)
+    functions = {name for _, _, name in stats.stats}
+    assert 'worker_only_function' in functions
+
+
+def test_profile_thread_does_nothing_without_a_profiler(clock):
+    with make_report(clock) as report:
+        with report.profile_thread():
+            pass
+
+    assert report._thread_profiles == []
@@ -0,0 +1,249 @@
+# -*- encoding: utf-8
+
+import io
+import json
+
+import attr
+import pytest
+import requests
+
+from pincushion import bookmarks as pin_bookmarks
+from pincushion import linkcheck
+from pincushion.instrumentation import RunReport
+
+
+@attr.s
+class FakeResponse:
+    status_code = attr.ib()
+    url = attr.ib()
+    closed = attr.ib(default=False)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Pretends to be a ``requests.Session``.  ``responses`` is a dict
+    of ``(method, url) -> status_code or exception class``.
+    """
+    def __init__(self, responses, redirects=None):
+        self.responses = responses
+        self.redirects = redirects or {}
+        self.requests = []
+
+    def _request(self, method, url):
+        self.requests.append((method, url))
+        result = self.responses[(method, url)]
+        if isinstance(result, type):
+            raise result()
+        return FakeResponse(
+            status_code=result, url=self.redirects.get(url, url)
+        )
+
+    def head(self, url, allow_redirects, timeout):
+        assert allow_redirects
+        return self._request('HEAD', url)
+
+    def get(self, url, allow_redirects, timeout, stream):
+        assert allow_redirects
+        assert stream
+        return self._request('GET', url)
+
+
+def test_successful_head_doesnt_need_get():
+    sess = FakeSession(
+        responses={('HEAD', 'http://example.org'): 200},
+        redirects={'http://example.org': 'https://example.org/'}
+    )
+
+    result = linkcheck.check_url(sess, 'http://example.org')
+    assert result['status'] == 200
+    assert result['ok']
+    assert result['final_url'] == 'https://example.org/'
+    assert 'checked_at' in result
+    assert sess.requests == [('HEAD', 'http://example.org')]
+
+
+@pytest.mark.parametrize('head_result', [
+    405, 404, requests.exceptions.ConnectionError
+])
+def test_falls_back_to_get(head_result):
+    sess = FakeSession(responses={
+        ('HEAD', 'https://example.org'): head_result,
+        ('GET', 'https://example.org'): 200,
+    })
+
+    result = linkcheck.check_url(sess, 'https://example.org')
+    assert result['status'] == 200
+    assert result['ok']
+    assert sess.requests == [
+        ('HEAD', 'https://example.org'),
+        ('GET', 'https://example.org'),
+    ]
+
+
+def test_dead_link_is_not_ok():
+    sess = FakeSession(responses={
+        ('HEAD', 'https://example.org'): 404,
+        ('GET', 'https://example.org'): 404,
+    })
+
+    result = linkcheck.check_url(sess, 'https://example.org')
+    assert result['status'] == 404
+    assert not result['ok']
+
+
+def test_unreachable_link_records_error():
+    sess = FakeSession(responses={
+        ('HEAD', 'https://example.org'): requests.exceptions.ConnectionError,
+        ('GET', 'https://example.org'): requests.exceptions.ConnectionError,
+    })
+
+    result = linkcheck.check_url(sess, 'https://example.org')
+    assert result['status'] is None
+    assert not result['ok']
+    assert result['final_url'] is None
+    assert result['error'] == 'ConnectionError'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+def test_rate_limiter_spaces_out_requests_to_the_same_host():
+    clock = FakeClock()
+    limiter = linkcheck.HostRateLimiter(
+        interval=2, clock=clock, sleep=clock.sleep
+    )
+
+    limiter.wait('https://example.org/1')
+    limiter.wait('https://example.org/2')
+    limiter.wait('https://example.org/3')
+    assert clock.sleeps == [2, 4]
+
+
+def test_rate_limiter_doesnt_delay_different_hosts():
+    clock = FakeClock()
+    limiter = linkcheck.HostRateLimiter(
+        interval=2, clock=clock, sleep=clock.sleep
+    )
+
+    limiter.wait('https://example.org/1')
+    limiter.wait('https://example.net/1')
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_doesnt_delay_after_interval():
+    clock = FakeClock()
+    limiter = linkcheck.HostRateLimiter(
+        interval=2, clock=clock, sleep=clock.sleep
+    )
+
+    limiter.wait('https://example.org/1')
+    clock.now = 5
+    limiter.wait('https://example.org/2')
+    assert clock.sleeps == []
+
+
+def test_check_urls_checks_everything_in_order():
+    urls = [f'https://example{i}.org' for i in range(20)]
+    sess = FakeSession(responses={('HEAD', u): 200 for u in urls})
+
+    result = list(linkcheck.check_urls(
+        sess, urls, workers=4, limiter=linkcheck.HostRateLimiter(interval=0)
+    ))
+    assert [u for u, _ in result] == urls
+    assert all(r['ok'] for _, r in result)
+
+
+def test_check_urls_records_stage_in_report():
+    urls = [f'https://example{i}.org' for i in range(5)]
+    sess = FakeSession(responses={('HEAD', u): 200 for u in urls})
+
+    with RunReport('link_checker', out=io.StringIO()) as report:
+        list(linkcheck.check_urls(
+            sess, urls, workers=2,
+            limiter=linkcheck.HostRateLimiter(interval=0), report=report
+        ))
+
+    assert report.stages['check_url'].calls == 5
+    assert report.stages['check_url'].items == 5
+
+
+def test_check_bookmarks_stores_results_on_bookmarks():
+    bookmarks = {
+        'example-org-1': {'href': 'https://example.org/1'},
+        'example-org-1-again': {'href': 'https://example.org/1'},
+        'example-org-2': {'href': 'https://example.org/2'},
+    }
+    sess = FakeSession(responses={
+        ('HEAD', 'https://example.org/1'): 200,
+        ('HEAD', 'https://example.org/2'): 404,
+        ('GET', 'https://example.org/2'): 404,
+    })
+
+    result = dict(linkcheck.check_bookmarks(
+        sess, bookmarks, workers=2,
+        limiter=linkcheck.HostRateLimiter(interval=0)
+    ))
+
+    assert sorted(result) == ['https://example.org/1', 'https://example.org/2']
+    assert bookmarks['example-org-1']['_link']['ok']
+    assert bookmarks['example-org-1-again']['_link']['ok']
+    assert not bookmarks['example-org-2']['_link']['ok']
+    assert sess.requests.count(('HEAD', 'https://example.org/1')) == 1
+
+
+def test_rechecking_a_link_replaces_the_stored_result():
+    # This mimics run_link_checker.py: read the bookmarks from S3, check
+    # them, then copy the results into a fresh read of the bookmarks.
+    stored = json.dumps({'example-org': {'href': 'https://example.org'}})
+
+    def run_link_checker(stored, status):
+        bookmarks = json.loads(stored)
+        sess = FakeSession(responses={
+            ('HEAD', 'https://example.org'): status,
+            ('GET', 'https://example.org'): status,
+        })
+        list(linkcheck.check_bookmarks(
+            sess, bookmarks, workers=1,
+            limiter=linkcheck.HostRateLimiter(interval=0)
+        ))
+        return json.dumps(pin_bookmarks.merge_fields(
+            latest=json.loads(stored), updated=bookmarks, fields=['_link']
+        ))
+
+    stored = run_link_checker(stored, status=404)
+    assert json.loads(stored)['example-org']['_link']['status'] == 404
+
+    stored = run_link_checker(stored, status=200)
+    assert json.loads(stored)['example-org']['_link']['status'] == 200
+
+
+@pytest.mark.parametrize('urls, expected', [
+    ([], []),
+    (
+        ['https://a.org/1', 'https://a.org/2', 'https://b.org/1'],
+        ['https://a.org/1', 'https://b.org/1', 'https://a.org/2'],
+    ),
+    (
+        [
+            'https://a.org/1', 'https://a.org/2', 'https://a.org/3',
+            'https://b.org/1', 'https://c.org/1', 'https://c.org/2',
+        ],
+        [
+            'https://a.org/1', 'https://b.org/1', 'https://c.org/1',
+            'https://a.org/2', 'https://c.org/2', 'https://a.org/3',
+        ],
+    ),
+])
+def test_interleave_by_host(urls, expected):
+    assert linkcheck.interleave_by_host(urls) == expected
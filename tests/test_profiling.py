@@ -0,0 +1,98 @@
+# -*- encoding: utf-8
+
+import os
+import pstats
+
+import pytest
+
+from pincushion.profiling import Profiler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def busy_work():
+    return sum(i * i for i in range(1000))
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def profiler(tmpdir, clock):
+    return Profiler(str(tmpdir.join('profiles')), clock=clock)
+
+
+def test_profile_is_saved(profiler):
+    profile = profiler.start()
+    busy_work()
+    filename = profiler.stop(profile, 'index')
+
+    assert filename.startswith('index-')
+    assert os.listdir(profiler.directory) == [filename]
+
+    stats = pstats.Stats(os.path.join(profiler.directory, filename))
+    functions = {name for _, _, name in stats.stats}
+    assert 'busy_work' in functions
+
+
+def test_only_one_profile_at_a_time(profiler):
+    profile = profiler.start()
+    assert profiler.start() is None
+    profiler.stop(profile, 'index')
+
+
+def test_profiles_are_rate_limited(profiler, clock):
+    profiler.stop(profiler.start(), 'index')
+
+    clock.now += 30
+    assert profiler.start() is None
+
+    clock.now += 30
+    profile = profiler.start()
+    assert profile is not None
+    profiler.stop(profile, 'index')
+
+
+def test_oldest_profiles_are_deleted(profiler, clock):
+    profiler.max_bytes = 1
+
+    for name in ['first', 'second']:
+        profiler.stop(profiler.start(), name)
+        clock.now += 60
+
+    files = os.listdir(profiler.directory)
+    assert len(files) == 1
+    assert files[0].startswith('second-')
+
+
+def test_profiles_under_the_limit_are_kept(profiler, clock):
+    for name in ['first', 'second']:
+        profiler.stop(profiler.start(), name)
+        clock.now += 60
+
+    assert len(os.listdir(profiler.directory)) == 2
+
+
+def test_other_files_are_left_alone(profiler):
+    profiler.max_bytes = 1
+    with open(os.path.join(profiler.directory, 'notes.txt'), 'w') as f:
+        f.write('important')
+
+    filename = profiler.stop(profiler.start(), 'index')
+    assert sorted(os.listdir(profiler.directory)) == [filename, 'notes.txt']
+
+
+def test_from_env(monkeypatch, tmpdir):
+    monkeypatch.delenv('PINCUSHION_PROFILE_DIR', raising=False)
+    assert Profiler.from_env() is None
+
+    monkeypatch.setenv('PINCUSHION_PROFILE_DIR', str(tmpdir))
+    assert Profiler.from_env().directory == str(tmpdir)
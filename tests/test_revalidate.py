@@ -0,0 +1,110 @@
+# -*- encoding: utf-8
+
+import attr
+import pytest
+import requests
+
+from pincushion import revalidate
+
+
+@attr.s
+class FakeResponse:
+    status_code = attr.ib()
+    content = attr.ib(default=b'')
+    headers = attr.ib(default=attr.Factory(dict))
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.status_code)
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def get(self, url, headers, timeout):
+        self.requests.append((url, headers))
+        return self.response
+
+
+@pytest.mark.parametrize('validators, expected_headers', [
+    ({}, {}),
+    ({'sha256': 'abc'}, {}),
+    ({'etag': '"123"'}, {'If-None-Match': '"123"'}),
+    (
+        {'last_modified': 'Wed, 27 Dec 2017 00:20:14 GMT'},
+        {'If-Modified-Since': 'Wed, 27 Dec 2017 00:20:14 GMT'}
+    ),
+    (
+        {'etag': '"123"', 'last_modified': 'Wed, 27 Dec 2017 00:20:14 GMT'},
+        {
+            'If-None-Match': '"123"',
+            'If-Modified-Since': 'Wed, 27 Dec 2017 00:20:14 GMT',
+        }
+    ),
+])
+def test_conditional_headers(validators, expected_headers):
+    assert revalidate.conditional_headers(validators) == expected_headers
+
+
+def test_not_modified_is_unchanged():
+    validators = {'etag': '"123"', 'sha256': 'abc'}
+    sess = FakeSession(FakeResponse(status_code=304))
+
+    result = revalidate.check_for_changes(
+        sess, url='https://example.org', validators=validators
+    )
+    assert result == (False, validators)
+    assert sess.requests == [
+        ('https://example.org', {'If-None-Match': '"123"'})
+    ]
+
+
+def test_same_content_is_unchanged():
+    validators = {'sha256': revalidate.content_hash(b'hello world')}
+    sess = FakeSession(FakeResponse(
+        status_code=200, content=b'hello world', headers={'ETag': '"456"'}
+    ))
+
+    changed, new_validators = revalidate.check_for_changes(
+        sess, url='https://example.org', validators=validators
+    )
+    assert not changed
+    assert new_validators == {'etag': '"456"', 'sha256': validators['sha256']}
+
+
+def test_different_content_is_changed():
+    validators = {'sha256': revalidate.content_hash(b'hello world')}
+    sess = FakeSession(FakeResponse(
+        status_code=200,
+        content=b'goodbye world',
+        headers={'Last-Modified': 'Wed, 27 Dec 2017 00:20:14 GMT'}
+    ))
+
+    changed, new_validators = revalidate.check_for_changes(
+        sess, url='https://example.org', validators=validators
+    )
+    assert changed
+    assert new_validators == {
+        'last_modified': 'Wed, 27 Dec 2017 00:20:14 GMT',
+        'sha256': revalidate.content_hash(b'goodbye world'),
+    }
+
+
+def test_never_seen_page_is_changed():
+    sess = FakeSession(FakeResponse(status_code=200, content=b'hello world'))
+
+    changed, _ = revalidate.check_for_changes(
+        sess, url='https://example.org', validators={}
+    )
+    assert changed
+
+
+def test_error_response_is_error():
+    sess = FakeSession(FakeResponse(status_code=404))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        revalidate.check_for_changes(
+            sess, url='https://example.org', validators={}
+        )
@@ -0,0 +1,100 @@
+# -*- encoding: utf-8
+
+import os
+import threading
+
+import pytest
+
+from pincushion.scratch import ScratchSpace
+
+
+@pytest.fixture
+def scratch(tmpdir):
+    root = str(tmpdir.join('scratch'))
+    with ScratchSpace(
+        root=root, budget=100, spool_threshold=10, poll_interval=0.01
+    ) as s:
+        yield s
+
+
+def test_private_directory_is_created_and_removed(tmpdir):
+    root = str(tmpdir.join('scratch'))
+    with ScratchSpace(root=root, budget=100, spool_threshold=10) as s:
+        assert os.path.isdir(s.path)
+        assert os.path.dirname(s.path) == root
+    assert not os.path.exists(s.path)
+    assert os.listdir(root) == []
+
+
+def test_other_files_in_root_are_left_alone(tmpdir):
+    root = tmpdir.mkdir('home')
+    root.join('notes.txt').write('important')
+
+    with ScratchSpace(root=str(root), budget=100, spool_threshold=10):
+        pass
+
+    assert root.join('notes.txt').read() == 'important'
+
+
+def test_workdir_is_removed_on_exit(scratch):
+    with scratch.workdir() as path:
+        with open(os.path.join(path, 'index.html'), 'wb') as outfile:
+            outfile.write(b'x' * 50)
+        assert os.path.dirname(path) == scratch.path
+        assert scratch.usage() == 50
+
+    assert not os.path.exists(path)
+    assert scratch.usage() == 0
+
+
+def test_workdir_is_removed_after_error(scratch):
+    with pytest.raises(RuntimeError):
+        with scratch.workdir() as path:
+            raise RuntimeError('Something went wrong')
+
+    assert not os.path.exists(path)
+
+
+def test_workdir_waits_for_space(scratch):
+    entered = threading.Event()
+
+    def _second_worker():
+        with scratch.workdir():
+            entered.set()
+
+    with scratch.workdir() as path:
+        with open(os.path.join(path, 'big.jpg'), 'wb') as outfile:
+            outfile.write(b'x' * 150)
+
+        thread = threading.Thread(target=_second_worker)
+        thread.start()
+
+        # While we're over budget, the second worker should be blocked.
+        assert not entered.wait(timeout=0.1)
+
+    thread.join(timeout=1)
+    assert entered.is_set()
+
+
+def test_spooled_file_stays_in_memory_below_threshold(scratch):
+    with scratch.spooled_file() as f:
+        f.write(b'x' * 5)
+        assert not f._rolled
+
+
+def test_spooled_file_spills_to_disk_above_threshold(scratch):
+    with scratch.spooled_file() as f:
+        f.write(b'x' * 50)
+        assert f._rolled
+
+
+def test_usage_ignores_files_deleted_while_counting(scratch, monkeypatch):
+    with scratch.workdir() as path:
+        with open(os.path.join(path, 'index.html'), 'wb') as outfile:
+            outfile.write(b'x' * 50)
+
+        def _getsize(path):
+            raise FileNotFoundError(path)
+
+        monkeypatch.setattr(os.path, 'getsize', _getsize)
+        assert scratch.usage() == 0
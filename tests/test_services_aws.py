@@ -1,5 +1,7 @@
 # -*- encoding: utf-8
 
+import io
+
 import boto3
 from moto import mock_s3
 import pytest
@@ -49,7 +51,7 @@ def test_write_json_to_s3():
         CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
     )
 
-    aws.write_json_to_s3(
+    size = aws.write_json_to_s3(
         bucket='bukkit',
         key='myfile.json',
         data={'a': 'apple', 'b': 'banana', 'c': ['coconut', 'cherry']}
@@ -58,3 +60,49 @@ def test_write_json_to_s3():
     obj = client.get_object(Bucket='bukkit', Key='myfile.json')
     result = obj['Body'].read()
     assert result == b'{"a":"apple","b":"banana","c":["coconut","cherry"]}'
+    assert size == len(result)
+
+
+@mock_s3
+def test_read_bytes_from_s3():
+    client = boto3.client('s3', region_name='eu-west-1')
+    client.create_bucket(
+        Bucket='bukkit',
+        CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+    )
+    client.put_object(
+        Bucket='bukkit',
+        Key='alphabet.txt',
+        Body=b'abcdefghijklmnopqrstuvwxyz'
+    )
+
+    result = aws.read_bytes_from_s3(
+        bucket='bukkit', key='alphabet.txt', offset=3, length=5
+    )
+    assert result == b'defgh'
+
+
+@mock_s3
+def test_upload_fileobj_to_s3():
+    client = boto3.client('s3', region_name='eu-west-1')
+    client.create_bucket(
+        Bucket='bukkit',
+        CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+    )
+
+    aws.upload_fileobj_to_s3(
+        bucket='bukkit',
+        key='myfile.txt',
+        fileobj=io.BytesIO(b'hello world'),
+        content_type='text/plain'
+    )
+
+    obj = client.get_object(Bucket='bukkit', Key='myfile.txt')
+    assert obj['Body'].read() == b'hello world'
+    assert obj['ContentType'] == 'text/plain'
+
+
+def test_s3_endpoint_can_be_overridden(monkeypatch):
+    monkeypatch.setattr(aws, 'S3_ENDPOINT_URL', 'http://127.0.0.1:4566')
+    client = aws._s3_client()
+    assert client.meta.endpoint_url == 'http://127.0.0.1:4566'
@@ -1,5 +1,6 @@
 # -*- encoding: utf-8
 
+from elasticsearch.exceptions import RequestError
 import pytest
 
 from pincushion.services import elasticsearch as es
@@ -29,6 +30,19 @@ def test_add_tag_to_query(existing_query, new_tag, expected_query):
     assert result == expected_query
 
 
+@pytest.mark.parametrize('query_string, expected', [
+    ('', ''),
+    ('fish', 'fish'),
+    ('  fish\t tags:chips\n', 'fish tags:chips'),
+    ('tags:peas fish tags:chips', 'fish tags:chips tags:peas'),
+    ('link:ok tags:chips', 'link:ok tags:chips'),
+    ('"fish and chips"', "'fish and chips'"),
+    ('fish  "chips', 'fish "chips'),
+])
+def test_normalise_query(query_string, expected):
+    assert es.normalise_query(query_string) == expected
+
+
 class TestResultList:
 
     @pytest.mark.parametrize('page_size, page, expected_start_idx', [
@@ -98,3 +112,176 @@ class TestResultList:
             tags=[]
         )
         assert rlist.total_pages == expected_total_pages
+
+
+def test_parse_search_response():
+    data = {
+        'hits': {
+            'total': 200,
+            'hits': [
+                {'_id': 'example-org', '_source': {'title': 'Example'}},
+                {'_id': 'example-net', '_source': {'title': 'Another'}},
+            ],
+        },
+        'aggregations': {
+            'tags': {
+                'buckets': [
+                    {'key': 'fish', 'doc_count': 10},
+                    {'key': 'chips', 'doc_count': 5},
+                ],
+            },
+        },
+    }
+
+    result = es.parse_search_response(data, page=2, page_size=96)
+    assert result == es.ResultList(
+        total_size=200,
+        page=2,
+        page_size=96,
+        bookmarks=[
+            {'id': 'example-org', 'title': 'Example'},
+            {'id': 'example-net', 'title': 'Another'},
+        ],
+        tags={'fish': 10, 'chips': 5}
+    )
+
+
+def _sorted_response(*sort_values):
+    return {
+        'hits': {
+            'total': 200,
+            'hits': [
+                {'_id': s[1], '_source': {}, 'sort': list(s)}
+                for s in sort_values
+            ],
+        },
+        'aggregations': {'tags': {'buckets': []}},
+    }
+
+
+def test_parse_search_response_records_sort_values():
+    data = _sorted_response(('2018-02-01', 'b'), ('2018-01-01', 'a'))
+
+    result = es.parse_search_response(data, page=2, page_size=2)
+    assert result.first_sort == ['2018-02-01', 'b']
+    assert result.last_sort == ['2018-01-01', 'a']
+
+
+def test_parse_search_response_flips_reversed_hits():
+    data = _sorted_response(('2018-01-01', 'a'), ('2018-02-01', 'b'))
+
+    result = es.parse_search_response(data, page=2, page_size=2, reverse=True)
+    assert [b['id'] for b in result.bookmarks] == ['b', 'a']
+    assert result.first_sort == ['2018-02-01', 'b']
+
+
+def test_cursors_point_either_side_of_the_page():
+    data = _sorted_response(('2018-02-01', 'b'), ('2018-01-01', 'a'))
+    result = es.parse_search_response(data, page=2, page_size=2)
+
+    assert es.decode_cursor(result.next_cursor) == es.Cursor(
+        page=3, sort_values=['2018-01-01', 'a']
+    )
+    assert es.decode_cursor(result.prev_cursor) == es.Cursor(
+        page=1, sort_values=['2018-02-01', 'b'], reverse=True
+    )
+
+
+@pytest.mark.parametrize('page, total_size, has_prev, has_next', [
+    (1, 200, False, True),
+    (100, 200, True, False),
+])
+def test_no_cursors_past_the_ends(page, total_size, has_prev, has_next):
+    data = _sorted_response(('2018-02-01', 'b'), ('2018-01-01', 'a'))
+    data['hits']['total'] = total_size
+    result = es.parse_search_response(data, page=page, page_size=2)
+
+    assert (result.prev_cursor is not None) == has_prev
+    assert (result.next_cursor is not None) == has_next
+
+
+def test_relevance_results_dont_get_cursors():
+    data = {
+        'hits': {'total': 200, 'hits': [{'_id': 'a', '_source': {}}]},
+        'aggregations': {'tags': {'buckets': []}},
+    }
+    result = es.parse_search_response(data, page=2, page_size=1)
+    assert result.next_cursor is None
+    assert result.prev_cursor is None
+
+
+@pytest.mark.parametrize('token', [
+    'not base64!',
+    'bm90IGpzb24=',
+    'WzEsMl0=',
+    'WzAsW10sZmFsc2Vd',
+    '☃',
+])
+def test_decode_cursor_rejects_bad_tokens(token):
+    with pytest.raises(ValueError):
+        es.decode_cursor(token)
+
+
+def test_parse_search_response_with_filtered_empty_response():
+    # filter_path drops empty lists, so an empty search looks like this.
+    data = {'hits': {'total': 0}}
+
+    result = es.parse_search_response(data, page=1, page_size=96)
+    assert result.bookmarks == []
+    assert result.tags == {}
+    assert result.next_cursor is None
+
+
+def test_get_client_is_reused():
+    client = es.get_client('http://es.local:9200')
+    assert es.get_client('http://es.local:9200') is client
+    assert es.get_client('http://other.local:9200') is not client
+
+
+class FakeIndices:
+    def __init__(
+        self, existing=(), create_error='resource_already_exists_exception'
+    ):
+        self.mappings = {index: {} for index in existing}
+        self.create_error = create_error
+
+    def create(self, index, body):
+        if index in self.mappings:
+            raise RequestError(
+                400, self.create_error, {'error': {'type': self.create_error}}
+            )
+        self.mappings[index] = body['mappings']
+
+    def put_mapping(self, index, doc_type, body):
+        self.mappings[index][doc_type] = body
+
+
+class FakeClient:
+    def __init__(self, indices):
+        self.indices = indices
+
+
+def test_create_index_applies_mapping():
+    client = FakeClient(FakeIndices())
+    es.create_index(client, index='bookmarks', doc_type='bookmarks')
+
+    mapping = client.indices.mappings['bookmarks']['bookmarks']
+    assert mapping['properties']['id'] == {'type': 'keyword'}
+
+
+def test_create_index_updates_mapping_of_existing_index():
+    client = FakeClient(FakeIndices(existing=['bookmarks']))
+    es.create_index(client, index='bookmarks', doc_type='bookmarks')
+
+    mapping = client.indices.mappings['bookmarks']['bookmarks']
+    assert mapping['properties']['id'] == {'type': 'keyword'}
+    assert mapping['properties']['link_ok'] == {'type': 'boolean'}
+
+
+def test_create_index_raises_other_errors():
+    client = FakeClient(FakeIndices(
+        existing=['bookmarks'], create_error='invalid_index_name_exception'
+    ))
+    with pytest.raises(RequestError):
+        es.create_index(client, index='bookmarks', doc_type='bookmarks')
+    assert client.indices.mappings['bookmarks'] == {}
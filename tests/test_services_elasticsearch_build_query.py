@@ -4,7 +4,7 @@ from hypothesis import example, given
 from hypothesis.strategies import integers, text
 import pytest
 
-from pincushion.services.elasticsearch import build_query
+from pincushion.services.elasticsearch import build_query, Cursor
 
 
 @example('"')
@@ -42,7 +42,7 @@ def test_build_query_sets_from_correctly(page, page_size, expected_from):
 def test_build_query_sets_sort_correctly(query_string, expected_sort_time):
     query = build_query(query_string=query_string)
     if expected_sort_time:
-        assert query['sort'] == [{'time': 'desc'}]
+        assert query['sort'][0] == {'time': 'desc'}
     else:
         assert 'sort' not in query
 
@@ -78,9 +78,9 @@ def test_all_tag_queries_dont_have_free_text_search(query_string):
 ])
 def test_tag_queries_set_tag_filters(query_string, tags):
     query = build_query(query_string=query_string)
-    assert len(query['query']['bool']['filter']) == 1
-    filter_q = query['query']['bool']['filter'][0]
-    assert filter_q['terms_set']['tags.raw']['terms'] == tags
+    assert query['query']['bool']['filter'] == [
+        {'term': {'tags.raw': t}} for t in tags
+    ]
 
 
 @pytest.mark.parametrize('query_string', [
@@ -98,3 +98,74 @@ def test_query_always_has_tag_aggregations(query_string):
     query = build_query(query_string=query_string)
     assert 'aggregations' in query
     assert 'tags' in query['aggregations']
+
+
+@pytest.mark.parametrize('query_string, link_ok', [
+    ('link:ok', True),
+    ('link:dead', False),
+    ('tags:fish link:dead', False),
+])
+def test_link_queries_set_link_filters(query_string, link_ok):
+    query = build_query(query_string=query_string)
+    assert {'term': {'link_ok': link_ok}} in query['query']['bool']['filter']
+    assert 'must' not in query['query']['bool']
+    assert query['sort'][0] == {'time': 'desc'}
+
+
+def test_cursor_uses_search_after():
+    cursor = Cursor(page=500, sort_values=['2018-01-01T00:00:00Z', 'abc'])
+    query = build_query(query_string='tags:fish', cursor=cursor)
+    assert 'from' not in query
+    assert query['search_after'] == ['2018-01-01T00:00:00Z', 'abc']
+    assert query['sort'][0] == {'time': 'desc'}
+
+
+def test_reverse_cursor_flips_the_sort():
+    cursor = Cursor(
+        page=499, sort_values=['2018-01-01T00:00:00Z', 'abc'], reverse=True
+    )
+    query = build_query(query_string='', cursor=cursor)
+    assert query['search_after'] == ['2018-01-01T00:00:00Z', 'abc']
+    assert [list(s.values())[0] for s in query['sort']] == [
+        'asc', {'order': 'asc', 'unmapped_type': 'keyword'}
+    ]
+
+
+def test_relevance_queries_ignore_cursor_sort_values():
+    cursor = Cursor(page=3, sort_values=['2018-01-01T00:00:00Z', 'abc'])
+    query = build_query(query_string='whale', page_size=10, cursor=cursor)
+    assert 'search_after' not in query
+    assert query['from'] == 20
+
+
+def test_fields_are_projected():
+    query = build_query(query_string='', fields=['url', 'title'])
+    assert query['_source'] == ['url', 'title']
+
+
+def test_all_fields_returned_by_default():
+    query = build_query(query_string='')
+    assert '_source' not in query
+
+
+@pytest.mark.parametrize('tag_cloud_size', [0, None])
+def test_tag_aggregation_can_be_skipped(tag_cloud_size):
+    query = build_query(query_string='', tag_cloud_size=tag_cloud_size)
+    assert 'aggregations' not in query
+
+
+def test_tag_aggregation_can_be_shrunk():
+    query = build_query(query_string='', tag_cloud_size=20)
+    assert query['aggregations']['tags']['terms']['size'] == 20
+
+
+def test_repeated_queries_get_independent_dicts():
+    query1 = build_query(query_string='tags:fish chips')
+    query1['query']['bool']['filter'].append({'term': {'tags.raw': 'peas'}})
+    query1['sort'] = 'mangled'
+
+    query2 = build_query(query_string='tags:fish chips')
+    assert query2['query']['bool']['filter'] == [
+        {'term': {'tags.raw': 'fish'}}
+    ]
+    assert 'sort' not in query2
@@ -0,0 +1,10 @@
+# -*- encoding: utf-8
+
+from pincushion.services import http
+
+
+def test_pooled_session_sizes_adapters():
+    sess = http.pooled_session(pool_size=7)
+    for prefix in ('http://', 'https://'):
+        adapter = sess.get_adapter(prefix + 'example.org')
+        assert adapter._pool_maxsize == 7
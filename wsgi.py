@@ -0,0 +1,10 @@
+# -*- encoding: utf-8
+"""
+The viewer as a WSGI app, configured from environment variables.
+See ``pincushion.flask.app.config_from_env``.
+"""
+
+from pincushion.flask.app import create_app
+
+
+app = create_app()